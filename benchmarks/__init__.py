@@ -0,0 +1,60 @@
+"""Microbenchmarks for the hot paths of the controller.
+
+Run all benchmarks and compare them to the stored baseline:
+
+    python3 -m benchmarks
+
+A benchmark is a setup function registered with @benchmark. It prepares everything it
+needs and returns a callable that executes a single iteration, which is then timed.
+
+The scaling of the whole controller is measured separately, see benchmarks.scale."""
+import timeit
+from typing import Callable, Any, Awaitable, NamedTuple
+
+__all__ = ['benchmark', 'BENCHMARKS', 'Result', 'measure', 'run_async']
+
+Setup = Callable[[], Callable[[], Any]]
+
+BENCHMARKS: dict[str, Setup] = {}
+
+
+def benchmark(name: str = None) -> Callable[[Setup], Setup]:
+    def decorator(setup: Setup) -> Setup:
+        BENCHMARKS[name or setup.__name__] = setup
+        return setup
+
+    return decorator
+
+
+class Result(NamedTuple):
+    name: str
+    # best time of a single iteration (s)
+    seconds: float
+    iterations: int
+
+
+def measure(name: str, setup: Setup, repeat: int = 5, min_time: float = 0.2) -> Result:
+    timer = timeit.Timer(setup())
+    number, _ = timer.autorange()
+    # autorange aims for 0.2s, scale up when a longer run per repetition was requested
+    number = max(number, int(number * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return Result(name, best / number, number * repeat)
+
+
+def run_async(factory: Callable[[], Awaitable]) -> Callable[[], Any]:
+    """Turns a coroutine function into a callable that runs it to completion.
+
+       The coroutine is driven directly instead of by an event loop, which would dominate
+       the measurement, so it must not actually suspend (i.e. only await fakes)."""
+
+    def run():
+        coroutine = factory()
+        try:
+            coroutine.send(None)
+        except StopIteration as e:
+            return e.value
+        coroutine.close()
+        raise RuntimeError("Benchmarked coroutine must not suspend")
+
+    return run
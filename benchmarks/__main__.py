@@ -0,0 +1,86 @@
+"""Runs the benchmarks and compares them to the stored baseline.
+
+Fails if any benchmark got slower than its baseline by more than the threshold. Baselines
+depend on the machine, so record them with --save before starting to optimize."""
+import json
+import sys
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from fnmatch import fnmatch
+from pathlib import Path
+
+from . import BENCHMARKS, measure
+from . import bench_algorithms, bench_sensors, bench_table, bench_telemetry  # noqa: F401 (registers the benchmarks)
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+
+def parse():
+    parser = ArgumentParser(prog='python3 -m benchmarks', description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('patterns', nargs='*', metavar='PATTERN',
+                        help="Only run benchmarks matching one of these patterns (e.g. 'value[*')")
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE,
+                        help="Baseline file (defaults to benchmarks/baseline.json)")
+    parser.add_argument('--save', action='store_true',
+                        help="Store the results as the new baseline instead of comparing")
+    parser.add_argument('--threshold', type=float, default=25.0,
+                        help="Allowed slowdown compared to the baseline in percent (default 25)")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetitions per benchmark, the best one counts")
+    parser.add_argument('--retries', type=int, default=2,
+                        help="How often to measure a regressed benchmark again before failing (default 2)")
+    parser.add_argument('--list', action='store_true', help="Only list the available benchmarks")
+    return parser.parse_args()
+
+
+def format_time(seconds: float) -> str:
+    for unit, factor in (('s', 1), ('ms', 1e3), ('µs', 1e6)):
+        if seconds * factor >= 1:
+            return f"{seconds * factor:.2f}{unit}"
+    return f"{seconds * 1e9:.0f}ns"
+
+
+def main():
+    args = parse()
+    names = [name for name in BENCHMARKS if not args.patterns or any(fnmatch(name, p) for p in args.patterns)]
+    if args.list:
+        print('\n'.join(names))
+        return
+    if not names:
+        print("No benchmarks match", file=sys.stderr)
+        sys.exit(2)
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = []
+    results = {}
+    width = max(map(len, names))
+    print(f"{'Benchmark':<{width}} | {'Time':>9} | {'Baseline':>9} | {'Change':>7}")
+    for name in names:
+        reference = baseline.get(name)
+        seconds = measure(name, BENCHMARKS[name], repeat=args.repeat).seconds
+        # short benchmarks are noisy, so confirm a regression before reporting it
+        for _ in range(args.retries):
+            if args.save or not reference or (seconds / reference - 1) * 100 <= args.threshold:
+                break
+            seconds = min(seconds, measure(name, BENCHMARKS[name], repeat=args.repeat).seconds)
+        results[name] = seconds
+        if reference:
+            change = (seconds / reference - 1) * 100
+            if change > args.threshold:
+                regressions.append(name)
+            comparison = f"{format_time(reference):>9} | {change:>+6.1f}%"
+        else:
+            comparison = f"{'-':>9} | {'-':>7}"
+        print(f"{name:<{width}} | {format_time(seconds):>9} | {comparison}", flush=True)
+
+    if args.save:
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(dict(sorted(baseline.items())), indent=2) + '\n')
+        print(f"\nSaved baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:g}%: "
+              f"{', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
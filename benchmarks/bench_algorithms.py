@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from spinpid.application.spinpid import algorithm_parser
+from spinpid.controller import PubSubValue, FanAlgorithm, FanController, Sensor
+from spinpid.controller.algorithm import AlgorithmContext, Static
+from spinpid.controller.values import LastKnownValues
+from spinpid.interfaces.sensor import Temperature, TemperatureSensor
+from . import benchmark, run_async
+
+SENSORS = ['CPU', 'HDDs', 'NVMe']
+FANS = ['CPU', 'Peripheral']
+
+ALGORITHMS = {
+    'Static': "Static(60)",
+    'SensorValue': "sensors.HDDs",
+    'FanDutyValue': "fans.CPU",
+    'Sum': "fans.CPU + 10",
+    'Product': "sensors.HDDs * 2",
+    'Linear': "Linear(sensors.CPU, 40, 80)",
+    'Quadratic': "Quadratic(sensors.CPU, 40, 80)",
+    'LinearDecrease': "LinearDecrease(Linear(sensors.NVMe, 45, 70))",
+    'PID': "PID(sensors[HDDs], 40, p=4, i=0.1, d=40)",
+}
+
+
+def known_values() -> LastKnownValues:
+    last_known_values = LastKnownValues(SENSORS, FANS)
+    for sensor in SENSORS:
+        last_known_values.set_sensor_temperature(sensor, Temperature(52.5, sensor))
+    for fan in FANS:
+        last_known_values.set_fan_duty(fan, 60)
+    return last_known_values
+
+
+PARSE_ALGORITHM = "Linear(sensors.CPU, 40, 80) + LinearDecrease(PID(sensors[HDDs], 40, p=4, i=0.1, d=40)) * 0.5"
+
+
+@benchmark('parse')
+def parse():
+    last_known_values = known_values()
+    context = AlgorithmContext(min_duty=15, max_duty=100)
+
+    def run():
+        algorithm_parser.code_cache.clear()
+        return algorithm_parser.parse(PARSE_ALGORITHM, context, last_known_values)
+    return run
+
+
+@benchmark('parse[compiled]')
+def parse_compiled():
+    last_known_values = known_values()
+    context = AlgorithmContext(min_duty=15, max_duty=100)
+    return lambda: algorithm_parser.parse(PARSE_ALGORITHM, context, last_known_values)
+
+
+@benchmark('parse[compiled, 600 sensors and fans]')
+def parse_many_names():
+    last_known_values = LastKnownValues(SENSORS + [f"disk{i}" for i in range(400)],
+                                        FANS + [f"fan{i}" for i in range(200)])
+    context = AlgorithmContext(min_duty=15, max_duty=100)
+    return lambda: algorithm_parser.parse(PARSE_ALGORITHM, context, last_known_values)
+
+
+def value_benchmark(name: str, algorithm: str):
+    @benchmark(f'value[{name}]')
+    def value():
+        context = AlgorithmContext(min_duty=15, max_duty=100)
+        context.last_duty = 60
+        return algorithm_parser.parse(algorithm, context, known_values()).value
+
+
+for name, algorithm in ALGORITHMS.items():
+    value_benchmark(name, algorithm)
+
+
+@benchmark('pubsub[1000]')
+def pubsub():
+    # one sensor feeding 100 algorithms, each feeding 10 more: 1111 values in total
+    root = PubSubValue('root')
+    for i in range(100):
+        child = PubSubValue(f'child{i}')
+        root.subscribe(child)
+        for j in range(10):
+            child.subscribe(PubSubValue(f'leaf{i}.{j}'))
+    return root.publish_value_update
+
+
+@benchmark('fan.calculate_duty')
+def calculate_duty():
+    # every algorithm is evaluated, so this includes FanAlgorithm and its logging
+    last_known_values = known_values()
+    context = AlgorithmContext(min_duty=15, max_duty=100)
+    context.last_duty = 60
+    algorithms = frozenset(
+        FanAlgorithm(name, 'CPU', algorithm_parser.parse(algorithm, context, last_known_values))
+        for name, algorithm in ALGORITHMS.items() if name in ('Linear', 'Quadratic', 'Sum')
+    )
+    return FanController('CPU', None, algorithms, context, last_known_values).calculate_duty
+
+
+@benchmark('sensor.update')
+def sensor_update():
+    class Fixed(TemperatureSensor):
+        async def get_temperature(self):
+            return Temperature(42.0, 'CPU')
+
+    sensor = Sensor('CPU', Fixed(), known_values(), interval=timedelta(seconds=1), show_single_values=False)
+    for i in range(10):
+        sensor.subscribe(FanAlgorithm(f'a{i}', 'CPU', Static(50)))
+    return run_async(sensor.update)
+
+
+@benchmark('fan_algorithm.value')
+def fan_algorithm_value():
+    context = AlgorithmContext(min_duty=15, max_duty=100)
+    algorithm = FanAlgorithm('Linear', 'CPU', algorithm_parser.parse(ALGORITHMS['Linear'], context, known_values()))
+    algorithm.subscribe(PubSubValue('CPU'))
+
+    def value():
+        # one updated and one cached value
+        algorithm.needs_update = True
+        algorithm.value()
+        return algorithm.value()
+
+    return value
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+from spinpid.interfaces.ipmi.ipmitool import IPMITool
+from spinpid.interfaces.sensor import Temperature, TemperaturesSource, MaxTemperatureSensor, MeanTemperatureSensor
+from . import benchmark, run_async
+
+DATA = Path(__file__).parent / 'data'
+
+
+class RecordedCommand:
+    """Stands in for ipmitool, always answering with the same recorded output"""
+
+    def __init__(self, output: str) -> None:
+        self.output = output
+
+    async def run_and_read(self, *args: str) -> str:
+        return self.output
+
+
+class Disks(TemperaturesSource):
+    def __init__(self, count: int) -> None:
+        self.temperatures = [Temperature(30 + i % 15, f"da{i}") for i in range(count)]
+
+    async def get_all_temperatures(self):
+        return iter(self.temperatures)
+
+
+@benchmark('ipmitool.sdr[200]')
+def sdr():
+    ipmitool = IPMITool()
+    ipmitool.ipmitool = RecordedCommand((DATA / 'sdr_elist.txt').read_text())
+
+    async def parse():
+        return list(await ipmitool._sdr('elist'))
+
+    return run_async(parse)
+
+
+@benchmark('sensor.max[100]')
+def max_sensor():
+    return run_async(MaxTemperatureSensor(Disks(100), "HDDs").get_temperature)
+
+
+@benchmark('sensor.mean[100]')
+def mean_sensor():
+    return run_async(MeanTemperatureSensor(Disks(100)).get_temperature)
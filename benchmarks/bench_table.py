@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from spinpid.controller import Sensor, SUMMARY
+from spinpid.controller.values import LastKnownValues
+from spinpid.interfaces.sensor import AggregatedTemperature, Temperature
+from spinpid.util.table import TablePrinter, Value
+from . import benchmark
+
+
+class NullOutput:
+    def write(self, s: str) -> int:
+        return len(s)
+
+    def flush(self) -> None:
+        pass
+
+
+@benchmark('table.print_values[wide]')
+def print_values():
+    # 3 sensors with 36 disks in total, plus 6 fans
+    printer = TablePrinter(out=NullOutput(), redraw_header_after=20)
+    row = [
+        ('CPU', [('CPU', Value(45.0, stale=False))]),
+        ('HDDs', [('⌀', Value(36.2, stale=False))] + [(f'da{i}', Value(30.0 + i % 9, stale=i % 3 == 0))
+                                                     for i in range(24)]),
+        ('SSDs', [('Max SSDs', Value(41.0, stale=True))] + [(f'nvd{i}', Value(35.0 + i, stale=True))
+                                                           for i in range(12)]),
+        ('Fans', [(f'FAN{i}', Value(f'{40 + i}%', stale=False)) for i in range(6)]),
+    ]
+    return lambda: printer.print_values(row)
+
+
+
+def disk_shelf_sensor(disks: int, show_single_values) -> Sensor:
+    temps = [Temperature(30.0 + i % 9, f'da{i}') for i in range(disks)]
+    known_values = LastKnownValues(sensor_names=['HDDs'], fan_names=[])
+    known_values.set_sensor_temperature('HDDs', AggregatedTemperature(sum(temps) / disks, '⌀', temps))
+    return Sensor('HDDs', None, known_values, interval=timedelta(seconds=30), show_single_values=show_single_values)
+
+
+def register_disk_shelf(disks: int, show_single_values, mode: str) -> None:
+    @benchmark(f'table.print_values[{disks} disks, {mode}]')
+    def print_disk_shelf():
+        printer = TablePrinter(out=NullOutput(), redraw_header_after=20)
+        sensor = disk_shelf_sensor(disks, show_single_values)
+        return lambda: printer.print_values([('HDDs', sensor.get_log_state())])
+
+
+for _disks in (12, 36, 96):
+    register_disk_shelf(_disks, True, 'single values')
+    register_disk_shelf(_disks, SUMMARY, 'summary')
@@ -0,0 +1,46 @@
+import json
+
+from spinpid.application.spinpid import algorithm_parser
+from spinpid.controller.config import build_controller
+from spinpid.controller.telemetry import JsonLinesEncoder
+from spinpid.interfaces.sensor import AggregatedTemperature, Temperature
+from . import benchmark
+from .scale import synthetic_config, FakeInterface, FAKE_INTERFACE
+
+
+def telemetry_controller(sensors: int, fans: int):
+    """A controller with last known values for all sensors (4 single values each) and fans"""
+    controller = build_controller(synthetic_config(sensors, fans, algorithms=2, interval=1), algorithm_parser,
+                                  interfaces={FAKE_INTERFACE: FakeInterface()})
+    for i, sensor_id in enumerate(controller.sensors):
+        temps = [Temperature(30.0 + (i + j) % 15, f"{sensor_id}.{j}") for j in range(4)]
+        controller.last_known_values.set_sensor_temperature(
+            sensor_id, AggregatedTemperature(sum(temps) / len(temps), '⌀', temps))
+    for group in controller.fans_ordered:
+        for fan in group:
+            controller.last_known_values.set_fan_duty(fan.name, fan.calculate_duty())
+    return controller
+
+
+@benchmark('telemetry.jsonl[200 sensors, 50 fans]')
+def jsonl():
+    encoder = JsonLinesEncoder(telemetry_controller(200, 50))
+    return lambda: encoder.encode(encoder.snapshot())
+
+
+@benchmark('telemetry.jsonl[200 sensors, 50 fans, all updated]')
+def jsonl_updated():
+    encoder = JsonLinesEncoder(telemetry_controller(200, 50))
+
+    def run():
+        # as if every sensor had a new value
+        encoder._layout.sensor_cache = [None] * len(encoder._layout.sensors)
+        return encoder.encode(encoder.snapshot())
+    return run
+
+
+@benchmark('telemetry.json_dumps[200 sensors, 50 fans]')
+def json_dumps():
+    # reference: building the state as dicts and serializing it with json.dumps
+    controller = telemetry_controller(200, 50)
+    return lambda: json.dumps(controller.get_state(), separators=(',', ':'), ensure_ascii=False)
@@ -0,0 +1,227 @@
+"""End-to-end scale benchmark of the controller.
+
+Builds synthetic configurations with N sensors, N * fan ratio fans and K algorithms per
+fan, runs Controller.run against in-memory fake interfaces and reports cycles per second,
+cycle latency, event loop lag and memory growth for each N:
+
+    python3 -m benchmarks.scale --sizes 10,100,1000,10000 --output scale.json
+
+Fans reference the duty of other fans (fan i references fan i // 2), so the fans are
+updated in log2(fans) groups. Each size runs in a fresh process."""
+import asyncio
+import json
+import logging
+import math
+import platform
+import statistics
+import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from spinpid import VERSION
+from spinpid.application.spinpid import algorithm_parser
+from spinpid.config import Config, SensorConfig, FanConfig
+from spinpid.controller.config import build_controller
+from spinpid.interfaces import SensorInterface, FanInterface, TemperatureSensor
+from spinpid.interfaces.fan import SingleFanZone
+from spinpid.interfaces.sensor import Temperature
+from spinpid.metrics.memory import rss
+
+FAKE_INTERFACE = 'fake'
+
+
+class FakeSensor(TemperatureSensor):
+    def __init__(self, name: str, phase: float) -> None:
+        self.name = name
+        self.phase = phase
+
+    async def get_temperature(self) -> Temperature:
+        # slowly varying, so that algorithms actually have to be recalculated
+        return Temperature(round(40 + 8 * math.sin(time.monotonic() / 30 + self.phase), 1), self.name)
+
+
+class FakeFanZone(SingleFanZone):
+    def __init__(self, name: str) -> None:
+        super().__init__(name=name)
+        self.rpm = 0
+        self.duty = 50
+
+    async def get_duty(self) -> int:
+        return self.duty
+
+    async def _do_set_duty(self, duty: int) -> None:
+        self.duty = duty
+        self.rpm = duty * 15
+
+
+class FakeInterface(SensorInterface, FanInterface):
+    def get_sensor(self, channel: str, **kwargs) -> TemperatureSensor:
+        return FakeSensor(channel, phase=hash(channel) % 628 / 100)
+
+    def get_fan_zone(self, channel: str, **kwargs) -> FakeFanZone:
+        return FakeFanZone(channel)
+
+
+def synthetic_config(sensors: int, fans: int, algorithms: int, interval: float) -> Config:
+    sensor_ids = [f"s{i}" for i in range(sensors)]
+    fan_ids = [f"f{i}" for i in range(fans)]
+
+    def fan_algorithms(i: int) -> dict[str, str]:
+        templates = [
+            lambda s: f"PID(sensors[{s}], 40, p=4, i=0.1, d=40)",
+            lambda s: f"Linear(sensors.{s}, 35, 50)",
+            lambda s: f"LinearDecrease(Quadratic(sensors.{s}, 35, 50))",
+        ]
+        result = {}
+        for k in range(algorithms):
+            if k == algorithms - 1 and i > 0:
+                result[f"a{k}"] = f"fans.{fan_ids[i // 2]} - 10"
+            else:
+                result[f"a{k}"] = templates[k % len(templates)](sensor_ids[(i * algorithms + k) % sensors])
+        return result
+
+    return Config(
+        # never imported, measure() passes the interfaces
+        interfaces={FAKE_INTERFACE: {'driver': 'benchmarks.scale.FakeInterface'}},
+        sensors={
+            sensor_id: SensorConfig(interface={'id': FAKE_INTERFACE, 'channel': sensor_id},
+                                    interval=timedelta(seconds=interval))
+            for sensor_id in sensor_ids
+        },
+        fans={
+            fan_id: FanConfig(interface={'id': FAKE_INTERFACE, 'channel': fan_id},
+                              algorithms=fan_algorithms(i), min_duty=15, max_duty=100)
+            for i, fan_id in enumerate(fan_ids)
+        },
+    )
+
+
+def percentile(values: list[float], p: int) -> Optional[float]:
+    if len(values) < 2:
+        return values[0] if values else None
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+async def measure(sensors: int, fans: int, algorithms: int, interval: float, duration: float) -> dict:
+    rss_start = rss()
+    started = time.perf_counter()
+    controller = build_controller(synthetic_config(sensors, fans, algorithms, interval), algorithm_parser,
+                                  interfaces={FAKE_INTERFACE: FakeInterface()})
+    await controller.setup()
+    build_seconds = time.perf_counter() - started
+    rss_built = rss()
+
+    cycle_latencies = []
+    update_fans = controller.update_fans
+
+    async def timed_update_fans():
+        cycle_started = time.perf_counter()
+        await update_fans()
+        cycle_latencies.append(time.perf_counter() - cycle_started)
+
+    controller.update_fans = timed_update_fans
+
+    lags = []
+
+    async def monitor_lag():
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + 0.05
+            await asyncio.sleep(0.05)
+            lags.append(max(loop.time() - expected, 0.0))
+
+    async def stop():
+        await asyncio.sleep(duration)
+        controller.stop()
+
+    monitor = asyncio.create_task(monitor_lag())
+    stopper = asyncio.create_task(stop())
+    run_started = time.perf_counter()
+    try:
+        await controller.run()
+    finally:
+        elapsed = time.perf_counter() - run_started
+        monitor.cancel()
+        stopper.cancel()
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in others:
+            task.cancel()
+        await asyncio.gather(*others, return_exceptions=True)
+
+    rss_end = rss()
+    return {
+        'sensors': sensors,
+        'fans': fans,
+        'algorithms_per_fan': algorithms,
+        'fan_groups': len(controller.fans_ordered),
+        'build_seconds': round(build_seconds, 4),
+        'cycles': len(cycle_latencies),
+        'cycles_per_second': round(len(cycle_latencies) / elapsed, 3),
+        'cycle_p50_ms': round(percentile(cycle_latencies, 50) * 1000, 3) if cycle_latencies else None,
+        'cycle_p99_ms': round(percentile(cycle_latencies, 99) * 1000, 3) if cycle_latencies else None,
+        'lag_p50_ms': round(percentile(lags, 50) * 1000, 3) if lags else None,
+        'lag_p99_ms': round(percentile(lags, 99) * 1000, 3) if lags else None,
+        'lag_max_ms': round(max(lags) * 1000, 3) if lags else None,
+        'rss_start_mib': round(rss_start / 2 ** 20, 1),
+        'rss_built_mib': round(rss_built / 2 ** 20, 1),
+        'rss_end_mib': round(rss_end / 2 ** 20, 1),
+        'rss_growth_mib': round((rss_end - rss_start) / 2 ** 20, 1),
+    }
+
+
+def run_size(sensors: int, fans: int, algorithms: int, interval: float, duration: float) -> dict:
+    logging.getLogger('spinpid').setLevel(logging.WARN)
+    return asyncio.run(measure(sensors, fans, algorithms, interval, duration))
+
+
+def parse():
+    parser = ArgumentParser(prog='python3 -m benchmarks.scale', description=__doc__,
+                            formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000,10000', type=lambda s: [int(n) for n in s.split(',')],
+                        help="Numbers of sensors to benchmark (default 10,100,1000,10000)")
+    parser.add_argument('--fan-ratio', type=float, default=0.25,
+                        help="Number of fans per sensor (default 0.25)")
+    parser.add_argument('--algorithms', '-k', type=int, default=3, help="Algorithms per fan (default 3)")
+    parser.add_argument('--interval', type=float, default=1.0, help="Sensor interval in seconds (default 1)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds to run each size (default 10)")
+    parser.add_argument('--output', '-o', help="Write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse()
+    results = []
+    print(f"{'Sensors':>7} | {'Fans':>5} | {'Build':>7} | {'Cycles/s':>8} | {'p50':>9} | {'p99':>9} | "
+          f"{'Lag p99':>9} | {'RSS growth':>10}")
+    for size in args.sizes:
+        fans = max(1, int(size * args.fan_ratio))
+        # a fresh process per size, so memory and caches of one run don't affect the next one
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_size, size, fans, args.algorithms, args.interval, args.duration).result()
+        results.append(result)
+
+        def ms(value):
+            return f"{value:.2f}ms" if value is not None else 'N/A'
+
+        print(f"{size:>7} | {fans:>5} | {result['build_seconds']:>6.2f}s | {result['cycles_per_second']:>8.2f} | "
+              f"{ms(result['cycle_p50_ms']):>9} | {ms(result['cycle_p99_ms']):>9} | {ms(result['lag_p99_ms']):>9} | "
+              f"{result['rss_growth_mib']:>7.1f}MiB", flush=True)
+
+    if args.output:
+        report = {
+            'spinpid_version': VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': datetime.now().astimezone().isoformat(),
+            'parameters': {key: getattr(args, key) for key in ('fan_ratio', 'algorithms', 'interval', 'duration')},
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,18 @@
 #!/bin/sh
 
+case "$1" in
+    replay)
+        shift
+        exec python3 -m spinpid.application.replay "$@"
+        ;;
+    tune)
+        shift
+        exec python3 -m spinpid.application.tune "$@"
+        ;;
+    ctl)
+        shift
+        exec python3 -m spinpid.application.ctl "$@"
+        ;;
+esac
+
 exec python3 -m spinpid.application.spinpid "$@"
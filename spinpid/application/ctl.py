@@ -0,0 +1,77 @@
+"""Controls a running spinpid through its control socket (see --control-socket).
+
+    spinpid ctl state
+    spinpid ctl override CPU 100 --ttl 600
+    spinpid ctl pin HDDs 50 --ttl 60
+    spinpid ctl pause"""
+import json
+import socket
+import sys
+from argparse import RawDescriptionHelpFormatter
+from typing import Any
+
+from spinpid.control import DEFAULT_SOCKET
+from spinpid.util.argparse import ArgumentParser
+
+
+def parse():
+    parser = ArgumentParser(prog='spinpid ctl', description=__doc__, formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', '-s', action='store', default=DEFAULT_SOCKET,
+                        help=f"Control socket of the running spinpid (defaults to {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+
+    commands.add_parser('state', help="Print the last known values, overrides and pinned sensors")
+
+    override = commands.add_parser('override', help="Set the duty of a fan, ignoring its algorithms")
+    override.add_argument('fan')
+    override.add_argument('duty', type=int)
+    override.add_argument('--ttl', type=float, default=600,
+                          help="Seconds until the override expires (defaults to 600, 0 never expires)")
+
+    clear_override = commands.add_parser('clear-override', help="Let the algorithms control the fan again")
+    clear_override.add_argument('fan')
+
+    pin = commands.add_parser('pin', help="Use a fixed temperature instead of reading a sensor")
+    pin.add_argument('sensor')
+    pin.add_argument('temperature', type=float)
+    pin.add_argument('--ttl', type=float, default=600,
+                     help="Seconds until the pinned temperature expires (defaults to 600, 0 never expires)")
+
+    unpin = commands.add_parser('unpin', help="Read the sensor again, starting with its next update")
+    unpin.add_argument('sensor')
+
+    commands.add_parser('pause', help="Keep all fans at their current duty (overrides still apply)")
+    commands.add_parser('resume', help="Let the algorithms control the fans again")
+    return parser.parse_args()
+
+
+def request(path: str, **arguments: Any) -> Any:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(arguments).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            response = json.loads(f.readline())
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    return response['result']
+
+
+def main():
+    args = parse()
+    arguments = {key: value for key, value in vars(args).items() if key != 'socket'}
+    if arguments.get('ttl') == 0:
+        arguments['ttl'] = None
+    try:
+        result = request(args.socket, **arguments)
+    except OSError as e:
+        sys.stderr.write(f"Could not connect to {args.socket}: {e}\n")
+        sys.exit(2)
+    except RuntimeError as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
+    if result is not None:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
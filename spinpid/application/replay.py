@@ -0,0 +1,198 @@
+"""Replays recorded traces through the controller, faster than real time.
+
+Sensor values are taken from the trace, fan duties are computed by the configured
+algorithms, all on a virtual clock. This allows to evaluate configuration changes
+against recorded history before rolling them out."""
+import asyncio
+import logging
+import sys
+import time
+from argparse import FileType
+from asyncio import sleep, CancelledError
+from typing import Optional, Sequence
+
+from pydantic import ValidationError
+
+from spinpid.application.spinpid import algorithm_parser, configureLogging
+from spinpid.config import load_config, Config
+from spinpid.controller import Controller
+from spinpid.controller.config import build_controller
+from spinpid.interfaces.replay import Replay
+from spinpid.trace import SENSOR, DUTY
+from spinpid.trace.reader import load_series, Series
+from spinpid.trace.recorder import TraceRecorder
+from spinpid.trace.store import load_store_series
+from spinpid.trace.writer import TraceWriter
+from spinpid.util.argparse import ArgumentParser
+from spinpid.util.asyncio import VirtualTimeEventLoop
+
+logger = logging.getLogger(__name__)
+
+REPLAY_INTERFACE = 'replay'
+
+
+def parse():
+    parser = ArgumentParser(prog='spinpid replay', description=__doc__)
+    parser.add_argument('traces', nargs='*', metavar='TRACE',
+                        help="Trace files to replay (e.g. spinpid.trc spinpid.trc.1)")
+    parser.add_argument('--store', action='store', metavar='FILE',
+                        help="Load the history from a database written with --store instead of trace files")
+    parser.add_argument('--last', action='store', type=float, metavar='HOURS',
+                        help="Only load the last HOURS of the history in --store")
+    parser.add_argument('--config', '-c', action='store', type=FileType('r', encoding='UTF-8'), default='spinpid.yaml',
+                        help="Configuration file to evaluate (defaults to spinpid.yaml)")
+    parser.add_argument('--skip', action='store', type=float, default=0,
+                        help="Skip this many seconds at the start of the trace")
+    parser.add_argument('--duration', action='store', type=float, default=None,
+                        help="Only replay this many seconds of the trace")
+    parser.add_argument('--record', action='store', metavar='FILE',
+                        help="Record the replayed run into a new trace file")
+    parser.add_argument('--verbose', '-v', action='count', dest='verbosity', default=0,
+                        help="Increase verbosity (can be passed multiple times)")
+    args = parser.parse_args()
+    if bool(args.traces) == bool(args.store):
+        parser.error("either trace files or --store are required")
+    return args
+
+
+def replay_config(config: Config) -> Config:
+    """Points all sensors and fans of the configuration to the replay interface"""
+    return config.model_copy(update={
+        'sensors': {
+            sensor_id: sensor.model_copy(update={'interface': {'id': REPLAY_INTERFACE, 'sensor': sensor_id}})
+            for sensor_id, sensor in config.sensors.items()
+        },
+        'fans': {
+            fan_id: fan.model_copy(update={'interface': {'id': REPLAY_INTERFACE, 'fan': fan_id}})
+            for fan_id, fan in config.fans.items()
+        },
+    })
+
+
+def time_weighted_mean(changes: Sequence[tuple[float, float]], end: float) -> Optional[float]:
+    """Mean of a step function given by its changes, from its first change to end"""
+    if not changes:
+        return None
+    total = 0.0
+    for (t, value), (next_t, _) in zip(changes, (*changes[1:], (end, None))):
+        total += value * max(min(next_t, end) - t, 0)
+    span = end - changes[0][0]
+    return total / span if span > 0 else changes[-1][1]
+
+
+def format_optional(value: Optional[float], suffix: str = '') -> str:
+    return 'N/A' if value is None else f"{value:.1f}{suffix}"
+
+
+class ReplayRun:
+    def __init__(self, config: Config, series: dict, skip: float = 0, duration: Optional[float] = None,
+                 record: Optional[str] = None) -> None:
+        sensor_times = [s.times for (kind, _, _), s in series.items() if kind == SENSOR and s.times]
+        if not sensor_times:
+            raise ValueError("Trace does not contain any sensor values")
+        first = min(times[0] for times in sensor_times)
+        last = max(times[-1] for times in sensor_times)
+
+        self.start_time = first + skip
+        self.duration = last - self.start_time if duration is None else min(duration, last - self.start_time)
+        if self.duration <= 0:
+            raise ValueError("Nothing left to replay")
+        self.series = series
+
+        self.interface = Replay(series, start_time=self.start_time)
+        self.controller: Controller = build_controller(replay_config(config), algorithm_parser,
+                                                       interfaces={REPLAY_INTERFACE: self.interface})
+        self.recorder = None
+        if record:
+            self.recorder = TraceRecorder(TraceWriter(record, clock_offset=self.start_time))
+
+    async def run_async(self) -> None:
+        controller = self.controller
+
+        async def stop_controller():
+            await sleep(self.duration)
+            controller.stop()
+
+        async def callback(controller):
+            self.recorder.record(controller)
+
+        stopper = asyncio.create_task(stop_controller(), name="Stop replay")
+        try:
+            await controller.setup()
+            await controller.run(callback if self.recorder is not None else None)
+        finally:
+            stopper.cancel()
+            # sensor tasks keep running until they are cancelled
+            others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in others:
+                task.cancel()
+            await asyncio.gather(*others, return_exceptions=True)
+            if self.recorder is not None:
+                self.recorder.writer.close()
+
+    def run(self) -> None:
+        loop = VirtualTimeEventLoop()
+        try:
+            loop.run_until_complete(self.run_async())
+        except CancelledError:
+            pass
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def recorded_duty_changes(self, fan_id: str) -> list[tuple[float, float]]:
+        recorded: Optional[Series] = self.series.get((DUTY, fan_id, None))
+        if recorded is None:
+            return []
+        changes, last = [], None
+        for t, duty in zip(recorded.times, recorded.values):
+            t -= self.start_time
+            if t > self.duration:
+                break
+            if t < 0:
+                # the last duty before the replay started is the initial state
+                changes, last = [(0.0, duty)], duty
+            elif duty != last:
+                changes.append((t, duty))
+                last = duty
+        return changes
+
+    def print_summary(self, out=sys.stdout) -> None:
+        header = f"{'Fan':<16} | {'Recorded changes':>16} | {'Replayed changes':>16} | {'Recorded mean':>13} | {'Replayed mean':>13}"
+        print(header, file=out)
+        print('-' * len(header), file=out)
+        for fan_id, zone in self.interface.fan_zones.items():
+            recorded = self.recorded_duty_changes(fan_id)
+            replayed = zone.duty_changes
+            print(f"{fan_id:<16} | {max(len(recorded) - 1, 0):>16} | {max(len(replayed) - 1, 0):>16} | "
+                  f"{format_optional(time_weighted_mean(recorded, self.duration), '%'):>13} | "
+                  f"{format_optional(time_weighted_mean(replayed, self.duration), '%'):>13}", file=out)
+
+
+def main():
+    args = parse()
+    configureLogging(args.verbosity)
+    try:
+        config = load_config(args.config)
+    except ValidationError as e:
+        sys.stderr.write(f"Error in configuration file {args.config.name}:\n\n{e}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    if args.store:
+        series = load_store_series(args.store, kinds=(SENSOR, DUTY),
+                                   last=args.last * 3600 if args.last is not None else None)
+    else:
+        series = load_series(args.traces, kinds=(SENSOR, DUTY))
+    loaded = time.perf_counter()
+    replay = ReplayRun(config, series, skip=args.skip, duration=args.duration, record=args.record)
+    replay.run()
+    finished = time.perf_counter()
+
+    print(f"Replayed {replay.duration / 3600:.1f} hours in {finished - loaded:.1f}s "
+          f"({replay.duration / max(finished - loaded, 1e-9):.0f}x real time, loading took {loaded - started:.1f}s)")
+    replay.print_summary()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,35 @@
+import time
+# before the other imports, so that the startup timing includes them
+STARTED = time.perf_counter()
+
 import asyncio
 import logging
 import signal
 import sys
 from argparse import RawDescriptionHelpFormatter, FileType
 from asyncio import sleep, CancelledError
-from concurrent.futures import FIRST_EXCEPTION
+from concurrent.futures import FIRST_COMPLETED
+from typing import Optional
 
+import yaml
 from pydantic import ValidationError
 
-from spinpid.config import load_config, Config
+from spinpid.config import load_config, parse_config, Config
+from spinpid.config.cache import ConfigCache
 from spinpid.controller.algorithm.parser import AlgorithmParser
 from spinpid.controller.algorithm.pid import PID
-from spinpid.controller.config import build_controller
+from spinpid.control import DEFAULT_SOCKET
+from spinpid.controller import DEFAULT_RPM_INTERVAL
+from spinpid.controller.checkpoint import Checkpoint, DEFAULT_MAX_AGE
+from spinpid.controller.config import build_controller, reload_controller, ConfigError
+from spinpid.metrics.profiler import Profiler
+from spinpid.metrics.startup import StartupTimer
+from spinpid.trace import DEFAULT_RETENTION, RAW, MINUTE, HOUR
 from spinpid.util.argparse import ArgumentParser
 from spinpid.util.asyncio import raise_exceptions
-from spinpid.util.table import TablePrinter, Value
+from spinpid.util.http import HttpServer, parse_address
+from spinpid.util.sink import BackgroundSink
+from spinpid.util.table import TablePrinter
 
 logger = logging.getLogger(__name__)
 
@@ -29,10 +44,20 @@ def format_available_algorithms():
     yield "\n"
 
 
+def parse_retention(value: str) -> dict[str, float]:
+    days = [float(d) for d in value.split(',')]
+    if len(days) != 3:
+        raise ValueError("Expected the days to keep raw samples, minute and hour rollups, e.g. 3,60,730")
+    return dict(zip((RAW, MINUTE, HOUR), days))
+
+
 def parse():
     parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter, epilog=''.join(format_available_algorithms()))
     parser.add_argument('--config', '-c', action='store', type=FileType('r', encoding='UTF-8'), default='spinpid.yaml',
                         help="Configuration file to use (defaults to spinpid.yaml)")
+    parser.add_argument('--config-cache', action='store', metavar='FILE',
+                        help="Cache the validated configuration and the compiled algorithms in this file, so that "
+                             "restarts with an unchanged configuration skip validating and compiling it")
     parser.add_argument('--print-config', action='store_true',
                         help="Print the loaded configuration and exit")
     parser.add_argument('--dry-run', '-n', action='store_true',
@@ -40,48 +65,317 @@ def parse():
     parser.add_argument('--verbose', '-v', action='count', dest='verbosity', default=0,
                         help="Increase verbosity (can be passed multiple times)")
     parser.add_argument('--log-interval', action='store', type=int, default=60,
-                        help="How often to output the current state (in seconds)")
+                        help="How often to output the current state as a table (in seconds)")
+    parser.add_argument('--rpm-interval', action='store', type=float, default=DEFAULT_RPM_INTERVAL, metavar='SECONDS',
+                        help="How often to read the fan speeds, 0 only reads them for the table output "
+                             "(defaults to %d)" % DEFAULT_RPM_INTERVAL)
     parser.add_argument('--log-file', action='store', type=FileType('w', encoding='UTF-8'), default='-',
                         help="File to log to (defaults to stdout)")
+    parser.add_argument('--output-format', action='store', choices=('table', 'jsonl'), default='table',
+                        help="Output the state as a table every --log-interval seconds, or as one line of JSON "
+                             "per control cycle (defaults to table)")
+    parser.add_argument('--record', action='store', metavar='FILE',
+                        help="Record all sensor values, fan duties and fan speeds into a binary trace file")
+    parser.add_argument('--record-max-size', action='store', type=int, default=64, metavar='MIB',
+                        help="Rotate the trace file once it grows beyond this size (in MiB, defaults to 64)")
+    parser.add_argument('--record-backups', action='store', type=int, default=5,
+                        help="How many rotated trace files to keep, at least 1 (defaults to 5)")
+    parser.add_argument('--store', action='store', metavar='FILE',
+                        help="Keep the history of all sensor values, fan duties and fan speeds in a SQLite database")
+    parser.add_argument('--store-retention', action='store', type=parse_retention, metavar='RAW,MINUTE,HOUR',
+                        default=DEFAULT_RETENTION,
+                        help="How many days to keep the raw samples, the per minute and the per hour rollups "
+                             "(defaults to %s)" % ','.join(str(days) for days in DEFAULT_RETENTION.values()))
+    parser.add_argument('--state-file', action='store', metavar='FILE',
+                        help="Checkpoint the fan duties and the state of the algorithms to this file, and continue "
+                             "from it after a restart")
+    parser.add_argument('--state-interval', action='store', type=float, default=60, metavar='SECONDS',
+                        help="How often to checkpoint the state (defaults to 60)")
+    parser.add_argument('--state-max-age', action='store', type=float, default=DEFAULT_MAX_AGE, metavar='SECONDS',
+                        help="Ignore checkpoints older than this when starting (defaults to %d)" % DEFAULT_MAX_AGE)
+    parser.add_argument('--metrics', action='store', type=parse_address, metavar='[HOST:]PORT',
+                        help="Serve Prometheus metrics on http://HOST:PORT/metrics. HOST defaults to 127.0.0.1, "
+                             "pass e.g. 0.0.0.0 to let a remote Prometheus scrape them")
+    parser.add_argument('--dashboard', action='store', type=parse_address, metavar='[HOST:]PORT',
+                        help="Serve a live dashboard on http://HOST:PORT/ (can share the address with --metrics). "
+                             "HOST defaults to 127.0.0.1, pass e.g. 0.0.0.0 to serve it on all interfaces")
+    parser.add_argument('--control-socket', action='store', nargs='?', const=DEFAULT_SOCKET, metavar='PATH',
+                        help=f"Accept commands of 'spinpid ctl' on this Unix socket (defaults to {DEFAULT_SOCKET})")
+    parser.add_argument('--stats', action='store_true',
+                        help="Record the latency of all operations, dumped to stderr on SIGUSR2")
+    parser.add_argument('--stats-interval', action='store', type=float, metavar='SECONDS',
+                        help="Dump the recorded latencies periodically (implies --stats)")
+    parser.add_argument('--watchdog', action='store_true',
+                        help="Measure the event loop lag and log the stack of whatever blocks the loop")
+    parser.add_argument('--watchdog-interval', action='store', type=int, default=100, metavar='MS',
+                        help="How often to measure the event loop lag (in ms, defaults to 100)")
+    parser.add_argument('--watchdog-threshold', action='store', type=int, default=500, metavar='MS',
+                        help="Lag that counts as the loop being blocked (in ms, defaults to 500)")
+    parser.add_argument('--memory', action='store_true',
+                        help="Track memory allocations, SIGUSR2 then also dumps the growth since the start")
+    parser.add_argument('--memory-interval', action='store', type=float, metavar='SECONDS',
+                        help="Periodically dump the allocation sites that grew the most (implies --memory)")
+    parser.add_argument('--profile-dir', action='store', default='.', metavar='DIR',
+                        help="Where to write profiles, SIGUSR1 starts and stops profiling (defaults to the "
+                             "current directory)")
+    parser.add_argument('--profile-on-start', action='store', type=float, metavar='SECONDS',
+                        help="Profile the first SECONDS after starting")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.record_backups < 1:
+        parser.error("--record-backups must be at least 1, traces are never overwritten")
+    return args
 
 
 class SpinPid:
     """Main application, manages user interaction and handles logging"""
 
-    def __init__(self, args, config: Config):
+    def __init__(self, args, config: Config, startup: Optional[StartupTimer] = None):
+        self.startup = startup
+        self.profiler = Profiler(args.profile_dir)
+        self.profile_on_start = args.profile_on_start
+        if self.profile_on_start:
+            self.profiler.start()
+
         self.dry_run = args.dry_run
         self.verbosity = args.verbosity
         self.log_interval = args.log_interval
-        self.table_printer = TablePrinter(out=args.log_file, redraw_header_after=10)
 
+        self.config = config
+        self.config_path = args.config.name
         self.controller = build_controller(config, algorithm_parser, dry_run=args.dry_run)
+        self.controller.rpm_interval = args.rpm_interval or None
+        self._reload_lock = asyncio.Lock()
+        self._reload_tasks: set[asyncio.Task] = set()
+
+        self.log_file = args.log_file
+        self.jsonl_encoder = None
+        self.table_printer = None
+        if args.output_format == 'jsonl':
+            from spinpid.controller.telemetry import JsonLinesEncoder
+            self.jsonl_encoder = JsonLinesEncoder(self.controller)
+            consume = self.write_jsonl
+        else:
+            self.table_printer = TablePrinter(out=args.log_file, redraw_header_after=10)
+            consume = self.table_printer.print_values
+        # writing to a slow pipe or a full disk must never stall the control loop
+        self.state_sink = BackgroundSink(consume, name="State output")
+
+        # optional features are only imported when they are enabled, to keep the startup fast
+        self.recorders = []
+        if args.record:
+            from spinpid.trace.recorder import TraceRecorder
+            from spinpid.trace.writer import TraceWriter
+            writer = TraceWriter(args.record, max_bytes=args.record_max_size * 1024 * 1024,
+                                 backup_count=args.record_backups)
+            self.recorders.append(TraceRecorder(writer))
+        if args.store:
+            from spinpid.trace.recorder import TraceRecorder
+            from spinpid.trace.store import SampleStore
+            self.recorders.append(TraceRecorder(SampleStore(args.store, retention=args.store_retention)))
+
+        self.checkpoint = None
+        if args.state_file:
+            self.checkpoint = Checkpoint(self.controller, args.state_file, interval=args.state_interval,
+                                         max_age=args.state_max_age)
+
+        self.stats_interval = args.stats_interval
+        self.spans = None
+        if args.stats or args.stats_interval or args.metrics:
+            from spinpid.metrics.spans import SpanRecorder
+            self.spans = SpanRecorder()
+            self.spans.attach(self.controller)
+
+        self.watchdog = None
+        self.watchdog_task = None
+        if args.watchdog:
+            from spinpid.metrics.watchdog import LoopWatchdog
+            self.watchdog = LoopWatchdog(interval=args.watchdog_interval / 1000,
+                                         threshold=args.watchdog_threshold / 1000)
+
+        self.memory_interval = args.memory_interval
+        self.memory_tracker = None
+        if args.memory or args.memory_interval:
+            from spinpid.metrics.memory import MemoryTracker
+            self.memory_tracker = MemoryTracker()
+
+        # endpoints served on the same address share a server
+        self.http_routes: dict[tuple[str, int], dict] = {}
+        self.metrics = None
+        if args.metrics:
+            from spinpid.metrics.prometheus import Metrics
+            self.metrics = Metrics(self.controller, self.spans, self.watchdog)
+            self.http_routes.setdefault(args.metrics, {})['/metrics'] = self.metrics.handle
+        self.dashboard = None
+        if args.dashboard:
+            from spinpid.dashboard import Dashboard
+            self.dashboard = Dashboard(self.controller, store_path=args.store)
+            self.http_routes.setdefault(args.dashboard, {}).update(self.dashboard.routes)
+        self.http_servers: list[HttpServer] = []
+
+        self.control_socket = args.control_socket
+        self.control_server = None
+        if args.control_socket:
+            from spinpid.control.server import ControlServer
+            self.control_server = ControlServer(self.controller)
+
+    def dump_stats(self):
+        if self.spans is None and self.watchdog is None and self.memory_tracker is None:
+            print("No statistics recorded, start with --stats, --watchdog or --memory to record them",
+                  file=sys.stderr)
+            return
+        if self.spans is not None:
+            print('\n'.join(self.spans.format()), file=sys.stderr)
+        if self.watchdog is not None:
+            print(self.watchdog.format(), file=sys.stderr)
+        if self.memory_tracker is not None:
+            print('\n'.join(self.memory_tracker.report(since_start=True)), file=sys.stderr)
+        sys.stderr.flush()
+
+    async def run_memory_report(self):
+        while True:
+            await sleep(self.memory_interval)
+            print('\n'.join(self.memory_tracker.report()), file=sys.stderr, flush=True)
+
+    async def run_dump_stats(self):
+        while True:
+            await sleep(self.stats_interval)
+            self.dump_stats()
+
+    def toggle_profiling(self):
+        if self.profiler.active:
+            self.stop_profiling()
+        else:
+            self.profiler.start()
+            print("Started profiling, send SIGUSR1 again to stop", file=sys.stderr, flush=True)
+
+    def stop_profiling(self):
+        filename = self.profiler.stop()
+        if filename is not None:
+            print(f"Wrote profile to {filename}", file=sys.stderr, flush=True)
+        elif self.profiler.active:
+            print(f"Could not write the profile to {self.profiler.directory}, still profiling, "
+                  "send SIGUSR1 again to retry", file=sys.stderr, flush=True)
+
+    def request_reload(self):
+        task = asyncio.create_task(self.reload(), name="Reload configuration")
+        self._reload_tasks.add(task)
+        task.add_done_callback(self._reload_tasks.discard)
+
+    async def reload(self):
+        """Reloads the configuration file, keeps running with the current one if that fails"""
+        async with self._reload_lock:
+            try:
+                config = load_config(self.config_path)
+            except (OSError, yaml.YAMLError, ValidationError, TypeError) as e:
+                print(f"Not reloading, error in configuration file {self.config_path}:\n\n{e}", file=sys.stderr,
+                      flush=True)
+                return
+            try:
+                changes = await reload_controller(self.controller, self.config, config, algorithm_parser,
+                                                  dry_run=self.dry_run)
+            except CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("Reload failed", exc_info=True)
+                print(f"Not reloading {self.config_path}, keeping the running configuration: {e}", file=sys.stderr,
+                      flush=True)
+                return
+            self.config = config
+            if self.spans is not None:
+                # new sensors and fans need their stats as well
+                self.spans.attach(self.controller)
+            if changes:
+                print(f"Reloaded {self.config_path}:\n  " + '\n  '.join(changes), file=sys.stderr, flush=True)
+            else:
+                print(f"Reloaded {self.config_path}, nothing changed", file=sys.stderr, flush=True)
 
     def log_state(self):
-        self.table_printer.print_values(self.controller.get_log_state())
+        snapshot = [(label, list(values)) for label, values in self.controller.get_log_state()]
+        self.state_sink.submit(snapshot)
 
+    def write_jsonl(self, snapshot):
+        self.log_file.write(self.jsonl_encoder.encode(snapshot) + '\n')
+        self.log_file.flush()
 
     async def run_log_state(self):
         await asyncio.sleep(5)
         while True:
+            # the table shows current fan speeds, not the ones of the last scheduled reading
+            await self.controller.update_rpms()
             self.log_state()
             await sleep(self.log_interval)
 
     async def run_async(self):
+        running = False
         try:
+            if self.watchdog is not None:
+                self.watchdog_task = self.watchdog.start()
+            for address, routes in self.http_routes.items():
+                server = HttpServer(routes)
+                self.http_servers.append(server)
+                await server.start(*address)
+            if self.checkpoint is not None:
+                self.checkpoint.restore()
             await self.controller.setup()
-            await sleep(1)
+            running = True
+            if self.startup is not None:
+                self.startup.mark('setup', self.controller.setup_seconds)
+            if self.config_path != '<stdin>':
+                # only after setup, a reload sets up new interfaces on its own
+                asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.request_reload)
+            if self.control_server is not None:
+                # after setup, so that overrides and pins are not overwritten by it
+                await self.control_server.start(self.control_socket)
+            if self.memory_tracker is not None:
+                # after setup, so that only growth while running is reported
+                self.memory_tracker.start()
             async def callback(controller):
-                self.log_state()
-            tasks = (
-                asyncio.create_task(self.controller.run(callback), name="Main controller"),
-                #asyncio.create_task(self.run_log_state(), name="State logger"),
-            )
-            await asyncio.wait(tasks, return_when=FIRST_EXCEPTION)
+                if self.startup is not None:
+                    self.startup.mark('first cycle')
+                    self.startup.log()
+                    self.startup = None
+                for recorder in self.recorders:
+                    recorder.record(controller)
+                if self.dashboard is not None:
+                    self.dashboard.publish()
+                if self.jsonl_encoder is not None:
+                    self.state_sink.submit(self.jsonl_encoder.snapshot())
+            tasks = [asyncio.create_task(self.controller.run(callback), name="Main controller")]
+            if self.jsonl_encoder is None:
+                tasks.append(asyncio.create_task(self.run_log_state(), name="State logger"))
+            if self.stats_interval:
+                tasks.append(asyncio.create_task(self.run_dump_stats(), name="Stats dump"))
+            if self.memory_interval:
+                tasks.append(asyncio.create_task(self.run_memory_report(), name="Memory report"))
+            if self.checkpoint is not None:
+                tasks.append(asyncio.create_task(self.checkpoint.run(), name="Checkpoint"))
+            # the controller only ends when stopped, background tasks when they fail
+            await asyncio.wait(tasks, return_when=FIRST_COMPLETED)
+            for task in tasks:
+                task.cancel()
             raise_exceptions(tasks, logger)
         except CancelledError:
             pass
+        finally:
+            if running and self.checkpoint is not None:
+                # a restart continues from the state at shutdown
+                try:
+                    self.checkpoint.write(self.checkpoint.collect())
+                except OSError as e:
+                    logger.warning("Could not write checkpoint %s: %s", self.checkpoint.path, e)
+            self.state_sink.close()
+            for recorder in self.recorders:
+                recorder.writer.close()
+            if self.dashboard is not None:
+                # ends the event streams, the servers wait for their connections to close
+                self.dashboard.close()
+            for server in self.http_servers:
+                await server.close()
+            if self.control_server is not None:
+                await self.control_server.close()
+            if self.watchdog_task is not None:
+                self.watchdog_task.cancel()
 
     def run(self):
         """spawn an asyncio event loop and schedule our run_async coroutine"""
@@ -105,6 +399,10 @@ class SpinPid:
 
         loop.add_signal_handler(signal.SIGINT, handle_interrupt)
         loop.add_signal_handler(signal.SIGTERM, handle_term)
+        loop.add_signal_handler(signal.SIGUSR2, self.dump_stats)
+        loop.add_signal_handler(signal.SIGUSR1, self.toggle_profiling)
+        if self.profiler.active:
+            loop.call_later(self.profile_on_start, self.stop_profiling)
 
         future = asyncio.ensure_future(self.run_async(), loop=loop)
         future.add_done_callback(done_callback)
@@ -118,6 +416,7 @@ class SpinPid:
         finally:
             loop.run_until_complete(loop.shutdown_asyncgens())
             loop.close()
+            self.stop_profiling()
 
 def configureLogging(verbosity):
     rootLevel = logging.WARN
@@ -135,21 +434,35 @@ def configureLogging(verbosity):
 
 
 if __name__ == '__main__':
+    startup = StartupTimer(STARTED)
+    startup.mark('imports')
     args = parse()
     configureLogging(args.verbosity)
-    try:
-        config = load_config(args.config)
-    except ValidationError as e:
-        err = f"Error in configuration file {args.config.name}:\n\n{e}"
-        sys.stderr.write(err)
-        if "import_error" in err:
-            sys.stderr.write("\n\nThere were errors importing the specified device drivers.\n"
-                             "If the names are correct, you may need to install additional dependencies.\n\n")
-        sys.exit(1)
+    config_text = args.config.read()
+    config_cache = ConfigCache(args.config_cache) if args.config_cache else None
+    cached = config_cache.load(config_text) if config_cache is not None else None
+    if cached is not None:
+        config, compiled_algorithms = cached
+        algorithm_parser.code_cache.update(compiled_algorithms)
+    else:
+        try:
+            config = parse_config(config_text)
+        except (ValidationError, yaml.YAMLError) as e:
+            sys.stderr.write(f"Error in configuration file {args.config.name}:\n\n{e}")
+            sys.exit(1)
+    startup.mark('configuration (cached)' if cached is not None else 'configuration')
     if args.print_config or args.verbosity > 2:
         logger.debug("Loaded config: %s", config)
     if args.print_config:
         sys.exit(0)
-    spinPid = SpinPid(args, config)
-    logger.debug(f"ARGS: {args}")
+    try:
+        spinPid = SpinPid(args, config, startup)
+    except ConfigError as e:
+        sys.stderr.write(f"Error in configuration file {args.config.name}:\n\n{e}\n")
+        sys.exit(1)
+    startup.mark('build')
+    if config_cache is not None and cached is None:
+        # after building, so that the algorithms are compiled
+        config_cache.save(config_text, config, algorithm_parser.code_cache)
+    logger.debug("ARGS: %s", args)
     spinPid.run()
@@ -0,0 +1,162 @@
+"""Searches algorithm parameters by simulating candidates against a thermal plant fitted to a trace.
+
+Candidates are created from a template with placeholders, e.g.
+
+  spinpid tune spinpid.trc --sensor HDDs --fan "Intake 1" --target 40 \\
+      --template "PID(sensors[HDDs], 40, p={p}, i={i}, d={d}, windup_guard={windup_guard})" \\
+      --param p=1,2,4,8 --param i=0,0.1 --param d=0:80:20 --param windup_guard=20
+
+Parameters are either a list of values (a,b,c) or a range (from:to:step). With --random N,
+N candidates are drawn at random instead of trying every combination (ranges are then
+sampled continuously and the step is ignored)."""
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+from argparse import RawDescriptionHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Iterable
+
+from spinpid.application.spinpid import algorithm_parser, configureLogging
+from spinpid.trace import SENSOR, DUTY
+from spinpid.trace.reader import load_series
+from spinpid.trace.store import load_store_series
+from spinpid.tuning import Simulation, Score, fit_plant, pareto_front
+from spinpid.util.argparse import ArgumentParser
+
+logger = logging.getLogger(__name__)
+
+
+class ParameterSpace:
+    def __init__(self, name: str, values: Optional[list[float]] = None,
+                 low: Optional[float] = None, high: Optional[float] = None, step: Optional[float] = None) -> None:
+        self.name = name
+        self.values = values
+        self.low, self.high, self.step = low, high, step
+
+    @classmethod
+    def parse(cls, arg: str) -> 'ParameterSpace':
+        name, sep, spec = arg.partition('=')
+        if not sep or not name:
+            raise ValueError(f"Invalid parameter '{arg}', expected name=a,b,c or name=from:to[:step]")
+        if ':' in spec:
+            low, high, *step = (float(v) for v in spec.split(':'))
+            return cls(name, low=low, high=high, step=step[0] if step else None)
+        return cls(name, values=[float(v) for v in spec.split(',')])
+
+    def grid(self) -> list[float]:
+        if self.values is not None:
+            return self.values
+        if self.step is None or self.step <= 0:
+            raise ValueError(f"Parameter {self.name} needs a step to be used in a grid search")
+        count = int(round((self.high - self.low) / self.step)) + 1
+        return [round(self.low + i * self.step, 6) for i in range(count)]
+
+    def sample(self, rng: random.Random) -> float:
+        if self.values is not None:
+            return rng.choice(self.values)
+        return round(rng.uniform(self.low, self.high), 3)
+
+
+def format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def generate_candidates(template: str, spaces: list[ParameterSpace], random_count: Optional[int],
+                        seed: Optional[int]) -> Iterable[str]:
+    if random_count:
+        rng = random.Random(seed)
+        samples = ({space.name: space.sample(rng) for space in spaces} for _ in range(random_count))
+    else:
+        samples = (dict(zip((space.name for space in spaces), combination))
+                   for combination in itertools.product(*(space.grid() for space in spaces)))
+    seen = set()
+    for sample in samples:
+        candidate = template.format(**{name: format_number(value) for name, value in sample.items()})
+        if candidate not in seen:
+            seen.add(candidate)
+            yield candidate
+
+
+_simulation: Optional[Simulation] = None
+
+
+def _init_worker(simulation: Simulation) -> None:
+    global _simulation
+    _simulation = simulation
+    logging.getLogger('spinpid').setLevel(logging.WARN)
+
+
+def _evaluate(candidate: str) -> tuple[str, Optional[Score]]:
+    try:
+        return candidate, _simulation.evaluate(candidate, algorithm_parser)
+    except Exception as e:
+        logger.warning("Unable to evaluate %s: %s", candidate, e)
+        return candidate, None
+
+
+def parse():
+    parser = ArgumentParser(prog='spinpid tune', description=__doc__, formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('traces', nargs='*', metavar='TRACE', help="Trace files to fit the plant to")
+    parser.add_argument('--store', action='store', metavar='FILE',
+                        help="Load the history from a database written with --store instead of trace files")
+    parser.add_argument('--last', action='store', type=float, metavar='HOURS',
+                        help="Only load the last HOURS of the history in --store")
+    parser.add_argument('--sensor', required=True, help="Sensor the candidates control")
+    parser.add_argument('--fan', required=True, help="Fan the candidates drive")
+    parser.add_argument('--target', required=True, type=float, help="Temperature to stay below")
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help="How far above the target the temperature may go before it counts as unsettled")
+    parser.add_argument('--template', required=True, help="Algorithm with {placeholders} for the parameters")
+    parser.add_argument('--param', action='append', default=[], type=ParameterSpace.parse, dest='params',
+                        help="Values of a parameter: name=a,b,c or name=from:to[:step]")
+    parser.add_argument('--random', type=int, metavar='N', help="Try N random candidates instead of the full grid")
+    parser.add_argument('--seed', type=int, help="Seed for --random")
+    parser.add_argument('--min-duty', type=int, default=15)
+    parser.add_argument('--max-duty', type=int, default=100)
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help="Number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument('--verbose', '-v', action='count', dest='verbosity', default=0,
+                        help="Increase verbosity (can be passed multiple times)")
+    args = parser.parse_args()
+    if bool(args.traces) == bool(args.store):
+        parser.error("either trace files or --store are required")
+    return args
+
+
+def main():
+    args = parse()
+    configureLogging(args.verbosity)
+
+    if args.store:
+        series = load_store_series(args.store, kinds=(SENSOR, DUTY),
+                                   last=args.last * 3600 if args.last is not None else None)
+    else:
+        series = load_series(args.traces, kinds=(SENSOR, DUTY))
+    plant = fit_plant(series, args.sensor, args.fan)
+    print(f"Fitted plant for {args.sensor}: {plant}")
+    simulation = Simulation(plant, series, args.sensor, args.fan, target=args.target, tolerance=args.tolerance,
+                            min_duty=args.min_duty, max_duty=args.max_duty)
+
+    candidates = list(generate_candidates(args.template, args.params, args.random, args.seed))
+    print(f"Evaluating {len(candidates)} candidates on {args.jobs} processes...")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker, initargs=(simulation,)) as executor:
+        results = list(executor.map(_evaluate, candidates, chunksize=max(1, len(candidates) // (args.jobs * 4))))
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+    front = sorted(pareto_front(results), key=lambda result: result[1])
+    if not front:
+        print("No candidate could be evaluated", file=sys.stderr)
+        sys.exit(1)
+    print()
+    print(f"{'Overshoot':>9} | {'Settling':>8} | {'Mean duty':>9} | {'Changes':>7} | Algorithm")
+    for candidate, score in front:
+        print(f"{score.overshoot:>8.2f}° | {score.settling_time:>7.0f}s | {score.mean_duty:>8.1f}% | "
+              f"{score.duty_changes:>7} | {candidate}")
+
+
+if __name__ == '__main__':
+    main()
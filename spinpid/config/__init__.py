@@ -1,17 +1,20 @@
 from datetime import timedelta
 from io import BytesIO
-from typing import Optional, Any, Union
+from typing import Optional, Any, Union, Literal
 from typing_extensions import TypedDict
 
 import yaml
-from pydantic import BaseModel, ImportString, ConfigDict
+from pydantic import BaseModel, ConfigDict
+
+from spinpid.interfaces.fan import DEFAULT_BYPASS_INCREASE
 
 
 class InterfaceConfig(TypedDict):
     # noinspection PyTypedDict
     __pydantic_config__ = ConfigDict(extra='allow')
 
-    driver: ImportString
+    # e.g. spinpid.interfaces.ipmi.IPMI, only imported when the interface is built
+    driver: str
 
 
 class InterfaceChannelRef(TypedDict):
@@ -24,7 +27,8 @@ class InterfaceChannelRef(TypedDict):
 class SensorConfig(BaseModel):
     interface: Union[str, InterfaceChannelRef]
     interval: timedelta
-    show_single_values: bool = False
+    # True, False or 'summary' for min, mean, max and the name of the hottest single value
+    show_single_values: Union[bool, Literal['summary']] = False
 
 
 class FanConfig(BaseModel):
@@ -32,6 +36,12 @@ class FanConfig(BaseModel):
     algorithms: dict[str, str]
     min_duty: Optional[int] = None
     max_duty: Optional[int] = None
+    # smaller duty decreases are not written
+    deadband: int = 0
+    # minimum time between two duty changes
+    min_hold: timedelta = timedelta(0)
+    # increases by at least this much are written right away, regardless of min_hold
+    bypass_increase: Optional[int] = DEFAULT_BYPASS_INCREASE
 
 
 InterfacesConfig = dict[str, InterfaceConfig]
@@ -45,12 +55,16 @@ class Config(BaseModel):
     fans: FansConfig
 
 
+# libyaml is an order of magnitude faster, if PyYAML was built with it
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
 def load_raw_config(filename: Union[BytesIO, str]) -> Any:
     if isinstance(filename, str):
         with open(filename, 'r', encoding='UTF-8') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
     else:
-        return yaml.safe_load(filename)
+        return yaml.load(filename, Loader=SafeLoader)
 
 
 def load_config(file: Union[BytesIO, str]) -> Config:
@@ -58,6 +72,11 @@ def load_config(file: Union[BytesIO, str]) -> Config:
     return Config(**config)
 
 
+def parse_config(text: str) -> Config:
+    """Loads the configuration from the contents of a configuration file"""
+    return Config(**yaml.load(text, Loader=SafeLoader))
+
+
 if __name__ == '__main__':
     import sys
 
@@ -0,0 +1,73 @@
+"""Caches the validated configuration and the compiled algorithms.
+
+A restart with an unchanged configuration file then skips loading the YAML, validating it
+and compiling the algorithms. The cache is keyed by a hash of the configuration file, the
+spinpid version, the definition of the configuration models including the modules their
+defaults come from and the Python bytecode version, any change of them invalidates it.
+
+The cache is a pickle, so it must only be writable by whoever may change the configuration."""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import logging
+import marshal
+import pickle
+from types import CodeType
+from typing import Optional
+
+from . import Config, __file__ as config_module_file
+from .. import VERSION
+from ..interfaces import fan
+from ..util.files import write_atomic
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['ConfigCache']
+
+CompiledAlgorithms = dict[tuple[str, str], CodeType]
+
+# a pickled Config only fits the models it was created with and their defaults,
+# add any module the models take defaults from
+MODEL_FILES = (config_module_file, fan.__file__)
+
+
+def cache_key(text: str) -> str:
+    models = []
+    for filename in MODEL_FILES:
+        with open(filename, 'rb') as f:
+            models.append(f.read())
+    digest = hashlib.sha256()
+    for part in (VERSION.encode(), *models, importlib.util.MAGIC_NUMBER, text.encode('UTF-8')):
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ConfigCache:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self, text: str) -> Optional[tuple[Config, CompiledAlgorithms]]:
+        """Returns the configuration and the compiled algorithms for the text of a configuration
+           file, None if they are not cached"""
+        try:
+            with open(self.path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['key'] != cache_key(text):
+                logger.info("Configuration changed, not using the cache %s", self.path)
+                return None
+            return cached['config'], marshal.loads(cached['code'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable configuration cache %s: %s", self.path, e)
+            return None
+
+    def save(self, text: str, config: Config, code: CompiledAlgorithms) -> None:
+        data = pickle.dumps({'key': cache_key(text), 'config': config, 'code': marshal.dumps(code)},
+                            protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            write_atomic(self.path, data)
+        except OSError as e:
+            logger.warning("Could not write configuration cache %s: %s", self.path, e)
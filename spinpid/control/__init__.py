@@ -0,0 +1,14 @@
+"""Control API of a running controller on a Unix domain socket.
+
+Every request and every response is a single line of JSON. A request names a command and
+its arguments, e.g. {"command": "override", "fan": "CPU", "duty": 100, "ttl": 600}, the
+response is {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+
+Commands are handled on the event loop of the controller, they only change its state and
+never wait for a sensor or a fan, the change takes effect with the next control cycle.
+
+The server lives in spinpid.control.server, so that clients don't need to import it."""
+
+__all__ = ['DEFAULT_SOCKET']
+
+DEFAULT_SOCKET = '/run/spinpid.sock'
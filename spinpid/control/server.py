@@ -0,0 +1,177 @@
+"""Server of the control API, see the package for the protocol"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import stat
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..controller import Controller
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['ControlServer', 'ControlError']
+
+# requests are tiny, anything longer is not a request
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+class ControlError(Exception):
+    pass
+
+
+def _optional_number(request: dict, name: str) -> Optional[float]:
+    value = request.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ControlError(f"{name} must be a number")
+    return value
+
+
+def _optional_ttl(request: dict) -> Optional[float]:
+    ttl = _optional_number(request, 'ttl')
+    if ttl is not None and ttl <= 0:
+        raise ControlError("ttl must be a positive number of seconds")
+    return ttl
+
+
+class ControlServer:
+    def __init__(self, controller: Controller) -> None:
+        self.controller = controller
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.path: Optional[str] = None
+        self.commands: dict[str, Callable[[dict], Any]] = {
+            'state': self.state,
+            'override': self.override,
+            'clear-override': self.clear_override,
+            'pin': self.pin,
+            'unpin': self.unpin,
+            'pause': self.pause,
+            'resume': self.resume,
+        }
+
+    async def start(self, path: str) -> None:
+        await self._remove_stale_socket(path)
+        # the socket accepts overrides, it must never be accessible to others, not even until the chmod
+        umask = os.umask(0o117)
+        try:
+            self.server = await asyncio.start_unix_server(self._handle_connection, path, limit=MAX_REQUEST_SIZE)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o660)
+        self.path = path
+        logger.info("Listening for control commands on %s", path)
+
+    @staticmethod
+    async def _remove_stale_socket(path: str) -> None:
+        """Removes a socket left behind by a previous run that did not shut down cleanly"""
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise ControlError(f"{path} exists and is not a socket")
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+        writer.close()
+        raise ControlError(f"Another process is already listening on {path}")
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                writer.write(json.dumps(self.handle(line)).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # ValueError: the line was longer than the limit
+            pass
+        except asyncio.CancelledError:
+            # nothing awaits the connection's task, re-raising would only make asyncio log it as an error
+            pass
+        finally:
+            writer.close()
+
+    def handle(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ControlError("Request must be a JSON object")
+            command = self.commands.get(request.get('command'))
+            if command is None:
+                raise ControlError(f"Unknown command {request.get('command')!r}, "
+                                   f"available: {', '.join(self.commands)}")
+            return {'ok': True, 'result': command(request)}
+        except (ControlError, ValueError) as e:
+            # ValueError: invalid JSON or values
+            return {'ok': False, 'error': str(e)}
+        except Exception as e:
+            logger.warning("Exception while handling control request %r: %s", line, e, exc_info=True)
+            return {'ok': False, 'error': f"Internal error: {e}"}
+
+    def _fan(self, request: dict):
+        fan = self.controller.fans.get(request.get('fan'))
+        if fan is None:
+            raise ControlError(f"Unknown fan {request.get('fan')!r}, available: {', '.join(self.controller.fans)}")
+        return fan
+
+    def _sensor(self, request: dict):
+        sensor = self.controller.sensors.get(request.get('sensor'))
+        if sensor is None:
+            raise ControlError(f"Unknown sensor {request.get('sensor')!r}, "
+                               f"available: {', '.join(self.controller.sensors)}")
+        return sensor
+
+    def state(self, request: dict) -> dict:
+        controller = self.controller
+        state = controller.get_state()
+        state['paused'] = controller.paused
+        state['overrides'] = {fan_id: {'duty': fan.override, 'ttl': fan.override_for}
+                              for fan_id, fan in controller.fans.items() if fan.override is not None}
+        state['pinned'] = {sensor_id: {'temperature': float(sensor.pinned), 'ttl': sensor.pinned_for}
+                           for sensor_id, sensor in controller.sensors.items() if sensor.pinned is not None}
+        return state
+
+    def override(self, request: dict) -> None:
+        fan = self._fan(request)
+        duty = request.get('duty')
+        if isinstance(duty, bool) or not isinstance(duty, int):
+            raise ControlError("duty must be an integer")
+        fan.set_override(duty, _optional_ttl(request))
+
+    def clear_override(self, request: dict) -> None:
+        self._fan(request).set_override(None)
+
+    def pin(self, request: dict) -> None:
+        sensor = self._sensor(request)
+        temperature = _optional_number(request, 'temperature')
+        if temperature is None:
+            raise ControlError("temperature is required")
+        sensor.pin(temperature, _optional_ttl(request))
+
+    def unpin(self, request: dict) -> None:
+        self._sensor(request).pin(None)
+
+    def pause(self, request: dict) -> None:
+        self.controller.pause()
+
+    def resume(self, request: dict) -> None:
+        self.controller.resume()
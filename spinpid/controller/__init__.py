@@ -2,23 +2,37 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from asyncio import sleep, CancelledError, ensure_future, create_task
+import time
+from asyncio import sleep, CancelledError, create_task
 from datetime import timedelta
 from graphlib import TopologicalSorter
 from itertools import chain
-from typing import Callable, Awaitable, Optional, Iterable, Generator
+from typing import Callable, Awaitable, Optional, Iterable, Generator, Literal, Union
 
 from .algorithm import Expression, AlgorithmContext
+from .algorithm.expression import BatchColumns, Array
 from .values import LastKnownValues
 from ..interfaces import Interface, TearDown
 from ..interfaces.fan import FanZone
 from ..interfaces.sensor import Temperature, TemperatureSensor
+from ..metrics import CallStats
 from ..util import clamp
 from ..util.asyncio import raise_exceptions
 from ..util.table import LabelledValue, LabelledValueGroup, Value as TableValue
 
 logger = logging.getLogger(__name__)
 
+# show_single_values mode that shows min, mean, max and the hottest single value instead of all of them
+SUMMARY = 'summary'
+# seconds between two readings of the fan speeds
+DEFAULT_RPM_INTERVAL = 10.0
+
+def _remaining(handle: Optional[asyncio.TimerHandle]) -> Optional[float]:
+    if handle is None or handle.cancelled():
+        return None
+    return max(handle.when() - asyncio.get_running_loop().time(), 0.0)
+
+
 class PubSubValue:
     def __init__(self, name: str, **kwargs):
         super().__init__(**kwargs)
@@ -31,8 +45,11 @@ class PubSubValue:
 
     def publish_value_update(self, needs_update: bool = False):
         self.needs_update = needs_update
+        # checked once per call, this runs for every node of the graph on every update
+        debug = logger.isEnabledFor(logging.DEBUG)
         for subscriber in self.subscribers:
-            logger.debug(f"[{self.name}] Publishing update to {subscriber.name}")
+            if debug:
+                logger.debug("[%s] Publishing update to %s", self.name, subscriber.name)
             subscriber.publish_value_update(needs_update=True)
 
 
@@ -45,12 +62,17 @@ class Sensor(PubSubValue):
 
     def __init__(self, name, temperature_sensor: TemperatureSensor,
                  last_known_values: LastKnownValues,
-                 interval: timedelta, show_single_values: bool) -> None:
+                 interval: timedelta, show_single_values: Union[bool, Literal['summary']],
+                 interface_id: Optional[str] = None) -> None:
         super().__init__(name=name)
         self.temperature_sensor = temperature_sensor
         self.last_known_values = last_known_values
         self.interval = interval
         self.show_single_values = show_single_values
+        self.interface_id = interface_id
+        self.update_stats: Optional[CallStats] = None
+        self.pinned: Optional[Temperature] = None
+        self._unpin_handle: Optional[asyncio.TimerHandle] = None
 
     async def setup(self) -> TearDown:
         # As a quick fix update in setup to ensure that sensors have a last value. We can do better than that.
@@ -61,13 +83,52 @@ class Sensor(PubSubValue):
         return teardown
 
     async def update(self) -> None:
-        temperature = await self.temperature_sensor.get_temperature()
+        if self.pinned is not None:
+            self._set_temperature(self.pinned)
+            return
+        if self.update_stats is None:
+            temperature = await self.temperature_sensor.get_temperature()
+        else:
+            temperature = await self.update_stats.measure(self.temperature_sensor.get_temperature())
+        if self.pinned is not None:
+            # pinned while reading, pin() already published the pinned temperature
+            return
+        self._set_temperature(temperature)
+
+    def _set_temperature(self, temperature: Temperature) -> None:
         self.last_temperature = temperature
         self.last_known_values.set_sensor_temperature(self.name, temperature)
-        logger.debug(f"[Sensor {self.name}] Updated temperature to {temperature}°C")
+        logger.debug("[Sensor %s] Updated temperature to %s°C", self.name, temperature)
         self.publish_value_update()
 
+    def pin(self, temperature: Optional[float], ttl: Optional[float] = None) -> None:
+        """Uses temperature instead of reading the sensor until unpinned (None) or ttl seconds passed.
+
+           After unpinning, the next regular update replaces the pinned temperature."""
+        if self._unpin_handle is not None:
+            self._unpin_handle.cancel()
+            self._unpin_handle = None
+        if temperature is None:
+            if self.pinned is not None:
+                logger.info("[Sensor %s] Unpinned", self.name)
+            self.pinned = None
+            return
+        label = self.last_temperature.label if self.last_temperature is not None else self.name
+        self.pinned = Temperature(temperature, label)
+        if ttl is not None:
+            self._unpin_handle = asyncio.get_running_loop().call_later(ttl, self.pin, None)
+        logger.info("[Sensor %s] Pinned to %s°C%s", self.name, temperature, f" for {ttl}s" if ttl is not None else "")
+        self._set_temperature(self.pinned)
+
+    @property
+    def pinned_for(self) -> Optional[float]:
+        """Seconds until the pinned temperature expires"""
+        return _remaining(self._unpin_handle)
+
     async def run(self):
+        if self.last_temperature is not None:
+            # just read by setup()
+            await sleep(self.interval.total_seconds())
         while True:
             await self.update()
             await sleep(self.interval.total_seconds())
@@ -81,17 +142,38 @@ class Sensor(PubSubValue):
             stale = value.was_displayed
             value.was_displayed = True
             temp = value.value
-            if self.show_single_values:
+            if self.show_single_values == SUMMARY:
+                yield from self._get_summary_log_state(temp, stale)
+            elif self.show_single_values:
                 for label, temp in temp:
                     yield label, TableValue(f"{temp}", stale=stale)
             else:
                 yield temp.label, TableValue(f"{temp}", stale=stale)
 
+    def get_state(self) -> Optional[dict]:
+        value = self.last_known_values.sensor_temperature_values[self.name]
+        if value is None:
+            return None
+        temp = value.value
+        return {'label': temp.label, 'temperature': float(temp), 'values': dict(temp)}
+
+    @staticmethod
+    def _get_summary_log_state(temp: Temperature, stale: bool) -> Iterable[LabelledValue]:
+        """The same few columns no matter how many single values there are"""
+        temps = getattr(temp, 'temperatures', None) or (temp,)
+        hottest = max(temps)
+        yield 'min', TableValue(float(min(temps)), stale=stale)
+        yield '⌀', TableValue(sum(temps) / len(temps), stale=stale)
+        yield 'max', TableValue(float(hottest), stale=stale)
+        yield 'hottest', TableValue(hottest.label, stale=stale)
+
 class FanAlgorithm(PubSubValue):
-    def __init__(self, name: str, fan_name: str, expression: Expression) -> None:
+    def __init__(self, name: str, fan_name: str, expression: Expression, source: Optional[str] = None) -> None:
         super().__init__(name=name)
         self.fan_name = fan_name
         self.expression = expression
+        # the configured algorithm, to recognize it across restarts
+        self.source = source
 
         self.referenced_sensors = frozenset(expression.referenced_sensors or ())
         self.referenced_fans = frozenset(expression.referenced_fans or ())
@@ -101,10 +183,10 @@ class FanAlgorithm(PubSubValue):
     def value(self):
         if self.needs_update:
             self._value = self.expression.value()
-            logger.debug(f"[Algorithm {self.fan_name}/{self.name}] Update value {self._value}")
+            logger.debug("[Algorithm %s/%s] Update value %s", self.fan_name, self.name, self._value)
             self.publish_value_update()
         else:
-            logger.debug(f"[Algorithm {self.fan_name}/{self.name}] Returning cached value {self._value}")
+            logger.debug("[Algorithm %s/%s] Returning cached value %s", self.fan_name, self.name, self._value)
         return self._value
 
 
@@ -114,7 +196,8 @@ class FanController(PubSubValue):
                  fan_zone: FanZone,
                  algorithms: frozenset[FanAlgorithm],
                  context: AlgorithmContext,
-                 last_known_values: LastKnownValues) -> None:
+                 last_known_values: LastKnownValues,
+                 interface_id: Optional[str] = None) -> None:
         super().__init__(name=name)
         self.fan_zone = fan_zone
         self.algorithms = algorithms
@@ -122,6 +205,13 @@ class FanController(PubSubValue):
         self.min_duty = context.min_duty
         self.max_duty = context.max_duty
         self.last_known_values = last_known_values
+        self.interface_id = interface_id
+        self.set_duty_stats: Optional[CallStats] = None
+        self.update_stats: Optional[CallStats] = None
+        self.override: Optional[int] = None
+        self._override_handle: Optional[asyncio.TimerHandle] = None
+        # name of the algorithm that returned the highest duty in the last calculation
+        self.winning_algorithm: Optional[str] = None
 
         self.keep_running = True
 
@@ -133,20 +223,70 @@ class FanController(PubSubValue):
                 highest_alg, highest_duty = alg, raw_duty
 
         duty = clamp(highest_duty, self.min_duty, self.max_duty)
-        logger.debug(f"[Fan {self.name}] Algorithm {highest_alg.name} returned {highest_duty} -> {duty}")
+        self.winning_algorithm = highest_alg.name
+        logger.debug("[Fan %s] Algorithm %s returned %s -> %s", self.name, highest_alg.name, highest_duty, duty)
         return duty
 
+    def batch_duty(self, columns: BatchColumns) -> Array:
+        """Batch version of calculate_duty()"""
+        import numpy
+        highest = numpy.maximum.reduce([alg.expression.batch(columns) for alg in self.algorithms])
+        return numpy.clip(highest, self.min_duty, self.max_duty)
+
     async def setup(self) -> None:
-        self.context.last_duty = await self.fan_zone.get_duty()
+        duty = await self.fan_zone.get_duty()
+        # some fan zones can't tell, then a restored checkpoint is the best guess
+        if duty is not None:
+            self.context.last_duty = duty
+        # some fan zones only know their fans after the first reading
+        await self.update_rpm()
+
+    def set_override(self, duty: Optional[int], ttl: Optional[float] = None) -> None:
+        """Uses duty instead of the algorithms until cleared (None) or ttl seconds passed"""
+        if duty is not None and not 0 <= duty <= 100:
+            raise ValueError(f"Duty must be between 0 and 100, got {duty}")
+        if self._override_handle is not None:
+            self._override_handle.cancel()
+            self._override_handle = None
+        if duty is None:
+            if self.override is not None:
+                logger.info("[Fan %s] Cleared duty override", self.name)
+        else:
+            if ttl is not None:
+                self._override_handle = asyncio.get_running_loop().call_later(ttl, self.set_override, None)
+            logger.info("[Fan %s] Overriding duty with %d%%%s", self.name, duty,
+                        f" for {ttl}s" if ttl is not None else "")
+        self.override = duty
+        self.needs_update = True
+
+    @property
+    def override_for(self) -> Optional[float]:
+        """Seconds until the duty override expires"""
+        return _remaining(self._override_handle)
 
     async def update(self) -> None:
-        duty = self.calculate_duty()
+        overridden = self.override is not None
+        duty = self.override if overridden else self.calculate_duty()
+        # overrides are written right away, regardless of the hysteresis of the fan zone
+        if self.set_duty_stats is None:
+            await self.fan_zone.set_duty(duty, hold=not overridden, min_duty=self.min_duty)
+        else:
+            await self.set_duty_stats.measure(self.fan_zone.set_duty(duty, hold=not overridden,
+                                                                     min_duty=self.min_duty))
+        if self.fan_zone.last_duty is not None:
+            # the fan zone might hold on to the previous duty
+            duty = self.fan_zone.last_duty
         self.context.last_duty = duty
         self.last_known_values.set_fan_duty(self.name, duty)
-        await self.fan_zone.set_duty(duty)
-        await self.fan_zone.update()
         self.publish_value_update()
 
+    async def update_rpm(self) -> None:
+        """Reads the speed of the fans of the fan zone, independent of the duty updates"""
+        if self.update_stats is None:
+            await self.fan_zone.update()
+        else:
+            await self.update_stats.measure(self.fan_zone.update())
+
     def get_log_state(self) -> Iterable[LabelledValue]:
         value = self.last_known_values.fan_duty_values[self.name]
         if value is not None:
@@ -156,6 +296,14 @@ class FanController(PubSubValue):
             for fan in self.fan_zone.fans:
                 yield fan.name, TableValue(f"{fan.rpm}", stale=False)
 
+    def get_state(self) -> Optional[dict]:
+        value = self.last_known_values.fan_duty_values[self.name]
+        if value is None:
+            return None
+        return {'duty': value.value, 'rpm': {fan.name: fan.rpm for fan in self.fan_zone.fans},
+                'algorithm': self.winning_algorithm if self.override is None else None,
+                'override': self.override is not None, 'skipped_writes': self.fan_zone.skipped_writes}
+
 Interfaces = dict[str, Interface]
 Sensors = dict[str, Sensor]
 Fans = dict[str, FanController]
@@ -180,12 +328,34 @@ class Controller:
         self.sensors = sensors
         self.fans = fans
         self.last_known_values = last_known_values
-
-        self.fans_ordered = tuple(sorted_fan_groups(fans))
-        logger.info("Will update fans in this order: %r", self.fans_ordered)
+        self.interface_teardowns = {}
+        # seconds each interface took to set up
+        self.setup_seconds: dict[str, float] = {}
 
         self.keep_running = True
-
+        # paused fans keep their duty, unless it is overridden
+        self.paused = False
+        self.update_fans_stats: Optional[CallStats] = None
+        # fan speeds are read on their own schedule, None only reads them on demand (update_rpms())
+        self.rpm_interval: Optional[float] = DEFAULT_RPM_INTERVAL
+        # subscribed to all sensors and fans, including the ones added by reconfigure()
+        self.listeners: list[PubSubValue] = []
+        # incremented by every reconfigure()
+        self.generation = 0
+
+        self._sensor_tasks: dict[Sensor, asyncio.Task] = {}
+        self._rpm_task: Optional[asyncio.Task] = None
+        self._running = False
+        # held for a whole cycle, so that reconfigure() only happens between cycles
+        self._cycle_lock = asyncio.Lock()
+
+        self._wire()
+
+    def _wire(self) -> None:
+        sensors, fans = self.sensors, self.fans
+        for value in chain(sensors.values(), fans.values(), (alg for fan in fans.values() for alg in fan.algorithms)):
+            # drop the wiring of a previous configuration, keep everything else
+            value.subscribers = {s for s in value.subscribers if not isinstance(s, (FanAlgorithm, FanController))}
         for fan in fans.values():
             for alg in fan.algorithms:
                 for sensor_id in alg.referenced_sensors:
@@ -193,26 +363,156 @@ class Controller:
                 for fan_id in alg.referenced_fans:
                     fans[fan_id].subscribe(alg)
                 alg.subscribe(fan)
+        for listener in self.listeners:
+            for value in chain(sensors.values(), fans.values()):
+                value.subscribe(listener)
+
+        self.fans_ordered = tuple(sorted_fan_groups(fans))
+        logger.info("Will update fans in this order: %r", self.fans_ordered)
+        self.sleep_seconds = min(sensor.interval for sensor in sensors.values()).total_seconds() if sensors else 1.0
+
+    def subscribe_all(self, listener: PubSubValue) -> None:
+        """Subscribes listener to all sensors and fans, now and after a reconfiguration"""
+        self.listeners.append(listener)
+        for value in chain(self.sensors.values(), self.fans.values()):
+            value.subscribe(listener)
+
+    async def reconfigure(self, interfaces: Interfaces, interface_teardowns: dict[str, TearDown], sensors: Sensors,
+                          fans: Fans, apply: Optional[Callable[[], None]] = None,
+                          set_up_replacements: Optional[Callable[[], Awaitable[dict[str, TearDown]]]] = None) -> None:
+        """Replaces the interfaces, sensors and fans between two cycles.
+
+           New interfaces, sensors and fans must already be set up, interface_teardowns
+           contains the teardowns of the new interfaces. The exception are interfaces that
+           replace one with the same id: the old one is torn down first, then set_up_replacements
+           sets up the new ones with their sensors and fans and returns their teardowns. apply is
+           called before the swap, e.g. to update the algorithms of fans that are kept. Interfaces
+           that are not used anymore are torn down afterwards."""
+        async with self._cycle_lock:
+            interface_teardowns = dict(interface_teardowns)
+            replaced = [iid for iid, interface in interfaces.items()
+                        if iid in self.interfaces and self.interfaces[iid] is not interface]
+            if replaced:
+                if set_up_replacements is None:
+                    raise ValueError(f"Replacing interfaces {', '.join(replaced)} needs set_up_replacements")
+                interface_teardowns.update(await self._replace_interfaces(replaced, set_up_replacements))
+            if apply is not None:
+                apply()
+            old_interfaces, old_teardowns = self.interfaces, self.interface_teardowns
+            self.interfaces, self.sensors, self.fans = interfaces, sensors, fans
+            self.interface_teardowns = {
+                iid: interface_teardowns[iid] if iid in interface_teardowns else old_teardowns[iid]
+                for iid in interfaces
+            }
+            self._wire()
+            kept_sensors = set(sensors.values())
+            for sensor, task in list(self._sensor_tasks.items()):
+                if sensor not in kept_sensors:
+                    task.cancel()
+                    del self._sensor_tasks[sensor]
+            if self._running:
+                for sensor in kept_sensors:
+                    if sensor not in self._sensor_tasks:
+                        self._sensor_tasks[sensor] = sensor.create_task()
+            for fan in fans.values():
+                # the new wiring might select different algorithms
+                fan.needs_update = True
+            self.generation += 1
+
+        kept_interfaces = set(map(id, interfaces.values()))
+        for iid, interface in old_interfaces.items():
+            # replaced interfaces were already torn down
+            if id(interface) not in kept_interfaces and iid not in replaced:
+                await self._teardown(iid, old_teardowns[iid])
+
+    async def _replace_interfaces(self, replaced: list[str],
+                                  set_up: Callable[[], Awaitable[dict[str, TearDown]]]) -> dict[str, TearDown]:
+        """Tears down the replaced interfaces, then sets up their replacements.
+
+           If that fails, the replaced interfaces are set up again and the sensors that read
+           from them are restarted, so the controller keeps running unchanged."""
+        stopped = [sensor for sensor in self._sensor_tasks if sensor.interface_id in replaced]
+        for sensor in stopped:
+            self._sensor_tasks.pop(sensor).cancel()
+        for iid in replaced:
+            teardown = self.interface_teardowns.pop(iid, None)
+            if teardown is not None:
+                await self._teardown(iid, teardown)
+        try:
+            return await set_up()
+        except BaseException:
+            for iid in replaced:
+                try:
+                    self.interface_teardowns[iid] = await self.interfaces[iid].setup()
+                except Exception as e:
+                    logger.error("Could not set up interface %s again: %s", iid, e, exc_info=True)
+            if self._running:
+                for sensor in stopped:
+                    self._sensor_tasks[sensor] = sensor.create_task()
+            raise
+
+    @staticmethod
+    async def _teardown(iid: str, teardown: TearDown) -> None:
+        try:
+            await teardown()
+        except Exception as e:
+            logger.warning("Exception in interface %s teardown: %s", iid, e, exc_info=True)
 
     def stop(self) -> None:
         self.keep_running = False
 
+    def pause(self) -> None:
+        if not self.paused:
+            logger.info("Paused the algorithms")
+        self.paused = True
+
+    def resume(self) -> None:
+        if self.paused:
+            # fans that missed updates while paused still need them
+            logger.info("Resumed the algorithms")
+        self.paused = False
+
     async def setup(self) -> None:
-        self.interface_teardowns = {
-            iid: await setup for iid, setup in (
-                (iid, ensure_future(interface.setup())) for iid, interface in self.interfaces.items()
-            )
-        }
-        tasks = [asyncio.create_task(coro) for coro in chain(
-            (fan.setup() for fan in self.fans.values()),
-            (sensor.setup() for sensor in self.sensors.values()),
-        )]
+        """Sets up all interfaces concurrently, the sensors and fans of each as soon as it is ready"""
+        self.interface_teardowns = {}
+        self.setup_seconds = {}
+
+        async def setup_values(values: list[Union[Sensor, FanController]]) -> None:
+            tasks = [create_task(value.setup(), name=f"Set up {value.name}") for value in values]
+            if tasks:
+                await asyncio.wait(tasks)
+                raise_exceptions(tasks, logger)
+
+        # values without a known interface (None) don't have to wait for one
+        values_by_interface: dict[Optional[str], list[Union[Sensor, FanController]]] = {}
+        for value in chain(self.fans.values(), self.sensors.values()):
+            iid = value.interface_id if value.interface_id in self.interfaces else None
+            values_by_interface.setdefault(iid, []).append(value)
+
+        async def setup_interface(iid: str, interface: Interface) -> None:
+            started = time.perf_counter()
+            self.interface_teardowns[iid] = await interface.setup()
+            self.setup_seconds[iid] = time.perf_counter() - started
+            logger.info("Set up interface %s in %.0fms", iid, self.setup_seconds[iid] * 1000)
+            await setup_values(values_by_interface.get(iid, []))
+
+        tasks = [create_task(setup_interface(iid, interface), name=f"Set up interface {iid}")
+                 for iid, interface in self.interfaces.items()]
+        tasks.append(create_task(setup_values(values_by_interface.get(None, [])), name="Set up other values"))
         await asyncio.wait(tasks)
-        raise_exceptions(tasks, logger)
+        try:
+            raise_exceptions(tasks, logger)
+        except Exception:
+            for iid, teardown in self.interface_teardowns.items():
+                await self._teardown(iid, teardown)
+            self.interface_teardowns = {}
+            raise
 
     async def update_fans(self) -> None:
         for group_id, fan_group in enumerate(self.fans_ordered):
             pending_fans = [fan for fan in fan_group if fan.needs_update]
+            if self.paused:
+                pending_fans = [fan for fan in pending_fans if fan.override is not None]
             if not pending_fans:
                 logger.debug('No fans need updating in Fan Group %d', group_id)
                 continue
@@ -224,30 +524,68 @@ class Controller:
             await asyncio.wait(tasks)
             raise_exceptions(tasks, logger)
 
+    async def update_rpms(self) -> None:
+        """Reads the speed of all fans. Fan zones of the same interface share its readings
+           (e.g. a single `ipmitool sdr` scan), failures are logged and never affect the control."""
+        fans = list(self.fans.values())
+        results = await asyncio.gather(*(fan.update_rpm() for fan in fans), return_exceptions=True)
+        for fan, result in zip(fans, results):
+            if isinstance(result, Exception):
+                logger.warning("[Fan %s] Could not read the fan speed: %s", fan.name, result, exc_info=result)
+
+    async def run_rpm_updates(self) -> None:
+        while True:
+            await sleep(self.rpm_interval)
+            await self.update_rpms()
+
     async def run(self, cycle_callback: Callable[['Controller'], Awaitable] = None) -> None:
         try:
-            sensor_update_tasks = [sensor.create_task() for sensor in self.sensors.values()]
-            sleep_seconds = min(sensor.interval for sensor in self.sensors.values()).total_seconds()
+            self._running = True
+            self._sensor_tasks = {sensor: sensor.create_task() for sensor in self.sensors.values()}
+            if self.rpm_interval:
+                # off the critical path, the cycle only writes duties
+                self._rpm_task = create_task(self.run_rpm_updates(), name="Update fan speeds")
             while self.keep_running:
-                raise_exceptions(sensor_update_tasks, logger)
-
-                await self.update_fans()
-
-                if cycle_callback is not None:
-                    try:
-                        await cycle_callback(self)
-                    except CancelledError:
-                        raise
-                    except Exception as e:
-                        logger.warning("Exception in controller cycle callback: %s", e, exc_info=True)
-                        pass
-                await sleep(sleep_seconds)
+                async with self._cycle_lock:
+                    raise_exceptions(self._sensor_tasks.values(), logger)
+
+                    if self.update_fans_stats is None:
+                        await self.update_fans()
+                    else:
+                        await self.update_fans_stats.measure(self.update_fans())
+
+                    if cycle_callback is not None:
+                        try:
+                            await cycle_callback(self)
+                        except CancelledError:
+                            raise
+                        except Exception as e:
+                            logger.warning("Exception in controller cycle callback: %s", e, exc_info=True)
+                            pass
+                await sleep(self.sleep_seconds)
         finally:
+            self._running = False
+            if self._rpm_task is not None:
+                self._rpm_task.cancel()
+                self._rpm_task = None
             for iid, teardown in self.interface_teardowns.items():
-                try:
-                    await teardown()
-                except Exception as e:
-                    logger.warning("Exception in interface %s teardown: %s", iid, e, exc_info=True)
+                await self._teardown(iid, teardown)
+
+    def batch_duties(self, columns: BatchColumns) -> dict[str, Array]:
+        """Calculates the duties of all fans for all samples of columns at once.
+
+           Fans are evaluated in update order, so algorithms can reference other fans."""
+        for fan_group in self.fans_ordered:
+            for fan in fan_group:
+                columns.fans[fan.name] = fan.batch_duty(columns)
+        return {fan_id: columns.fans[fan_id] for fan_id in self.fans}
+
+    def get_state(self) -> dict:
+        """Last known values of all sensors and fans, as plain values that can be serialized"""
+        return {
+            'sensors': {sensor_id: sensor.get_state() for sensor_id, sensor in self.sensors.items()},
+            'fans': {fan_id: fan.get_state() for fan_id, fan in self.fans.items()},
+        }
 
     def get_log_state(self) -> Iterable[LabelledValueGroup]:
         for sensor in self.sensors.values():
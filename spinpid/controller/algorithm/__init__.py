@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import Union, Optional
+import math
+from typing import Union, Optional, Iterable, Any
 
-from .expression import Static, Expression
+from .expression import Static, Expression, BatchColumns, Array
 from ..values import LastKnownValues
 from ...util import clamp
 
@@ -25,6 +26,12 @@ class SensorValue(Expression):
             raise ValueError(f"No last known temperature value for sensor {self.sensor_id}")
         return value.value
 
+    def batch(self, columns: BatchColumns) -> Array:
+        values = columns.sensors.get(self.sensor_id)
+        if values is None:
+            raise ValueError(f"No values for sensor {self.sensor_id}")
+        return values
+
     def __str__(self):
         return f"sensors.{self.sensor_id}"
 
@@ -46,6 +53,12 @@ class FanDutyValue(Expression):
             raise ValueError(f"No last known duty value for fan {self.fan_id}")
         return value.value
 
+    def batch(self, columns: BatchColumns) -> Array:
+        values = columns.fans.get(self.fan_id)
+        if values is None:
+            raise ValueError(f"No duty values for fan {self.fan_id}")
+        return values
+
     def __str__(self):
         return f"fans.{self.fan_id}"
 
@@ -81,6 +94,10 @@ class Algorithm(Expression):
         self.min_duty = context.min_duty
         self.max_duty = context.max_duty
 
+    @property
+    def children(self) -> Iterable[Expression]:
+        return self.expression,
+
 
 class Polynomial(Algorithm):
     poly_degree: int
@@ -99,6 +116,13 @@ class Polynomial(Algorithm):
         raw = int(pow(value - self.start_temperature, self.poly_degree) * self.factor) + self.min_duty
         return clamp(raw, self.min_duty, self.max_duty)
 
+    def batch(self, columns: BatchColumns) -> Array:
+        import numpy
+        delta = numpy.maximum(self.expression.batch(columns) - self.start_temperature, 0)
+        # truncating like int() does, delta is never negative
+        raw = numpy.floor(numpy.power(delta, self.poly_degree) * self.factor).astype(numpy.int64) + self.min_duty
+        return numpy.clip(raw, self.min_duty, self.max_duty)
+
     def __str__(self):
         return f"""{self.__class__.__name__}({self.expression
         }, start_temperature={self.start_temperature
@@ -131,5 +155,29 @@ class LinearDecrease(Algorithm):
             self._min_duty = duty
             return duty
 
+    def get_state(self) -> dict[str, Any]:
+        return {'min_duty': self._min_duty}
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        min_duty = float(state['min_duty'])
+        if not math.isfinite(min_duty):
+            raise ValueError(f"Invalid min_duty {min_duty}")
+        # duties are whole percents
+        self._min_duty = int(clamp(min_duty, 0, 100))
+
+    def batch(self, columns: BatchColumns) -> Array:
+        import numpy
+        duties = self.expression.batch(columns)
+        result = duties.tolist()
+        max_decrease = self.max_decrease
+        min_duty = 0
+        for i, duty in enumerate(result):
+            if duty < min_duty:
+                min_duty -= max_decrease
+            else:
+                min_duty = duty
+            result[i] = min_duty
+        return numpy.array(result, dtype=duties.dtype)
+
     def __str__(self):
         return f"LinearDecrease({self.expression}, max_decrease={self.max_decrease})"
@@ -1,9 +1,32 @@
 from __future__ import annotations
 
+from functools import reduce
 from math import prod
-from typing import Type, Optional, Union
+from operator import add, mul
+from typing import Type, Optional, Union, Mapping, Any, Iterable, Iterator
 
 Value = Union[int, float, Type['Expression']]
+# numpy.ndarray, NumPy is only imported when batch evaluation is used
+Array = Any
+
+
+class BatchColumns:
+    """Input for batch evaluation of expressions.
+
+       Holds one array per sensor (and per fan, for expressions that reference other fans),
+       all sampled at the given times (in seconds)."""
+
+    def __init__(self, times: Array, sensors: Mapping[str, Array], fans: Optional[Mapping[str, Array]] = None,
+                 last_duty: Optional[Array] = None) -> None:
+        import numpy
+        self.times = numpy.asarray(times, dtype=float)
+        self.sensors = {name: numpy.asarray(values, dtype=float) for name, values in sensors.items()}
+        self.fans = dict(fans or {})
+        # duty the fan had before each sample, used by algorithms that depend on it (e.g. PID)
+        self.last_duty = last_duty
+
+    def __len__(self) -> int:
+        return len(self.times)
 
 
 class Expression:
@@ -19,6 +42,33 @@ class Expression:
     def value(self) -> int | float:
         raise NotImplementedError("Subclasses need to implement this")
 
+    def batch(self, columns: BatchColumns) -> Array:
+        """Evaluates the expression for all samples of columns at once and returns an array.
+
+           Batch evaluation always starts from a fresh state and does not change the state used
+           by value()."""
+        raise NotImplementedError(f"{self.__class__.__name__} does not support batch evaluation")
+
+    @property
+    def children(self) -> Iterable[Expression]:
+        """Expressions this one is calculated from"""
+        return ()
+
+    def walk(self) -> Iterator[Expression]:
+        """This expression and all expressions it is calculated from, depth first"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def get_state(self) -> Optional[dict[str, Any]]:
+        """State that value() depends on besides the current inputs (as plain values that can be
+           serialized), None for stateless expressions"""
+        return None
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        """Restores a state returned by get_state()"""
+        pass
+
     def __add__(self, other: Value) -> Expression:
         return Sum(self, Expression.wrap(other))
 
@@ -40,6 +90,10 @@ class Composite(Expression):
         self.referenced_sensors = frozenset(s for e in operands for s in e.referenced_sensors)
         self.referenced_fans = frozenset(f for e in operands for f in e.referenced_fans)
 
+    @property
+    def children(self) -> Iterable[Expression]:
+        return self.operands
+
     def __str__(self):
         joiner = f" {self.operator} "
         return f"({joiner.join(str(operand) for operand in self.operands)})"
@@ -54,6 +108,9 @@ class Sum(Composite):
     def value(self) -> int | float:
         return sum(operand.value() for operand in self.operands)
 
+    def batch(self, columns: BatchColumns) -> Array:
+        return reduce(add, (operand.batch(columns) for operand in self.operands))
+
     def __add__(self, other: Value):
         return Sum(*self.operands, Expression.wrap(other))
 
@@ -67,6 +124,9 @@ class Product(Composite):
     def value(self) -> int | float:
         return prod(operand.value() for operand in self.operands)
 
+    def batch(self, columns: BatchColumns) -> Array:
+        return reduce(mul, (operand.batch(columns) for operand in self.operands))
+
     def __mul__(self, other: Value):
         return Product(*self.operands, Expression.wrap(other))
 
@@ -81,5 +141,9 @@ class Static(Expression):
     def value(self) -> int | float:
         return self._value
 
+    def batch(self, columns: BatchColumns) -> Array:
+        import numpy
+        return numpy.full(len(columns), self._value)
+
     def __str__(self):
         return f"{self._value}"
@@ -1,5 +1,6 @@
 import inspect
-from typing import Callable, Iterable, Dict, Any
+from types import CodeType
+from typing import Callable, Iterable, Dict, Any, Optional
 
 from . import Expression, Static, Linear, Quadratic, LinearDecrease, AlgorithmContext, SensorValue, \
     FanDutyValue
@@ -53,6 +54,10 @@ class AlgorithmParser:
 
     def __init__(self, register_defaults: bool = True) -> None:
         self.algorithms = {}
+        # compiled algorithms by source and filename, can be saved and restored (see ConfigCache)
+        self.code_cache: dict[tuple[str, str], CodeType] = {}
+        # a global for each sensor and fan id, for the last known values and their names_version
+        self._names: Optional[tuple[LastKnownValues, int, dict[str, str]]] = None
         if register_defaults:
             self.register(Static)
             self.register(Linear)
@@ -75,11 +80,11 @@ class AlgorithmParser:
         if len(algo_str) > 500:
             raise InvalidAlgorithmExpression(f"{filename} code too long")
 
-        code = compile(algo_str, filename, 'eval')
-        eval_globals: dict[str, Any] = {}
-        # add a global for each sensor and fan id for easier reference (e.g. sensors[CPU])
-        eval_globals.update({name: name for name in last_known_values.sensor_temperature_values.keys()})
-        eval_globals.update({name: name for name in last_known_values.fan_duty_values.keys()})
+        code = self.code_cache.get((algo_str, filename))
+        if code is None:
+            code = self.code_cache[algo_str, filename] = compile(algo_str, filename, 'eval')
+        # a global for each sensor and fan id for easier reference (e.g. sensors[CPU])
+        eval_globals: dict[str, Any] = self._get_names(last_known_values).copy()
         eval_globals.update({name: alg.get_create_function(context) for name, alg in self.algorithms.items()})
         eval_globals['__builtins__'] = {}
         eval_globals['sensors'] = KnownValuesProxy(SensorValue, last_known_values)
@@ -90,6 +95,17 @@ class AlgorithmParser:
 
         return expression
 
+    def _get_names(self, last_known_values: LastKnownValues) -> dict[str, str]:
+        # building these for every algorithm would take quadratic time
+        if self._names is not None:
+            cached_values, version, names = self._names
+            if cached_values is last_known_values and version == last_known_values.names_version:
+                return names
+        names = {name: name for name in last_known_values.sensor_temperature_values.keys()}
+        names.update({name: name for name in last_known_values.fan_duty_values.keys()})
+        self._names = (last_known_values, last_known_values.names_version, names)
+        return names
+
     @property
     def algorithm_names(self) -> Iterable[str]:
         return self.algorithms.keys()
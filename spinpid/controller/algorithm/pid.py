@@ -1,8 +1,10 @@
-import time
+from typing import Optional, Any
 
 from . import AlgorithmContext, Algorithm
+from .expression import BatchColumns, Array
 from .. import Expression
 from ...util import clamp
+from ...util.asyncio import loop_time
 
 
 class PID(Algorithm):
@@ -14,7 +16,7 @@ class PID(Algorithm):
 
     last_term_i: float
 
-    last_time: float
+    last_time: Optional[float]
     last_error: float
 
     def __init__(self, expression: Expression, set_point: float, p: float = 4.0, i: float = 0.0, d: float = 40.0, windup_guard: float = 20.0,
@@ -31,12 +33,21 @@ class PID(Algorithm):
     def reset(self):
         self.last_term_i = 0.0
         
-        self.last_time = time.time()
+        self.last_time = None
         self.last_error = 0.0
     
+    def get_state(self) -> dict[str, Any]:
+        # the time only means something to the running event loop, so the first value() after
+        # restoring has no derivative term, like after a reset
+        return {'term_i': self.last_term_i}
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        self.reset()
+        self.last_term_i = float(state['term_i'])
+
     def value(self) -> int:
-        current_time = time.time()
-        delta_time = current_time - self.last_time
+        current_time = loop_time()
+        delta_time = current_time - self.last_time if self.last_time is not None else 0.0
         
         error = self.set_point - self.expression.value()
 
@@ -50,3 +61,34 @@ class PID(Algorithm):
         self.last_error = error
 
         return (self.context.last_duty or 100) - int(self.k_p * term_p + self.k_i * term_i + self.k_d * term_d)
+
+    def batch(self, columns: BatchColumns) -> Array:
+        """Runs the controller over all samples, starting with a reset state.
+
+           If columns has no last_duty, the (clamped) output of the previous sample is used
+           as the duty the fan had, i.e. the PID is assumed to be in control of the fan."""
+        import numpy
+        values = self.expression.batch(columns).tolist()
+        times = columns.times.tolist()
+        last_duties = columns.last_duty.tolist() if columns.last_duty is not None else None
+        set_point, k_p, k_i, k_d = self.set_point, self.k_p, self.k_i, self.k_d
+        windup_guard = self.windup_guard
+        min_duty, max_duty = self.min_duty, self.max_duty
+
+        result = [0] * len(values)
+        term_i, last_error, last_time, last_duty = 0.0, 0.0, None, 100
+        for i, value in enumerate(values):
+            current_time = times[i]
+            delta_time = current_time - last_time if last_time is not None else 0.0
+            error = set_point - value
+            term_i += clamp(error * delta_time, -windup_guard, windup_guard)
+            term_d = (error - last_error) / delta_time if delta_time > 0 else 0.0
+            last_time, last_error = current_time, error
+
+            if last_duties is not None:
+                last_duty = last_duties[i] or 100
+            duty = last_duty - int(k_p * error + k_i * term_i + k_d * term_d)
+            result[i] = duty
+            if last_duties is None:
+                last_duty = clamp(duty, min_duty, max_duty)
+        return numpy.array(result)
@@ -0,0 +1,170 @@
+"""Checkpoints the state of the controller, so that a restart continues where it stopped.
+
+A checkpoint holds the last duty of each fan, the last known temperatures and the state of
+stateful algorithms (e.g. the integral of a PID). It is written to a temporary file that is
+renamed over the previous checkpoint, so a crash while writing never leaves a broken one.
+
+Restoring happens before the setup of the controller: the duties become the last duty of the
+fans whose fan zone can't report its duty, the temperatures are replaced by the first reading
+of each sensor. The state of an algorithm is only restored if its configuration did not change
+in between, and the whole checkpoint only if it is younger than max_age."""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Optional, Any, TYPE_CHECKING
+
+from .. import VERSION
+from ..interfaces.sensor import Temperature
+from ..util.files import write_atomic
+
+if TYPE_CHECKING:
+    from . import Controller, FanAlgorithm
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['Checkpoint', 'DEFAULT_MAX_AGE']
+
+FORMAT = 1
+DEFAULT_MAX_AGE = 600.0
+
+
+def algorithm_state(alg: FanAlgorithm) -> Optional[list[Optional[dict[str, Any]]]]:
+    """States of all expressions of an algorithm, None if none of them has a state"""
+    states = [expression.get_state() for expression in alg.expression.walk()]
+    return states if any(state is not None for state in states) else None
+
+
+def restore_algorithm_state(alg: FanAlgorithm, states: list[Optional[dict[str, Any]]]) -> None:
+    expressions = list(alg.expression.walk())
+    if len(expressions) != len(states):
+        raise ValueError(f"Expected {len(expressions)} states, got {len(states)}")
+    for expression, state in zip(expressions, states):
+        if state is not None:
+            expression.set_state(state)
+
+
+def _duty(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 100:
+        raise ValueError(f"Invalid duty {value!r}")
+    return value
+
+
+class Checkpoint:
+    def __init__(self, controller: Controller, path: str, interval: float = 60.0,
+                 max_age: float = DEFAULT_MAX_AGE) -> None:
+        self.controller = controller
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        # a save that was cancelled keeps writing in its thread, it must not replace a newer checkpoint
+        self._write_lock = threading.Lock()
+        self._written = 0.0
+
+    def collect(self) -> dict[str, Any]:
+        """Current state of the controller as plain values, has to be called on the event loop"""
+        last_known_values = self.controller.last_known_values
+        # pinned temperatures were never read, a restart must not mistake them for readings
+        pinned = {sensor_id for sensor_id, sensor in self.controller.sensors.items() if sensor.pinned is not None}
+        return {
+            'format': FORMAT,
+            'version': VERSION,
+            'time': time.time(),
+            'sensors': {
+                sensor_id: {'temperature': float(value.value), 'label': value.value.label}
+                for sensor_id, value in last_known_values.sensor_temperature_values.items()
+                if value is not None and sensor_id not in pinned
+            },
+            'fans': {
+                fan_id: {
+                    'duty': fan.context.last_duty,
+                    'algorithms': {
+                        alg.name: {'source': alg.source, 'state': state}
+                        for alg in fan.algorithms if (state := algorithm_state(alg)) is not None
+                    },
+                }
+                for fan_id, fan in self.controller.fans.items()
+            },
+        }
+
+    def write(self, state: dict[str, Any]) -> None:
+        with self._write_lock:
+            if state['time'] < self._written:
+                return
+            write_atomic(self.path, json.dumps(state, separators=(',', ':')).encode())
+            self._written = state['time']
+
+    async def save(self) -> None:
+        state = self.collect()
+        # fsync can take a while on a busy disk
+        await asyncio.to_thread(self.write, state)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except OSError as e:
+                logger.warning("Could not write checkpoint %s: %s", self.path, e)
+
+    def restore(self) -> bool:
+        """Restores the checkpoint if there is a recent enough one, returns whether it did"""
+        try:
+            with open(self.path, 'rb') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", self.path, e)
+            return False
+        if not isinstance(state, dict) or state.get('format') != FORMAT:
+            logger.warning("Ignoring checkpoint %s with unknown format", self.path)
+            return False
+        try:
+            age = time.time() - float(state['time'])
+            # checked completely before anything is restored, so that a broken checkpoint changes nothing
+            temperatures = {sensor_id: Temperature(float(value['temperature']), str(value['label']))
+                            for sensor_id, value in state['sensors'].items()}
+            fans = {fan_id: (_duty(fan_state['duty']), dict(fan_state['algorithms']))
+                    for fan_id, fan_state in state['fans'].items()}
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning("Ignoring malformed checkpoint %s: %r", self.path, e)
+            return False
+        if not 0 <= age <= self.max_age:
+            logger.info("Ignoring checkpoint %s from %.0fs ago", self.path, age)
+            return False
+
+        last_known_values = self.controller.last_known_values
+        for sensor_id, temperature in temperatures.items():
+            if sensor_id in last_known_values.sensor_temperature_values:
+                last_known_values.set_sensor_temperature(sensor_id, temperature)
+                # not read by this process, shown as stale
+                last_known_values.sensor_temperature_values[sensor_id].was_displayed = True
+
+        restored = 0
+        for fan_id, (duty, algorithm_states) in fans.items():
+            fan = self.controller.fans.get(fan_id)
+            if fan is None:
+                continue
+            if duty is not None:
+                fan.context.last_duty = duty
+                last_known_values.set_fan_duty(fan_id, duty)
+                last_known_values.fan_duty_values[fan_id].was_displayed = True
+            algorithms = {alg.name: alg for alg in fan.algorithms}
+            for alg_id, alg_state in algorithm_states.items():
+                alg = algorithms.get(alg_id)
+                if alg is None or not isinstance(alg_state, dict) or alg.source != alg_state.get('source'):
+                    logger.info("[Fan %s] Not restoring the state of the changed algorithm %s", fan_id, alg_id)
+                    continue
+                try:
+                    restore_algorithm_state(alg, alg_state['state'])
+                    restored += 1
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning("[Fan %s] Could not restore the state of algorithm %s: %s", fan_id, alg_id, e)
+        logger.info("Restored checkpoint %s from %.0fs ago with the state of %d algorithms", self.path, age, restored)
+        return True
@@ -1,27 +1,49 @@
 from __future__ import annotations
 
+import asyncio
+import importlib
 import logging
+from graphlib import TopologicalSorter, CycleError
+from itertools import chain
+from typing import Optional, Iterable, Union
 
 from . import FanController, Expression, Controller, Interfaces, Sensors, Sensor, Fans, FanAlgorithm
 from .algorithm import AlgorithmContext
 from .algorithm.parser import AlgorithmParser
 from .values import LastKnownValues
 from ..config import Config, InterfacesConfig, SensorsConfig, InterfaceChannelRef, \
-    FansConfig
-from ..interfaces import Interface, SensorInterface, FanInterface
+    FansConfig, FanConfig
+from ..interfaces import Interface, SensorInterface, FanInterface, TearDown
+from ..interfaces.fan import FanZone
+from ..util.asyncio import raise_exceptions
 
 logger = logging.getLogger(__name__)
 
+HYSTERESIS_FIELDS = frozenset(('deadband', 'min_hold', 'bypass_increase'))
+
+
 class ConfigError(ValueError):
     pass
 
 
+def import_driver(name: str) -> type:
+    """Imports a driver by its name, e.g. spinpid.interfaces.ipmi.IPMI or spinpid.interfaces.ipmi:IPMI"""
+    module_name, _, attribute = name.replace(':', '.').rpartition('.')
+    if not module_name:
+        raise ConfigError(f"Invalid driver {name}, expected module.Class")
+    try:
+        return getattr(importlib.import_module(module_name), attribute)
+    except (ImportError, AttributeError) as e:
+        raise ConfigError(f"Could not import driver {name}: {e}\n"
+                          f"If the name is correct, you may need to install additional dependencies.") from e
+
+
 def build_interfaces(interfaces_config: InterfacesConfig, **kwargs) -> Interfaces:
     result: Interfaces = {}
     for id, config in interfaces_config.items():
         driver_args = kwargs.copy()
         driver_args.update(config)
-        driver = driver_args.pop('driver')
+        driver = import_driver(driver_args.pop('driver'))
         interface = driver(**driver_args)
         if not isinstance(interface, Interface):
             raise ConfigError(f"Driver {driver} did not return an Interface")
@@ -29,12 +51,16 @@ def build_interfaces(interfaces_config: InterfacesConfig, **kwargs) -> Interface
     return result
 
 
+def get_interface_id(ref: str | InterfaceChannelRef) -> str:
+    return ref if isinstance(ref, str) else ref['id']
+
+
 def get_interface(ref: str | InterfaceChannelRef, interfaces: Interfaces) -> (Interface, dict[str, any]):
     if isinstance(ref, str):
         ref = {'id': ref}
     interface_args = ref.copy()
     interface_id = interface_args.pop('id')
-    interface = interfaces[interface_id]
+    interface = interfaces.get(interface_id)
     if interface is None:
         raise ConfigError(f"Interface {interface_id} not found")
     return interface, interface_args
@@ -51,10 +77,16 @@ def build_sensors(sensors_config: SensorsConfig, interfaces: Interfaces, last_kn
         logger.debug("Configuring sensor %s from %s with args %s", sensor_id, interface, sensor_args)
         sensor = interface.get_sensor(**sensor_args)
         result[sensor_id] = Sensor(sensor_id, sensor, last_known_values=last_known_values,
-                                   interval=config.interval, show_single_values=config.show_single_values)
+                                   interval=config.interval, show_single_values=config.show_single_values,
+                                   interface_id=get_interface_id(config.interface))
     return result
 
 
+def configure_fan_zone(fan_zone: FanZone, config: FanConfig) -> None:
+    fan_zone.set_hysteresis(deadband=config.deadband, min_hold=config.min_hold.total_seconds(),
+                            bypass_increase=config.bypass_increase)
+
+
 def build_fans(
         fans: FansConfig,
         interfaces: Interfaces,
@@ -69,6 +101,7 @@ def build_fans(
             raise ConfigError(f"Interface {config.interface} does not provide fans")
         logger.debug("Configuring fan %s from %s with args %s", fan_id, interface, fan_args)
         fan_zone = interface.get_fan_zone(**fan_args)
+        configure_fan_zone(fan_zone, config)
 
         context = AlgorithmContext(min_duty=config.min_duty, max_duty=config.max_duty)
 
@@ -76,15 +109,21 @@ def build_fans(
         for alg_id, algorithm in config.algorithms.items():
             expression = algorithm_parser.parse(algorithm, context, last_known_values,
                                                filename=f"<fan {fan_id} algorithm {alg_id}>")
-            algorithms.add(FanAlgorithm(name=alg_id, fan_name=fan_id, expression=expression))
-        fan_controller = FanController(fan_id, fan_zone, frozenset(algorithms), context, last_known_values)
+            algorithms.add(FanAlgorithm(name=alg_id, fan_name=fan_id, expression=expression, source=algorithm))
+        fan_controller = FanController(fan_id, fan_zone, frozenset(algorithms), context, last_known_values,
+                                       interface_id=get_interface_id(config.interface))
         result[fan_id] = fan_controller
 
     return result
 
 
-def build_controller(config: Config, algorithm_parser: AlgorithmParser, dry_run: bool = False) -> Controller:
-    interfaces = build_interfaces(config.interfaces, dry_run=dry_run)
+def build_controller(config: Config, algorithm_parser: AlgorithmParser, dry_run: bool = False,
+                     interfaces: Optional[Interfaces] = None) -> Controller:
+    """Builds a controller from the configuration.
+
+       If interfaces are passed, they are used instead of the ones from the configuration."""
+    if interfaces is None:
+        interfaces = build_interfaces(config.interfaces, dry_run=dry_run)
     # TODO: init interfaces? Is this different from setup?
 
     last_known_values = LastKnownValues(sensor_names=config.sensors.keys(), fan_names=config.fans.keys())
@@ -93,3 +132,201 @@ def build_controller(config: Config, algorithm_parser: AlgorithmParser, dry_run:
     fans = build_fans(config.fans, interfaces, last_known_values, algorithm_parser)
 
     return Controller(interfaces, sensors, fans, last_known_values)
+
+
+def _parse_algorithms(fan_id: str, algorithms: dict[str, str], context: AlgorithmContext,
+                      last_known_values: LastKnownValues, algorithm_parser: AlgorithmParser) -> set[FanAlgorithm]:
+    return {
+        FanAlgorithm(name=alg_id, fan_name=fan_id,
+                     expression=algorithm_parser.parse(algorithm, context, last_known_values,
+                                                       filename=f"<fan {fan_id} algorithm {alg_id}>"),
+                     source=algorithm)
+        for alg_id, algorithm in algorithms.items()
+    }
+
+
+def _check_references(sensor_ids: Iterable[str], fan_algorithms: dict[str, Iterable[FanAlgorithm]]) -> None:
+    sensor_ids = set(sensor_ids)
+    for fan_id, algorithms in fan_algorithms.items():
+        for alg in algorithms:
+            for sensor_id in alg.referenced_sensors - sensor_ids:
+                raise ConfigError(f"Algorithm {alg.name} of fan {fan_id} references unknown sensor {sensor_id}")
+            for other_fan_id in alg.referenced_fans - fan_algorithms.keys():
+                raise ConfigError(f"Algorithm {alg.name} of fan {fan_id} references unknown fan {other_fan_id}")
+    try:
+        TopologicalSorter({
+            fan_id: {other for alg in algorithms for other in alg.referenced_fans}
+            for fan_id, algorithms in fan_algorithms.items()
+        }).prepare()
+    except CycleError as e:
+        raise ConfigError(f"Fans reference each other in a cycle: {' -> '.join(e.args[1])}") from e
+
+
+async def _set_up_values(values: Iterable[Union[Sensor, FanController]]) -> None:
+    tasks = [asyncio.create_task(value.setup(), name=f"Set up {value.name}") for value in values]
+    if tasks:
+        await asyncio.wait(tasks)
+        raise_exceptions(tasks, logger)
+
+
+async def _tear_down(teardowns: dict[str, TearDown]) -> None:
+    for iid, teardown in teardowns.items():
+        try:
+            await teardown()
+        except Exception as e:
+            logger.warning("Exception in interface %s teardown: %s", iid, e, exc_info=True)
+
+
+async def reload_controller(controller: Controller, old_config: Config, new_config: Config,
+                            algorithm_parser: AlgorithmParser, dry_run: bool = False) -> list[str]:
+    """Applies new_config to a running controller, rebuilding only what changed.
+
+       Unchanged interfaces keep their session, unchanged algorithms keep their state. Only
+       interfaces whose configuration changed are rebuilt (with all their sensors and fans),
+       changed sensors and fans get new ones from their running interface. New interfaces, sensors
+       and fans are set up before the controller swaps them in between two cycles. A rebuilt
+       interface is only set up once the one it replaces is torn down, so the two never run side
+       by side (e.g. the new one would save the fan mode set by the old one as the one to
+       restore). If anything fails, the controller keeps running unchanged. Returns the changes."""
+    changes: list[str] = []
+    old_interfaces, old_sensors, old_fans = old_config.interfaces, old_config.sensors, old_config.fans
+
+    rebuilt_interfaces = {iid for iid, config in new_config.interfaces.items() if old_interfaces.get(iid) != config}
+    changed_sensors = {sensor_id for sensor_id, config in new_config.sensors.items()
+                       if old_sensors.get(sensor_id) != config}
+    moved_fans = {fan_id for fan_id, config in new_config.fans.items()
+                  if fan_id in old_fans and old_fans[fan_id].interface != config.interface}
+    for config in chain(new_config.sensors.values(), new_config.fans.values()):
+        if get_interface_id(config.interface) not in new_config.interfaces:
+            raise ConfigError(f"Interface {get_interface_id(config.interface)} not found")
+
+    for iid in rebuilt_interfaces:
+        changes.append(f"{'rebuilt' if iid in controller.interfaces else 'added'} interface {iid}")
+    changes.extend(f"removed interface {iid}" for iid in controller.interfaces if iid not in new_config.interfaces)
+
+    new_interfaces = build_interfaces({iid: new_config.interfaces[iid] for iid in rebuilt_interfaces},
+                                      dry_run=dry_run)
+    interfaces: Interfaces = {iid: new_interfaces[iid] if iid in new_interfaces else controller.interfaces[iid]
+                              for iid in new_config.interfaces}
+
+    last_known_values = controller.last_known_values
+    last_known_values.add_names(new_config.sensors.keys(), new_config.fans.keys())
+    teardowns: dict[str, TearDown] = {}
+    try:
+        rebuilt_sensors = build_sensors({
+            sensor_id: config for sensor_id, config in new_config.sensors.items()
+            if sensor_id in changed_sensors or get_interface_id(config.interface) in rebuilt_interfaces
+        }, interfaces, last_known_values)
+        sensors: Sensors = {sensor_id: rebuilt_sensors.get(sensor_id) or controller.sensors[sensor_id]
+                            for sensor_id in new_config.sensors}
+        for sensor_id in rebuilt_sensors:
+            changes.append(f"{'rebuilt' if sensor_id in controller.sensors else 'added'} sensor {sensor_id}")
+        changes.extend(f"removed sensor {sensor_id}" for sensor_id in controller.sensors if sensor_id not in sensors)
+
+        rebuilt_fans = build_fans({
+            fan_id: config for fan_id, config in new_config.fans.items()
+            if fan_id not in controller.fans
+        }, interfaces, last_known_values, algorithm_parser)
+        # fans that are kept, with their new algorithms and context
+        updated_fans: dict[str, tuple[frozenset[FanAlgorithm], AlgorithmContext]] = {}
+        hysteresis_fans: dict[str, FanConfig] = {}
+        for fan_id, config in new_config.fans.items():
+            fan = controller.fans.get(fan_id)
+            if fan is None:
+                changes.append(f"added fan {fan_id}")
+                continue
+            old_config_algorithms = old_fans[fan_id].algorithms
+            context = fan.context
+            if (config.min_duty, config.max_duty) != (old_fans[fan_id].min_duty, old_fans[fan_id].max_duty):
+                # algorithms copy the limits of their context, so they all have to be rebuilt
+                context = AlgorithmContext(min_duty=config.min_duty, max_duty=config.max_duty)
+                context.last_duty = fan.context.last_duty
+                old_config_algorithms = {}
+                changes.append(f"changed duty limits of fan {fan_id} to {context.min_duty}-{context.max_duty}%")
+            kept = {alg for alg in fan.algorithms
+                    if old_config_algorithms.get(alg.name) == config.algorithms.get(alg.name)}
+            kept_names = {alg.name for alg in kept}
+            algorithms = frozenset(kept | _parse_algorithms(
+                fan_id, {alg_id: alg for alg_id, alg in config.algorithms.items() if alg_id not in kept_names},
+                context, last_known_values, algorithm_parser))
+            for alg_id in sorted(config.algorithms.keys() - kept_names):
+                changes.append(f"{'changed' if alg_id in old_fans[fan_id].algorithms else 'added'} algorithm "
+                               f"{alg_id} of fan {fan_id}")
+            changes.extend(f"removed algorithm {alg_id} of fan {fan_id}"
+                           for alg_id in sorted(old_fans[fan_id].algorithms.keys() - config.algorithms.keys()))
+
+            if fan_id in moved_fans or get_interface_id(config.interface) in rebuilt_interfaces:
+                [interface, fan_args] = get_interface(config.interface, interfaces)
+                if not isinstance(interface, FanInterface):
+                    raise ConfigError(f"Interface {config.interface} does not provide fans")
+                fan_zone = interface.get_fan_zone(**fan_args)
+                configure_fan_zone(fan_zone, config)
+                rebuilt_fans[fan_id] = FanController(fan_id, fan_zone, algorithms, context, last_known_values,
+                                                     interface_id=get_interface_id(config.interface))
+                changes.append(f"rebuilt fan {fan_id}")
+                continue
+            if any(getattr(config, field) != getattr(old_fans[fan_id], field) for field in HYSTERESIS_FIELDS):
+                hysteresis_fans[fan_id] = config
+                changes.append(f"changed hysteresis of fan {fan_id}")
+            if algorithms != fan.algorithms:
+                updated_fans[fan_id] = (algorithms, context)
+        fans: Fans = {fan_id: rebuilt_fans.get(fan_id) or controller.fans[fan_id] for fan_id in new_config.fans}
+        changes.extend(f"removed fan {fan_id}" for fan_id in controller.fans if fan_id not in fans)
+
+        _check_references(sensors.keys(), {fan_id: updated_fans[fan_id][0] if fan_id in updated_fans else fan.algorithms
+                                           for fan_id, fan in fans.items()})
+        if not changes:
+            last_known_values.retain_names(old_sensors.keys(), old_fans.keys())
+            return changes
+
+        # interfaces that replace a running one are set up by the controller, see set_up_replacements()
+        replaced_interfaces = {iid: interface for iid, interface in new_interfaces.items()
+                               if iid in controller.interfaces}
+        for iid, interface in new_interfaces.items():
+            if iid not in replaced_interfaces:
+                teardowns[iid] = await interface.setup()
+        await _set_up_values(value for value in chain(rebuilt_fans.values(), rebuilt_sensors.values())
+                             if value.interface_id not in replaced_interfaces)
+    except BaseException:
+        await _tear_down(teardowns)
+        last_known_values.retain_names(old_sensors.keys(), old_fans.keys())
+        raise
+
+    async def set_up_replacements() -> dict[str, TearDown]:
+        """Sets up the rebuilt interfaces with their sensors and fans, once the old ones are torn down"""
+        replacement_teardowns: dict[str, TearDown] = {}
+        try:
+            for iid, interface in replaced_interfaces.items():
+                replacement_teardowns[iid] = await interface.setup()
+            await _set_up_values(value for value in chain(rebuilt_fans.values(), rebuilt_sensors.values())
+                                 if value.interface_id in replaced_interfaces)
+        except BaseException:
+            await _tear_down(replacement_teardowns)
+            raise
+        return replacement_teardowns
+
+    def apply() -> None:
+        for fan_id, config in hysteresis_fans.items():
+            configure_fan_zone(controller.fans[fan_id].fan_zone, config)
+        for fan_id, (algorithms, context) in updated_fans.items():
+            fan = controller.fans[fan_id]
+            fan.algorithms, fan.context = algorithms, context
+            fan.min_duty, fan.max_duty = context.min_duty, context.max_duty
+        # operator overrides and pins outlive the objects they were made on
+        for fan_id, fan in rebuilt_fans.items():
+            old_fan = controller.fans.get(fan_id)
+            if old_fan is not None and old_fan.override is not None:
+                fan.set_override(old_fan.override, old_fan.override_for)
+        for sensor_id, sensor in rebuilt_sensors.items():
+            old_sensor = controller.sensors.get(sensor_id)
+            if old_sensor is not None and old_sensor.pinned is not None:
+                sensor.pin(float(old_sensor.pinned), old_sensor.pinned_for)
+
+    try:
+        await controller.reconfigure(interfaces, teardowns, sensors, fans, apply, set_up_replacements)
+    except BaseException:
+        await _tear_down(teardowns)
+        last_known_values.retain_names(old_sensors.keys(), old_fans.keys())
+        raise
+    last_known_values.retain_names(new_config.sensors.keys(), new_config.fans.keys())
+    return changes
@@ -0,0 +1,150 @@
+"""JSON lines telemetry of the controller, one object per control cycle:
+
+    {"monotonic":12.5,"time":1760000000.1,
+     "sensors":{"HDDs":{"value":35.2,"stale":false,"values":{"⌀":35.2,"da0":34.0,...}},...},
+     "fans":{"CPU":{"duty":40,"stale":false,"rpm":{"FAN1":900},"algorithm":"pid","override":false},...}}
+
+The keys of all sensors and fans are encoded once, the values of a sensor only when it was
+updated since the last line (sensors are usually updated less often than the fans). Taking a
+snapshot on the event loop only collects the values, encoding them can then happen in another
+thread. Each snapshot carries the layout it was taken with, so lines queued before a
+configuration reload are still encoded with the sensors and fans they were taken from."""
+from __future__ import annotations
+
+import json
+import math
+import time
+from typing import Optional, Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import Controller
+
+__all__ = ['JsonLinesEncoder']
+
+SensorSnapshot = Optional[tuple[Any, bool]]
+FanSnapshot = Optional[tuple[Any, bool, list[int], list[str], Optional[str], bool]]
+Snapshot = tuple[float, float, list[SensorSnapshot], list[FanSnapshot], '_Layout']
+
+
+def encode_number(value) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, int):
+        return int.__repr__(value)
+    # float.__repr__, Temperature is a float with its own __repr__
+    return float.__repr__(float(value)) if math.isfinite(value) else 'null'
+
+
+def encode_key(key: str) -> str:
+    return json.dumps(key, ensure_ascii=False)
+
+
+# the C encoder, for the single values of a sensor
+encode_values = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), allow_nan=False).encode
+
+
+class _Layout:
+    """Sensors and fans of one configuration of the controller, with their encoded keys"""
+
+    def __init__(self, controller: Controller) -> None:
+        self.generation = controller.generation
+        self.sensors = list(controller.sensors.values())
+        self.fans = list(controller.fans.values())
+
+        self.sensor_keys = [encode_key(sensor.name) + ':{"value":' for sensor in self.sensors]
+        self.fan_keys = [encode_key(fan.name) + ':{"duty":' for fan in self.fans]
+        # fan zones can discover their fans with the first reading (e.g. IPMI), see snapshot()
+        self.rpm_keys = [self.encode_rpm_keys(fan) for fan in self.fans]
+        # last temperature of each sensor and its encoded value and single values
+        self.sensor_cache: list[Optional[tuple[Any, str, str]]] = [None] * len(self.sensors)
+
+    @staticmethod
+    def encode_rpm_keys(fan) -> list[str]:
+        return [encode_key(f.name) + ':' for f in fan.fan_zone.fans]
+
+
+class JsonLinesEncoder:
+    def __init__(self, controller: Controller) -> None:
+        self.controller = controller
+        self.last_known_values = controller.last_known_values
+        self._layout = _Layout(controller)
+        # labels of single values can change, e.g. when a disk is added
+        self._strings: dict[str, str] = {}
+
+    def snapshot(self) -> Snapshot:
+        """Collects the current values, marks them as displayed like the table output does"""
+        layout = self._layout
+        if layout.generation != self.controller.generation:
+            layout = self._layout = _Layout(self.controller)
+        sensor_values = self.last_known_values.sensor_temperature_values
+        fan_values = self.last_known_values.fan_duty_values
+        sensors: list[SensorSnapshot] = []
+        for sensor in layout.sensors:
+            value = sensor_values[sensor.name]
+            if value is None:
+                sensors.append(None)
+            else:
+                sensors.append((value.value, value.was_displayed))
+                value.was_displayed = True
+        fans: list[FanSnapshot] = []
+        for i, fan in enumerate(layout.fans):
+            value = fan_values[fan.name]
+            if value is None:
+                fans.append(None)
+            else:
+                zone_fans = fan.fan_zone.fans
+                rpm_keys = layout.rpm_keys[i]
+                if len(rpm_keys) != len(zone_fans):
+                    # a new list, snapshots that are still queued keep the keys of their RPMs
+                    rpm_keys = layout.rpm_keys[i] = layout.encode_rpm_keys(fan)
+                overridden = fan.override is not None
+                fans.append((value.value, value.was_displayed, [f.rpm for f in zone_fans], rpm_keys,
+                             None if overridden else fan.winning_algorithm, overridden))
+                value.was_displayed = True
+        return time.monotonic(), time.time(), sensors, fans, layout
+
+    def _string(self, s: str) -> str:
+        encoded = self._strings.get(s)
+        if encoded is None:
+            encoded = self._strings[s] = encode_key(s)
+        return encoded
+
+    def _encode_values(self, temperature) -> str:
+        try:
+            return encode_values(dict(temperature))
+        except ValueError:
+            # NaN or infinity, encoded as null
+            return '{' + ','.join(encode_key(label) + ':' + encode_number(value) for label, value in temperature) + '}'
+
+    def encode(self, snapshot: Snapshot) -> str:
+        monotonic, wall_clock, sensors, fans, layout = snapshot
+        sensor_cache = layout.sensor_cache
+        parts = ['{"monotonic":', encode_number(monotonic), ',"time":', encode_number(wall_clock), ',"sensors":{']
+        for i, (key, sensor) in enumerate(zip(layout.sensor_keys, sensors)):
+            if i:
+                parts.append(',')
+            parts.append(key)
+            if sensor is None:
+                parts.append('null,"stale":true,"values":{}}')
+                continue
+            temperature, stale = sensor
+            cached = sensor_cache[i]
+            if cached is None or cached[0] is not temperature:
+                cached = sensor_cache[i] = (temperature, encode_number(temperature),
+                                            self._encode_values(temperature))
+            parts += (cached[1], ',"stale":', 'true' if stale else 'false', ',"values":', cached[2], '}')
+        parts.append('},"fans":{')
+        for i, (key, fan) in enumerate(zip(layout.fan_keys, fans)):
+            if i:
+                parts.append(',')
+            parts.append(key)
+            if fan is None:
+                parts.append('null,"stale":true,"rpm":{},"algorithm":null,"override":false}')
+                continue
+            duty, stale, rpms, rpm_keys, algorithm, overridden = fan
+            parts += (encode_number(duty), ',"stale":', 'true' if stale else 'false', ',"rpm":{',
+                      ','.join(rpm_key + encode_number(rpm) for rpm_key, rpm in zip(rpm_keys, rpms)),
+                      '},"algorithm":', 'null' if algorithm is None else self._string(algorithm),
+                      ',"override":', 'true' if overridden else 'false', '}')
+        parts.append('}}')
+        return ''.join(parts)
@@ -25,6 +25,25 @@ class LastKnownValues:
     def __init__(self, sensor_names: Iterable[str], fan_names: Iterable[str]) -> None:
         self.sensor_temperature_values = {name: None for name in sensor_names}
         self.fan_duty_values = {name: None for name in fan_names}
+        # incremented whenever sensors or fans are added or removed
+        self.names_version = 0
+
+    def add_names(self, sensor_names: Iterable[str], fan_names: Iterable[str]) -> None:
+        """Adds sensors and fans that don't have a value yet, keeps the existing ones"""
+        for name in sensor_names:
+            self.sensor_temperature_values.setdefault(name, None)
+        for name in fan_names:
+            self.fan_duty_values.setdefault(name, None)
+        self.names_version += 1
+
+    def retain_names(self, sensor_names: Iterable[str], fan_names: Iterable[str]) -> None:
+        """Removes all sensors and fans that are not in the given names"""
+        sensor_names, fan_names = set(sensor_names), set(fan_names)
+        for name in [name for name in self.sensor_temperature_values if name not in sensor_names]:
+            del self.sensor_temperature_values[name]
+        for name in [name for name in self.fan_duty_values if name not in fan_names]:
+            del self.fan_duty_values[name]
+        self.names_version += 1
 
     def set_fan_duty(self, fan_id: str, duty: int | float) -> None:
         if fan_id not in self.fan_duty_values:
@@ -0,0 +1,150 @@
+"""Live dashboard of a running controller, served by the built-in HTTP server.
+
+The page receives the state over Server-Sent Events. The state is only encoded when a
+sensor or fan published an update since the last frame and clients are waiting for one,
+at most once per controller cycle, and the same encoded frame is sent to all clients.
+Clients never cause sensors to be read.
+
+With a sample store, /history?kind=sensor&name=HDDs&hours=24 returns the min/mean/max of
+a channel, in a resolution that fits the time range."""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncGenerator, Optional, TYPE_CHECKING
+
+from ..controller import PubSubValue
+from ..util.http import Request, Response, Handler
+
+if TYPE_CHECKING:
+    from ..controller import Controller
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['Dashboard']
+
+INDEX_FILE = os.path.join(os.path.dirname(__file__), 'index.html')
+
+
+def encode_state(state: dict) -> bytes:
+    return json.dumps(state, separators=(',', ':')).encode()
+
+
+def encode_event(state: dict) -> bytes:
+    # compact JSON never contains a newline, so it fits into a single data line
+    return b'data: ' + encode_state(state) + b'\n\n'
+
+
+class ChangeListener(PubSubValue):
+    """Subscribes to sensors and fans, only remembers that one of them published an update"""
+
+    def __init__(self) -> None:
+        super().__init__(name='Dashboard')
+        self.changed = True
+
+    def publish_value_update(self, needs_update: bool = False) -> None:
+        self.changed = True
+
+
+class Dashboard:
+    def __init__(self, controller: Controller, keepalive: float = 15.0, store_path: Optional[str] = None) -> None:
+        self.controller = controller
+        self.keepalive = keepalive
+        self.store_path = store_path
+        self.clients = 0
+        self._listener = ChangeListener()
+        controller.subscribe_all(self._listener)
+        self._frame: Optional[bytes] = None
+        # resolved with the next frame, only exists while clients are waiting for one
+        self._next_frame: Optional[asyncio.Future] = None
+        self._closed = False
+        with open(INDEX_FILE, 'rb') as f:
+            self._index = f.read()
+
+    @property
+    def routes(self) -> dict[str, Handler]:
+        routes = {'/': self.handle_index, '/state': self.handle_state, '/events': self.handle_events}
+        if self.store_path is not None:
+            routes['/history'] = self.handle_history
+        return routes
+
+    async def handle_index(self, request: Request) -> Response:
+        return Response(body=self._index, content_type='text/html; charset=utf-8')
+
+    async def handle_state(self, request: Request) -> Response:
+        return Response(body=encode_state(self.controller.get_state()), content_type='application/json')
+
+    async def handle_events(self, request: Request) -> Response:
+        return Response(content_type='text/event-stream', stream=self._stream())
+
+    async def handle_history(self, request: Request) -> Response:
+        def argument(name: str, default: Optional[str] = None) -> Optional[str]:
+            return request.query.get(name, [default])[0]
+
+        try:
+            kind, name, label = argument('kind', 'sensor'), argument('name'), argument('label')
+            hours = float(argument('hours', '24'))
+        except ValueError:
+            return Response(400, b'hours must be a number\n')
+        if name is None:
+            return Response(400, b'name is required\n')
+        # SQLite blocks, query in another thread with a connection of its own
+        rollups = await asyncio.to_thread(self._query_history, kind, name, label, hours)
+        return Response(body=encode_state(rollups), content_type='application/json')
+
+    def _query_history(self, kind: str, name: str, label: Optional[str], hours: float) -> dict:
+        # only loads sqlite3 when the history is requested
+        from ..trace.store import SampleStoreReader
+        end = time.time()
+        start = end - hours * 3600
+        with SampleStoreReader(self.store_path) as reader:
+            resolution = reader.resolution_for(start, end)
+            rollups = reader.rollups(kind, name, label, start, end, resolution)
+        return {'resolution': resolution, **rollups._asdict()}
+
+    def publish(self) -> None:
+        """Sends the state to all waiting clients if it changed, called once per controller cycle"""
+        if self._next_frame is not None:
+            self._update_frame()
+
+    def close(self) -> None:
+        """Ends all event streams"""
+        self._closed = True
+        if self._next_frame is not None:
+            self._next_frame.set_result(None)
+            self._next_frame = None
+
+    def _update_frame(self) -> bytes:
+        if self._listener.changed or self._frame is None:
+            self._listener.changed = False
+            frame = encode_event(self.controller.get_state())
+            if frame != self._frame:
+                self._frame = frame
+                if self._next_frame is not None:
+                    self._next_frame.set_result(frame)
+                    self._next_frame = None
+        return self._frame
+
+    async def _stream(self) -> AsyncGenerator[bytes, None]:
+        self.clients += 1
+        logger.debug("Dashboard client connected, %d connected", self.clients)
+        try:
+            yield self._update_frame()
+            while not self._closed:
+                if self._next_frame is None:
+                    self._next_frame = asyncio.get_running_loop().create_future()
+                try:
+                    frame = await asyncio.wait_for(asyncio.shield(self._next_frame), self.keepalive)
+                except asyncio.TimeoutError:
+                    # a comment, lets proxies and the browser know that the connection is still alive
+                    yield b': keepalive\n\n'
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.clients -= 1
+            logger.debug("Dashboard client disconnected, %d connected", self.clients)
@@ -2,8 +2,13 @@ import logging
 from abc import ABC, abstractmethod
 from typing import Collection, Optional
 
+from spinpid.util.asyncio import loop_time
+
 logger = logging.getLogger(__name__)
 
+# increases by at least this much are written right away, regardless of the hysteresis
+DEFAULT_BYPASS_INCREASE = 10
+
 class Fan:
     rpm: int
 
@@ -28,6 +33,39 @@ class FanZone(ABC):
         self.name = zone_name
         self.dry_run = dry_run
         self._last_duty = None
+        self.deadband = 0
+        self.min_hold = 0.0
+        self.bypass_increase: Optional[int] = DEFAULT_BYPASS_INCREASE
+        self._last_change: Optional[float] = None
+        # writes skipped because of the deadband or min_hold
+        self.skipped_writes = 0
+
+    def set_hysteresis(self, deadband: int = 0, min_hold: float = 0.0,
+                       bypass_increase: Optional[int] = DEFAULT_BYPASS_INCREASE) -> None:
+        """Only writes decreases by at least deadband, and at most one change every min_hold seconds.
+
+           Increases are never held back by the deadband, those by at least bypass_increase and to
+           100% not even by min_hold, so that cooling is never delayed when it matters. Decreases to
+           the minimum duty of the fan ignore the deadband as well, so the duty settles on it."""
+        self.deadband = deadband
+        self.min_hold = min_hold
+        self.bypass_increase = bypass_increase
+
+    @property
+    def last_duty(self) -> Optional[int]:
+        """The last duty that was set"""
+        return self._last_duty
+
+    def _hold(self, duty: int, min_duty: int) -> bool:
+        last_duty = self._last_duty
+        if last_duty is None:
+            return False
+        increase = duty - last_duty
+        if (duty == 100 and increase > 0) or (self.bypass_increase is not None and increase >= self.bypass_increase):
+            return False
+        if -self.deadband < increase < 0 and duty > min_duty:
+            return True
+        return self.min_hold > 0 and self._last_change is not None and loop_time() - self._last_change < self.min_hold
 
     @abstractmethod
     async def get_duty(self) -> Optional[int]:
@@ -38,15 +76,21 @@ class FanZone(ABC):
     async def _do_set_duty(self, duty: int) -> None:
         raise NotImplementedError
 
-    async def set_duty(self, duty: int, force: bool = False) -> None:
+    async def set_duty(self, duty: int, force: bool = False, hold: bool = True, min_duty: int = 0) -> None:
         """Set the duty parameter of the zone.
 
-           If force is true, set duty even if it's the same values as the last call
+           If force is true, set duty even if it's the same values as the last call.
+           If hold is false, set duty regardless of the hysteresis (see set_hysteresis()),
+           min_duty is the lowest duty the fan is run at.
         """
         assert 0 <= duty <= 100
         if not force and duty == self._last_duty:
             logger.debug("[%s] %sDuty is already at %d", self.name, "(dry-run) " if self.dry_run else "", duty)
             return
+        if not force and hold and self._hold(duty, min_duty):
+            self.skipped_writes += 1
+            logger.debug("[%s] Holding duty at %d instead of %d", self.name, self._last_duty, duty)
+            return
 
         if self.dry_run:
             logger.info("[%s] (dry-run) Would set duty to %d", self.name, duty)
@@ -54,6 +98,7 @@ class FanZone(ABC):
             logger.debug("[%s] Setting duty to %d", self.name, duty)
             await self._do_set_duty(duty)
         self._last_duty = duty
+        self._last_change = loop_time()
 
     def __repr__(self):
         return f"<FanZone id={self.name}, fans={self.fans}>"
@@ -73,5 +118,5 @@ class SingleFanZone(FanZone, Fan, ABC):
     def __str__(self):
         return Fan.__str__(self)
 
-    def update(self):
+    async def update(self):
         pass
\ No newline at end of file
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import logging
+from bisect import bisect_right
+from typing import Optional, Mapping
+
+from spinpid.interfaces import SensorInterface, FanInterface, TemperatureSensor
+from spinpid.interfaces.fan import SingleFanZone
+from spinpid.interfaces.sensor import Temperature
+from spinpid.trace import SENSOR, DUTY
+from spinpid.trace.reader import Series, SeriesKey
+from spinpid.util.asyncio import loop_time
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayError(Exception):
+    pass
+
+
+class Replay(SensorInterface, FanInterface):
+    """Plays back recorded sensor values and collects the duties the controller sets.
+
+       Timestamps of the recording are relative to the given start time, which is
+       expected to be time 0 of the (virtual) event loop."""
+
+    def __init__(self, series: Mapping[SeriesKey, Series], start_time: float, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.series = series
+        self.start_time = start_time
+        self.fan_zones: dict[str, ReplayFanZone] = {}
+
+    def get_sensor(self, sensor: str, **kwargs) -> TemperatureSensor:
+        series = self.series.get((SENSOR, sensor, None))
+        if series is None or not series.times:
+            raise ReplayError(f"No recorded values for sensor {sensor}")
+        return ReplaySensor(sensor, series, self.start_time)
+
+    def get_fan_zone(self, fan: str, **kwargs) -> ReplayFanZone:
+        recorded = self.series.get((DUTY, fan, None))
+        initial_duty = int(recorded.values[0]) if recorded and recorded.values else None
+        zone = ReplayFanZone(fan, initial_duty)
+        self.fan_zones[fan] = zone
+        return zone
+
+
+class ReplaySensor(TemperatureSensor):
+    def __init__(self, name: str, series: Series, start_time: float) -> None:
+        self.name = name
+        self.times = [t - start_time for t in series.times]
+        self.values = series.values
+        self._index = 0
+
+    async def get_temperature(self) -> Temperature:
+        now = loop_time()
+        times = self.times
+        index = self._index
+        # time only moves forward, so usually we only need to look at the next sample
+        if index + 1 < len(times) and times[index + 1] <= now:
+            index += 1
+            if index + 1 < len(times) and times[index + 1] <= now:
+                index = max(bisect_right(times, now) - 1, 0)
+        self._index = index
+        return Temperature(self.values[index], self.name)
+
+
+class ReplayFanZone(SingleFanZone):
+    """Fan zone that remembers every duty change together with the (virtual) time it happened"""
+
+    def __init__(self, name: str, initial_duty: Optional[int]) -> None:
+        super().__init__(name=name)
+        self.rpm = 0
+        self.initial_duty = initial_duty
+        self.duty_changes: list[tuple[float, int]] = []
+
+    async def get_duty(self) -> Optional[int]:
+        return self.initial_duty
+
+    async def _do_set_duty(self, duty: int) -> None:
+        self.duty_changes.append((loop_time(), duty))
@@ -0,0 +1,241 @@
+"""Simulated sensors and fans on top of a lumped thermal model.
+
+Every body (a CPU, a disk, ...) has a heat capacity and is heated by its power draw. It
+loses heat to the ambient air through its conductance, plus the airflow of the fan zones
+it is coupled to, scaled by their duty:
+
+    C * dT/dt = P(t) - (g + sum(k_z * duty_z / 100)) * (T - ambient)
+
+Bodies and zones with a count are expanded into that many instances (disk0, disk1, ...).
+A body coupled to a zone group uses the zone instance with the same index (modulo the
+zone count), which makes it easy to set up thousands of sensors and fan zones.
+
+Example configuration:
+
+    interfaces:
+      sim:
+        driver: spinpid.interfaces.simulated.Simulated
+        ambient: 25
+        zones:
+          cpu: {fans: 2, max_rpm: 1800}
+          peripheral: {fans: 4, max_rpm: 1500}
+        bodies:
+          CPU: {power: 60, heat_capacity: 300, conductance: 0.4, airflow: {cpu: 2.0}, load: 0.5}
+          disk: {count: 36, power: 7, heat_capacity: 900, conductance: 0.05, airflow: {peripheral: 0.3}}
+
+Sensor channels are body names (a single instance, or a group aggregated with
+aggregate: mean|max), fan channels are zone names.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import random
+from typing import Optional, Any, Iterable
+
+from spinpid.interfaces import SensorInterface, FanInterface, TemperatureSensor
+from spinpid.interfaces.fan import Fan, FanZone
+from spinpid.interfaces.sensor import Temperature, TemperaturesSource, MeanTemperatureSensor, MaxTemperatureSensor
+from spinpid.util.asyncio import loop_time
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedFailure(Exception):
+    pass
+
+
+def expand(name: str, count: Optional[int]) -> list[str]:
+    return [name] if count is None else [f"{name}{i}" for i in range(count)]
+
+
+class Body:
+    def __init__(self, name: str, temperature: float, power: float, heat_capacity: float, conductance: float,
+                 airflow: list[tuple[SimulatedFanZone, float]], load: float, load_period: float,
+                 phase: float, noise: float) -> None:
+        self.name = name
+        self.temperature = temperature
+        self.power = power
+        self.heat_capacity = heat_capacity
+        self.conductance = conductance
+        self.airflow = airflow
+        self.load = load
+        self.load_period = load_period
+        self.phase = phase
+        self.noise = noise
+        # each body is only brought up to date when it is read or the duty of its zones changes
+        self.last_step: Optional[float] = None
+
+    def advance(self, now: float, ambient: float) -> None:
+        if self.last_step is None:
+            self.last_step = now
+            return
+        dt = now - self.last_step
+        if dt > 0:
+            self.last_step = now
+            self.step(now, dt, ambient)
+
+    def step(self, now: float, dt: float, ambient: float) -> None:
+        # power in the middle of the step, varying sinusoidally around its mean
+        power = self.power * (1 + self.load * math.sin(2 * math.pi * (now - dt / 2) / self.load_period + self.phase))
+        g = self.conductance + sum(k * zone.duty / 100 for zone, k in self.airflow)
+        # exact solution for constant power and duty, stable for any step size
+        steady = ambient + power / g
+        self.temperature = steady + (self.temperature - steady) * math.exp(-g * dt / self.heat_capacity)
+
+
+class Simulated(SensorInterface, FanInterface):
+    """Sensors and fans of a simulated thermal model, see module documentation"""
+
+    def __init__(self, bodies: dict[str, dict[str, Any]], zones: dict[str, dict[str, Any]],
+                 ambient: float = 25.0, latency: float = 0.0, latency_jitter: float = 0.0,
+                 failure_rate: float = 0.0, seed: Optional[int] = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.ambient = ambient
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+        self.zone_groups: dict[str, list[SimulatedFanZone]] = {}
+        for group, spec in zones.items():
+            self.zone_groups[group] = [
+                SimulatedFanZone(self, name, fan_count=spec.get('fans', 1), max_rpm=spec.get('max_rpm', 1500),
+                                 initial_duty=spec.get('initial_duty', 100))
+                for name in expand(group, spec.get('count'))
+            ]
+        self.zones = {zone.name: zone for group in self.zone_groups.values() for zone in group}
+
+        self.body_groups: dict[str, list[Body]] = {}
+        for group, spec in bodies.items():
+            self.body_groups[group] = [
+                Body(name,
+                     temperature=spec.get('temperature', ambient),
+                     power=spec.get('power', 10.0),
+                     heat_capacity=spec.get('heat_capacity', 500.0),
+                     conductance=spec.get('conductance', 0.1),
+                     airflow=self._couple(spec.get('airflow', {}), index),
+                     load=spec.get('load', 0.0),
+                     load_period=spec.get('load_period', 3600.0),
+                     phase=self.random.uniform(0, 2 * math.pi),
+                     noise=spec.get('noise', 0.0))
+                for index, name in enumerate(expand(group, spec.get('count')))
+            ]
+        self.bodies = {body.name: body for group in self.body_groups.values() for body in group}
+        for body in self.bodies.values():
+            for zone, _ in body.airflow:
+                zone.bodies.append(body)
+
+    def _couple(self, airflow: dict[str, float], index: int) -> list[tuple[SimulatedFanZone, float]]:
+        coupling = []
+        for zone_name, k in airflow.items():
+            if zone_name in self.zone_groups:
+                group = self.zone_groups[zone_name]
+                coupling.append((group[index % len(group)], k))
+            elif zone_name in self.zones:
+                coupling.append((self.zones[zone_name], k))
+            else:
+                raise ValueError(f"Unknown fan zone {zone_name}")
+        return coupling
+
+    def advance(self, bodies: Optional[Iterable[Body]] = None) -> None:
+        """Brings the given bodies (or all of them) up to the current time"""
+        now = loop_time()
+        ambient = self.ambient
+        for body in self.bodies.values() if bodies is None else bodies:
+            body.advance(now, ambient)
+
+    async def call(self) -> None:
+        """Simulates the latency and failures of talking to real hardware"""
+        self.calls += 1
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.latency_jitter))
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.failures += 1
+            raise SimulatedFailure("Simulated failure")
+
+    def read(self, body: Body) -> Temperature:
+        value = body.temperature
+        if body.noise:
+            value += self.random.gauss(0, body.noise)
+        return Temperature(round(value, 2), body.name)
+
+    def get_sensor(self, channel: str, aggregate: str = 'mean', label: Optional[str] = None,
+                   **kwargs) -> TemperatureSensor:
+        if channel in self.bodies and channel not in self.body_groups:
+            return SimulatedSensor(self, self.bodies[channel])
+        if channel in self.body_groups:
+            group = self.body_groups[channel]
+            if len(group) == 1:
+                return SimulatedSensor(self, group[0])
+            source = SimulatedTemperaturesSource(self, group)
+            if aggregate == 'max':
+                return MaxTemperatureSensor(source, label=label or channel)
+            if aggregate == 'mean':
+                return MeanTemperatureSensor(source, label=label or "⌀")
+            raise ValueError(f"Unknown aggregate '{aggregate}', must be one of 'mean', 'max'")
+        raise ValueError(f"Unknown body '{channel}'")
+
+    def get_fan_zone(self, channel: str, **kwargs) -> SimulatedFanZone:
+        if channel in self.zones:
+            return self.zones[channel]
+        group = self.zone_groups.get(channel)
+        if group is not None and len(group) == 1:
+            return group[0]
+        raise ValueError(f"Unknown fan zone '{channel}'")
+
+
+class SimulatedSensor(TemperatureSensor):
+    def __init__(self, interface: Simulated, body: Body) -> None:
+        self.interface = interface
+        self.body = body
+
+    async def get_temperature(self) -> Temperature:
+        await self.interface.call()
+        self.interface.advance((self.body,))
+        return self.interface.read(self.body)
+
+
+class SimulatedTemperaturesSource(TemperaturesSource):
+    def __init__(self, interface: Simulated, bodies: list[Body]) -> None:
+        self.interface = interface
+        self.bodies = bodies
+
+    async def get_all_temperatures(self):
+        await self.interface.call()
+        self.interface.advance(self.bodies)
+        return (self.interface.read(body) for body in self.bodies)
+
+
+class SimulatedFanZone(FanZone):
+    def __init__(self, interface: Simulated, name: str, fan_count: int, max_rpm: int, initial_duty: int) -> None:
+        super().__init__(zone_name=name, dry_run=interface.dry_run)
+        self.interface = interface
+        self.max_rpm = max_rpm
+        self.duty = initial_duty
+        self.fans = [Fan(f"{name} fan {i}") for i in range(fan_count)]
+        # bodies cooled by this zone
+        self.bodies: list[Body] = []
+        for fan in self.fans:
+            fan.rpm = self._rpm()
+
+    def _rpm(self) -> int:
+        return int(self.max_rpm * self.duty / 100 * self.interface.random.uniform(0.97, 1.03))
+
+    async def get_duty(self) -> int:
+        await self.interface.call()
+        return self.duty
+
+    async def _do_set_duty(self, duty: int) -> None:
+        await self.interface.call()
+        # the bodies it cools have to catch up with the old duty before it changes
+        self.interface.advance(self.bodies)
+        self.duty = duty
+
+    async def update(self) -> None:
+        await self.interface.call()
+        for fan in self.fans:
+            fan.rpm = self._rpm()
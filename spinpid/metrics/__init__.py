@@ -0,0 +1,74 @@
+"""Counters and histograms for the hot path of the controller.
+
+They are preallocated slots that are updated in place. Whoever wants to see them (the
+Prometheus endpoint, the stats dump) formats them on demand, so nothing is formatted as
+long as nobody asks for it."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from time import perf_counter_ns
+from typing import Awaitable, Iterator, Optional, Sequence, TypeVar
+
+__all__ = ['Histogram', 'CallStats', 'LATENCY_BUCKETS_NS']
+
+T = TypeVar('T')
+
+# in nanoseconds, from a fast local read up to a hanging ipmitool
+LATENCY_BUCKETS_NS = tuple(int(ms * 1_000_000) for ms in
+                           (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets: Sequence[int] = LATENCY_BUCKETS_NS) -> None:
+        self.buckets = tuple(buckets)
+        # the last slot counts everything above the highest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.max = 0
+
+    def observe(self, value: int) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def cumulative_counts(self) -> Iterator[tuple[float, int]]:
+        total = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket that contains the quantile (or the maximum, if that is lower)"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative_counts():
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class CallStats:
+    """Number of calls, failed calls and latency (in ns) of one operation"""
+    __slots__ = ('calls', 'errors', 'latency')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    async def measure(self, awaitable: Awaitable[T]) -> T:
+        started = perf_counter_ns()
+        try:
+            return await awaitable
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.calls += 1
+            self.latency.observe(perf_counter_ns() - started)
@@ -0,0 +1,91 @@
+"""Tracks memory growth with tracemalloc snapshots.
+
+Each report compares a new snapshot to an older one and lists the allocation sites that
+grew the most, together with the RSS and gc statistics. Comparing to the previous report
+shows what is being allocated right now, comparing to the first snapshot shows whether
+memory keeps growing (a leak) or stays at a steady state."""
+from __future__ import annotations
+
+import gc
+import logging
+import resource
+import sys
+import tracemalloc
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['MemoryTracker', 'rss']
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def rss() -> int:
+    """Current resident set size in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # peak instead of current, but better than nothing (KiB on Linux, bytes on macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+
+class MemoryTracker:
+    def __init__(self, frames: int = 1, top: int = 10) -> None:
+        self.frames = frames
+        self.top = top
+        self.first: Optional[tracemalloc.Snapshot] = None
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self.first_rss = 0
+        self.previous_rss = 0
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.first = self.previous = self._snapshot()
+        self.first_rss = self.previous_rss = rss()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+    def report(self, since_start: bool = False) -> Iterator[str]:
+        """Compares a new snapshot to the previous report (or the first snapshot)"""
+        if self.first is None:
+            raise RuntimeError("Memory tracking was not started")
+        snapshot = self._snapshot()
+        current_rss = rss()
+        if since_start:
+            reference, reference_rss = self.first, self.first_rss
+        else:
+            reference, reference_rss = self.previous, self.previous_rss
+            self.previous, self.previous_rss = snapshot, current_rss
+
+        traced, peak = tracemalloc.get_traced_memory()
+        yield (f"Memory {'since start' if since_start else 'since last report'}: "
+               f"RSS {format_size(current_rss)} ({'+' if current_rss >= reference_rss else ''}"
+               f"{format_size(current_rss - reference_rss)}), "
+               f"traced {format_size(traced)} (peak {format_size(peak)}), "
+               f"gc counts {gc.get_count()}, "
+               f"collections {[generation['collections'] for generation in gc.get_stats()]}, "
+               f"uncollectable {sum(generation['uncollectable'] for generation in gc.get_stats())}")
+        growing = [stat for stat in snapshot.compare_to(reference, 'lineno') if stat.size_diff > 0]
+        for stat in growing[:self.top]:
+            frame = stat.traceback[0]
+            yield (f"  {format_size(stat.size_diff):>9} in {stat.count_diff:+} blocks "
+                   f"(now {format_size(stat.size)}) at {frame.filename}:{frame.lineno}")
@@ -0,0 +1,81 @@
+"""Profiles the running process on demand.
+
+cProfile only profiles the thread it is enabled in, so it has to be started and stopped
+from the event loop's thread (e.g. by a signal handler registered on the loop)."""
+from __future__ import annotations
+
+import cProfile
+import logging
+import marshal
+import os
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['Profiler']
+
+
+class Profiler:
+    def __init__(self, directory: str = '.') -> None:
+        self.directory = directory
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def active(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> None:
+        if self._profile is not None:
+            return
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        logger.info("Started profiling")
+
+    def stop(self) -> Optional[str]:
+        """Stops profiling and writes the profile in pstats format, returns its file name.
+
+        If the profile can't be written, profiling continues and None is returned, so that
+        stopping again (e.g. after the directory was created) doesn't lose the profile."""
+        profile = self._profile
+        if profile is None:
+            return None
+        profile.disable()
+        profile.create_stats()
+        try:
+            filename = self._write(profile)
+        except OSError as e:
+            logger.error("Could not write the profile to %s, still profiling: %s", self.directory, e)
+            profile.enable()
+            return None
+        self._profile = None
+        logger.info("Stopped profiling, wrote %s", filename)
+        return filename
+
+    def _write(self, profile: cProfile.Profile) -> str:
+        filename, f = self._create_file()
+        try:
+            with f:
+                # same as profile.dump_stats(), without overwriting an earlier profile
+                marshal.dump(profile.stats, f)
+        except BaseException:
+            os.unlink(filename)
+            raise
+        return filename
+
+    def _create_file(self):
+        """Creates a new profile file, profiles stopped within the same second get a counter"""
+        base = os.path.join(self.directory, f"spinpid-{datetime.now():%Y%m%d-%H%M%S}")
+        counter = 0
+        while True:
+            filename = f"{base}.prof" if counter == 0 else f"{base}-{counter}.prof"
+            try:
+                return filename, open(filename, 'xb')
+            except FileExistsError:
+                counter += 1
+
+    def toggle(self) -> Optional[str]:
+        if self.active:
+            return self.stop()
+        self.start()
+        return None
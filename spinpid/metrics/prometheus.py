@@ -0,0 +1,117 @@
+"""Prometheus metrics of a running controller.
+
+Sensor temperatures, fan duties and fan speeds are read from the controller, calls and
+their latency from the span recorder, all only when the metrics are scraped. Commands run
+by interfaces are exported with operation="run" and the name of the command as interface."""
+from __future__ import annotations
+
+from typing import Iterator, Iterable, Optional, TYPE_CHECKING
+
+from . import Histogram
+from .spans import SpanRecorder, CONTROLLER, UPDATE_FANS
+from .watchdog import LoopWatchdog
+from ..util.http import Request, Response
+
+if TYPE_CHECKING:
+    from ..controller import Controller
+
+__all__ = ['Metrics']
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def labels(**values: str) -> str:
+    return '{' + ','.join(f'{name}="{escape(str(value))}"' for name, value in values.items()) + '}'
+
+
+def number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Metrics:
+    def __init__(self, controller: Controller, spans: SpanRecorder, watchdog: Optional[LoopWatchdog] = None) -> None:
+        self.controller = controller
+        self.spans = spans
+        self.watchdog = watchdog
+
+    async def handle(self, request: Request) -> Response:
+        return Response(body=self.render().encode(), content_type=CONTENT_TYPE)
+
+    def render(self) -> str:
+        return ''.join(line + '\n' for line in self._render())
+
+    def _render(self) -> Iterator[str]:
+        controller = self.controller
+        last_known_values = controller.last_known_values
+
+        yield from self._family('spinpid_sensor_temperature_celsius', 'gauge',
+                                "Last temperature of each sensor, including the single values of aggregated sensors")
+        for sensor_id, value in last_known_values.sensor_temperature_values.items():
+            if value is not None:
+                for label, temperature in value.value:
+                    yield f"spinpid_sensor_temperature_celsius{labels(sensor=sensor_id, label=label)} {number(temperature)}"
+
+        yield from self._family('spinpid_fan_duty_percent', 'gauge', "Last duty set for each fan")
+        for fan_id, value in last_known_values.fan_duty_values.items():
+            if value is not None:
+                yield f"spinpid_fan_duty_percent{labels(fan=fan_id)} {number(value.value)}"
+
+        yield from self._family('spinpid_fan_rpm', 'gauge', "Last known speed of each fan of a fan zone")
+        for fan_id, fan_controller in controller.fans.items():
+            for fan in fan_controller.fan_zone.fans:
+                rpm = getattr(fan, 'rpm', None)
+                if rpm is not None:
+                    yield f"spinpid_fan_rpm{labels(fan=fan_id, name=fan.name)} {number(rpm)}"
+
+        yield from self._family('spinpid_fan_skipped_writes_total', 'counter',
+                                "Duty changes not written because of the deadband or minimum hold time of a fan")
+        for fan_id, fan_controller in controller.fans.items():
+            yield f"spinpid_fan_skipped_writes_total{labels(fan=fan_id)} {fan_controller.fan_zone.skipped_writes}"
+
+        interface_spans = [(key, stats) for key, stats in self.spans.spans.items() if key[1] != CONTROLLER]
+
+        yield from self._family('spinpid_interface_calls_total', 'counter', "Calls to interfaces")
+        for (operation, interface_id), stats in interface_spans:
+            yield f"spinpid_interface_calls_total{labels(interface=interface_id, operation=operation)} {stats.calls}"
+
+        yield from self._family('spinpid_interface_errors_total', 'counter', "Calls to interfaces that failed")
+        for (operation, interface_id), stats in interface_spans:
+            yield f"spinpid_interface_errors_total{labels(interface=interface_id, operation=operation)} {stats.errors}"
+
+        yield from self._family('spinpid_interface_call_duration_seconds', 'histogram',
+                                "Duration of calls to interfaces")
+        for (operation, interface_id), stats in interface_spans:
+            yield from self._histogram('spinpid_interface_call_duration_seconds', stats.latency,
+                                       interface=interface_id, operation=operation)
+
+        yield from self._family('spinpid_cycle_duration_seconds', 'histogram',
+                                "Duration of updating all fans in a control cycle")
+        yield from self._histogram('spinpid_cycle_duration_seconds',
+                                   self.spans.stats(UPDATE_FANS, CONTROLLER).latency)
+
+        if self.watchdog is not None:
+            yield from self._family('spinpid_event_loop_lag_seconds', 'histogram',
+                                    "How late the event loop woke up a regularly sleeping task")
+            yield from self._histogram('spinpid_event_loop_lag_seconds', self.watchdog.lag)
+            yield from self._family('spinpid_event_loop_blocked_total', 'counter',
+                                    "How often the event loop lag exceeded the watchdog threshold")
+            yield f"spinpid_event_loop_blocked_total {self.watchdog.blocked}"
+
+    @staticmethod
+    def _family(name: str, typ: str, help: str) -> Iterable[str]:
+        return f"# HELP {name} {help}", f"# TYPE {name} {typ}"
+
+    @staticmethod
+    def _histogram(name: str, histogram: Histogram, **label_values: str) -> Iterator[str]:
+        # recorded in nanoseconds, exported in seconds
+        for bound, count in histogram.cumulative_counts():
+            yield f"{name}_bucket{labels(**label_values, le=number(bound / 1e9))} {count}"
+        suffix = labels(**label_values) if label_values else ''
+        yield f"{name}_sum{suffix} {number(histogram.sum / 1e9)}"
+        yield f"{name}_count{suffix} {histogram.count}"
@@ -0,0 +1,71 @@
+"""Records how long the operations of each interface take.
+
+Instrumented code holds a CallStats slot (or None, when recording is disabled, which
+costs a single attribute check). The recorder hands out one slot per operation and
+interface and attaches them to a controller."""
+from __future__ import annotations
+
+from typing import Iterator, TYPE_CHECKING
+
+from . import CallStats
+from ..util.command import Command
+
+if TYPE_CHECKING:
+    from ..controller import Controller
+
+__all__ = ['SpanRecorder', 'CONTROLLER', 'GET_TEMPERATURE', 'SET_DUTY', 'UPDATE', 'UPDATE_FANS', 'RUN_COMMAND']
+
+# pseudo interface of the operations of the controller itself
+CONTROLLER = 'controller'
+
+GET_TEMPERATURE = 'get_temperature'
+SET_DUTY = 'set_duty'
+UPDATE = 'update'
+UPDATE_FANS = 'update_fans'
+RUN_COMMAND = 'run'
+
+
+class SpanRecorder:
+    def __init__(self) -> None:
+        self.spans: dict[tuple[str, str], CallStats] = {}
+
+    def stats(self, operation: str, interface_id: str) -> CallStats:
+        key = (operation, interface_id)
+        stats = self.spans.get(key)
+        if stats is None:
+            stats = self.spans[key] = CallStats()
+        return stats
+
+    def command_stats(self, name: str) -> CallStats:
+        return self.stats(RUN_COMMAND, name)
+
+    def attach(self, controller: Controller) -> None:
+        """Starts recording the operations of the controller and all external commands"""
+        for sensor in controller.sensors.values():
+            sensor.update_stats = self.stats(GET_TEMPERATURE, sensor.interface_id or 'unknown')
+        for fan in controller.fans.values():
+            fan.set_duty_stats = self.stats(SET_DUTY, fan.interface_id or 'unknown')
+            fan.update_stats = self.stats(UPDATE, fan.interface_id or 'unknown')
+        controller.update_fans_stats = self.stats(UPDATE_FANS, CONTROLLER)
+        Command.span_recorder = self
+
+    def format(self) -> Iterator[str]:
+        yield (f"{'Operation':<16} {'Interface':<16} {'Calls':>8} {'Errors':>6} "
+               f"{'Mean':>9} {'p50':>9} {'p99':>9} {'Max':>9}")
+        for (operation, interface_id), stats in sorted(self.spans.items()):
+            latency = stats.latency
+            mean = latency.sum / latency.count if latency.count else None
+            yield (f"{operation:<16} {interface_id:<16} {stats.calls:>8} {stats.errors:>6} "
+                   f"{format_ns(mean):>9} {format_ns(latency.quantile(0.5)):>9} "
+                   f"{format_ns(latency.quantile(0.99)):>9} {format_ns(latency.max if latency.count else None):>9}")
+
+
+def format_ns(value) -> str:
+    if value is None:
+        return '-'
+    if value == float('inf'):
+        return 'inf'
+    for unit, factor in (('s', 1e9), ('ms', 1e6), ('µs', 1e3)):
+        if value >= factor:
+            return f"{value / factor:.1f}{unit}"
+    return f"{value:.0f}ns"
@@ -0,0 +1,42 @@
+"""Measures how long the phases of the startup take, up to the first control cycle."""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['StartupTimer']
+
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms"
+
+
+class StartupTimer:
+    def __init__(self, started: Optional[float] = None) -> None:
+        self.started = self.last = started if started is not None else time.perf_counter()
+        self.phases: list[tuple[str, float, Optional[dict[str, float]]]] = []
+
+    def mark(self, phase: str, details: Optional[dict[str, float]] = None) -> None:
+        """Ends a phase that started when the previous one ended, details are shown in parentheses"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last, details))
+        self.last = now
+
+    @property
+    def total(self) -> float:
+        return self.last - self.started
+
+    def format(self) -> str:
+        def phase(name: str, seconds: float, details: Optional[dict[str, float]]) -> str:
+            if not details:
+                return f"{name} {format_ms(seconds)}"
+            return (f"{name} {format_ms(seconds)} ("
+                    + ', '.join(f"{key} {format_ms(value)}" for key, value in details.items()) + ")")
+
+        return f"Started in {format_ms(self.total)}: " + ', '.join(phase(*p) for p in self.phases)
+
+    def log(self) -> None:
+        logger.info(self.format())
@@ -0,0 +1,124 @@
+"""Detects when something blocks the event loop.
+
+A task measures how late its regular wake ups are (the scheduling lag). A helper thread
+watches the heartbeat of that task, and when it stops for longer than the threshold, it
+captures the stack of the loop's thread while it is still blocked and logs which task
+and driver were running."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Optional
+
+from . import Histogram
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['LoopWatchdog']
+
+# in nanoseconds
+LAG_BUCKETS_NS = tuple(int(ms * 1_000_000) for ms in
+                       (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+
+STACK_LIMIT = 15
+
+
+def find_driver(frame: Optional[FrameType]) -> Optional[str]:
+    """Returns the innermost module of an interface in the stack, or of spinpid in general"""
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('spinpid.interfaces'):
+            return module
+        if fallback is None and module.startswith('spinpid.') and not module.startswith('spinpid.metrics'):
+            fallback = module
+        frame = frame.f_back
+    return fallback
+
+
+def format_blocking_stack(frame: FrameType) -> list[str]:
+    """Formats the stack of the loop's thread, without the frames of the event loop itself"""
+    summary = traceback.extract_stack(frame)
+    # everything up to running the callback of the current handle belongs to the loop
+    for index in range(len(summary) - 1, -1, -1):
+        if summary[index].filename.endswith(os.path.join('asyncio', 'events.py')):
+            summary = summary[index + 1:]
+            break
+    return traceback.format_list(summary[-STACK_LIMIT:])
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.5) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = Histogram(LAG_BUCKETS_NS)
+        self.blocked = 0
+
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> asyncio.Task:
+        """Starts watching the running loop, returns the task that measures the lag"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="Event loop watchdog", daemon=True)
+        self._thread.start()
+        return asyncio.create_task(self._measure(), name="Event loop watchdog")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def _measure(self) -> None:
+        loop = asyncio.get_running_loop()
+        interval = self.interval
+        threshold = self.threshold
+        try:
+            while True:
+                expected = loop.time() + interval
+                self._heartbeat = time.monotonic()
+                await asyncio.sleep(interval)
+                lag = max(loop.time() - expected, 0.0)
+                self.lag.observe(int(lag * 1e9))
+                if lag > threshold:
+                    self.blocked += 1
+                    logger.warning("Event loop was blocked for %.0fms", lag * 1000)
+        finally:
+            self.stop()
+
+    def _watch(self) -> None:
+        reported_heartbeat = None
+        while not self._stop.wait(self.interval / 2):
+            heartbeat = self._heartbeat
+            if heartbeat == reported_heartbeat:
+                continue
+            late = time.monotonic() - heartbeat - self.interval
+            if late > self.threshold:
+                reported_heartbeat = heartbeat
+                self._report(late)
+
+    def _report(self, late: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        task = asyncio.current_task(self._loop)
+        stack = ''.join(format_blocking_stack(frame)) if frame is not None else ''
+        logger.warning("Event loop blocked for more than %.0fms in task %s (%s), stack:\n%s", late * 1000,
+                       task.get_name() if task is not None else None, find_driver(frame) or 'unknown', stack)
+
+    def format(self) -> str:
+        lag = self.lag
+
+        def ms(value) -> str:
+            return f"{value / 1e6:.1f}ms" if value is not None else '-'
+
+        return (f"Event loop lag: p50 {ms(lag.quantile(0.5))}, p99 {ms(lag.quantile(0.99))}, "
+                f"max {ms(lag.max if lag.count else None)}, blocked {self.blocked} times")
@@ -0,0 +1,86 @@
+"""Compact binary traces of what the controller saw and did.
+
+A trace file starts with a header region that holds a JSON description of
+all channels (which sensor, single temperature, fan duty or fan RPM a
+channel id refers to), followed by fixed-width records of
+(monotonic timestamp, channel id, value).
+
+The header region is rewritten in place whenever channels are added, the
+record region is append-only.
+"""
+from __future__ import annotations
+
+import json
+import struct
+from typing import NamedTuple, Optional, Iterable
+
+__all__ = ['Channel', 'SENSOR', 'TEMPERATURE', 'DUTY', 'RPM', 'RECORD', 'RECORD_DTYPE',
+           'MAGIC', 'FORMAT_VERSION', 'PREAMBLE', 'HEADER_ALIGNMENT',
+           'encode_header', 'decode_header', 'TraceFormatError', 'RAW', 'MINUTE', 'HOUR', 'DEFAULT_RETENTION']
+
+# aggregated value of a sensor, as used by the algorithms
+SENSOR = 'sensor'
+# single temperature value that is part of a sensor (e.g. one disk)
+TEMPERATURE = 'temperature'
+# duty of a fan, as calculated by the controller
+DUTY = 'duty'
+# speed of a single fan of a fan zone
+RPM = 'rpm'
+
+MAGIC = b'SPINPIDT'
+FORMAT_VERSION = 1
+# magic, format version, size of the header region, length of the JSON header
+PREAMBLE = struct.Struct('<8sIII')
+HEADER_ALIGNMENT = 4096
+
+# monotonic timestamp (seconds), channel id, value
+RECORD = struct.Struct('<dIf')
+# NumPy-compatible description of RECORD
+RECORD_DTYPE = [('time', '<f8'), ('channel', '<u4'), ('value', '<f4')]
+
+# resolutions of the sample store (see store.py), defined here so that they don't need sqlite3
+RAW = 'raw'
+MINUTE = 'minute'
+HOUR = 'hour'
+# days to keep the samples of each resolution
+DEFAULT_RETENTION = {RAW: 3, MINUTE: 60, HOUR: 730}
+
+
+class TraceFormatError(ValueError):
+    pass
+
+
+class Channel(NamedTuple):
+    id: int
+    kind: str
+    name: str
+    label: Optional[str] = None
+
+    def __str__(self):
+        if self.label is None:
+            return f"{self.kind} {self.name}"
+        return f"{self.kind} {self.name}/{self.label}"
+
+
+def encode_header(channels: Iterable[Channel], meta: dict, min_size: int = 0) -> tuple[int, bytes]:
+    """Returns the size of the header region needed (at least min_size) and the encoded header"""
+    header = dict(meta)
+    header['channels'] = [list(channel) for channel in channels]
+    data = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    size = max(PREAMBLE.size + len(data), min_size)
+    header_size = -(-size // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+    return header_size, PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_size, len(data)) + data
+
+
+def decode_header(buffer) -> tuple[int, dict, list[Channel]]:
+    """Returns the size of the header region, the metadata and the channels of a trace"""
+    if len(buffer) < PREAMBLE.size:
+        raise TraceFormatError("File too short to be a trace")
+    magic, version, header_size, length = PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC:
+        raise TraceFormatError("Not a spinpid trace")
+    if version != FORMAT_VERSION:
+        raise TraceFormatError(f"Unsupported trace format version {version}")
+    meta = json.loads(bytes(buffer[PREAMBLE.size:PREAMBLE.size + length]).decode('utf-8'))
+    channels = [Channel(*channel) for channel in meta.pop('channels')]
+    return header_size, meta, channels
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import mmap
+from typing import Optional, Iterator, NamedTuple, Iterable, Collection
+
+from . import Channel, RECORD, RECORD_DTYPE, decode_header, TraceFormatError
+
+__all__ = ['TraceReader', 'Series', 'load_series', 'resample']
+
+
+class TraceReader:
+    """Read access to a trace file written by TraceWriter.
+
+       The file is memory mapped, records() exposes it as a NumPy structured array
+       without copying any data. NumPy is only imported when it is actually used."""
+
+    channels: list[Channel]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.header_size, self.meta, self.channels = decode_header(self._mmap)
+        except (TraceFormatError, ValueError) as e:
+            self._mmap.close()
+            raise TraceFormatError(f"Unable to read trace {path}: {e}") from e
+        # ignore a partially written record at the end
+        self.record_count = max(0, (len(self._mmap) - self.header_size) // RECORD.size)
+        self._channel_ids = {(c.kind, c.name, c.label): c.id for c in self.channels}
+
+    def __enter__(self) -> TraceReader:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        try:
+            self._mmap.close()
+        except BufferError:
+            # arrays returned by records() are still referencing the mapping, it is
+            # released once they are gone
+            pass
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    @property
+    def clock_offset(self) -> float:
+        """Add to a record timestamp to get the wall clock time (seconds since the epoch)"""
+        return self.meta['clock_offset']
+
+    def channel_id(self, kind: str, name: str, label: Optional[str] = None) -> Optional[int]:
+        return self._channel_ids.get((kind, name, label))
+
+    def find_channels(self, kind: Optional[str] = None, name: Optional[str] = None) -> list[Channel]:
+        return [c for c in self.channels
+                if (kind is None or c.kind == kind) and (name is None or c.name == name)]
+
+    def __iter__(self) -> Iterator[tuple[float, int, float]]:
+        end = self.header_size + self.record_count * RECORD.size
+        return RECORD.iter_unpack(memoryview(self._mmap)[self.header_size:end])
+
+    def records(self):
+        """Returns all records as a NumPy structured array with the fields time, channel and value"""
+        import numpy
+        return numpy.frombuffer(self._mmap, dtype=numpy.dtype(RECORD_DTYPE),
+                                count=self.record_count, offset=self.header_size)
+
+    def series(self, channel_id: int):
+        """Returns the timestamps and values of a single channel as NumPy arrays"""
+        records = self.records()
+        selected = records[records['channel'] == channel_id]
+        return selected['time'], selected['value']
+
+
+class Series(NamedTuple):
+    times: list[float]
+    values: list[float]
+
+
+SeriesKey = tuple[str, str, Optional[str]]
+
+
+def load_series(paths: Iterable[str], kinds: Optional[Collection[str]] = None) -> dict[SeriesKey, Series]:
+    """Loads the channels of one or more trace files (e.g. a trace and its rotated backups).
+
+       Timestamps are converted to wall clock time so that traces of different runs line up."""
+    samples: dict[SeriesKey, list[tuple[float, float]]] = {}
+    for path in paths:
+        with TraceReader(path) as reader:
+            offset = reader.clock_offset
+            targets = [
+                samples.setdefault((c.kind, c.name, c.label), [])
+                if kinds is None or c.kind in kinds else None
+                for c in reader.channels
+            ]
+            for timestamp, channel_id, value in reader:
+                target = targets[channel_id]
+                if target is not None:
+                    target.append((timestamp + offset, value))
+    result = {}
+    for key, values in samples.items():
+        values.sort()
+        result[key] = Series([t for t, _ in values], [v for _, v in values])
+    return result
+
+
+def resample(series: Series, times):
+    """Returns the values of series at the given times as a NumPy array.
+
+       Each time gets the last value recorded before it (or the first value, for times
+       before the first sample)."""
+    import numpy
+    values = numpy.asarray(series.values, dtype=float)
+    indices = numpy.searchsorted(numpy.asarray(series.times), times, side='right') - 1
+    return values[numpy.clip(indices, 0, len(values) - 1)]
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+from . import SENSOR, TEMPERATURE, DUTY, RPM
+from .writer import TraceWriter
+from ..controller import Controller
+
+__all__ = ['TraceRecorder']
+
+
+class TraceRecorder:
+    """Records sensor values, fan duties and fan speeds of a controller into a trace.
+
+       Meant to be called once per controller cycle, only values that changed since
+       the last call are recorded."""
+
+    def __init__(self, writer: TraceWriter) -> None:
+        self.writer = writer
+        self._last_seen: dict[tuple[str, ...], Any] = {}
+
+    def record(self, controller: Controller) -> None:
+        writer = self.writer
+        last_seen = self._last_seen
+        now = asyncio.get_running_loop().time()
+
+        for sensor_id, value in controller.last_known_values.sensor_temperature_values.items():
+            if value is None or last_seen.get((SENSOR, sensor_id)) is value:
+                continue
+            last_seen[(SENSOR, sensor_id)] = value
+            temperature = value.value
+            writer.write(now, writer.channel(SENSOR, sensor_id), temperature)
+            if hasattr(temperature, 'temperatures'):
+                for label, temp in temperature:
+                    if label != temperature.label:
+                        writer.write(now, writer.channel(TEMPERATURE, sensor_id, label), temp)
+
+        for fan_id, value in controller.last_known_values.fan_duty_values.items():
+            if value is None or last_seen.get((DUTY, fan_id)) is value:
+                continue
+            last_seen[(DUTY, fan_id)] = value
+            writer.write(now, writer.channel(DUTY, fan_id), value.value)
+
+        for fan_id, fan_controller in controller.fans.items():
+            for fan in fan_controller.fan_zone.fans:
+                rpm = getattr(fan, 'rpm', None)
+                if rpm is None or last_seen.get((RPM, fan_id, fan.name)) == rpm:
+                    continue
+                last_seen[(RPM, fan_id, fan.name)] = rpm
+                writer.write(now, writer.channel(RPM, fan_id, fan.name), rpm)
+
+        writer.flush()
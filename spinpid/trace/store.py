@@ -0,0 +1,338 @@
+"""Long term history of the controller in a SQLite database.
+
+SampleStore is a drop-in for TraceWriter that TraceRecorder can write to. Samples are
+collected in memory and committed by a background thread in one transaction every few
+seconds. The database is in WAL mode, so it can be queried while it is being written.
+
+Raw samples are rolled up into per minute and per hour min/mean/max tables, each table
+has its own retention. As only changed values are recorded, a minute without changes
+has no rollup row, its value is the last one before it."""
+from __future__ import annotations
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional, NamedTuple, Iterable, Collection
+
+from . import Channel, RAW, MINUTE, HOUR, DEFAULT_RETENTION
+from .reader import Series, SeriesKey
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['SampleStore', 'SampleStoreReader', 'Rollups', 'load_store_series', 'RAW', 'MINUTE', 'HOUR',
+           'DEFAULT_RETENTION']
+
+# table and length of a bucket (seconds) of each resolution
+TABLES = {RAW: ('samples', None), MINUTE: ('minutes', 60), HOUR: ('hours', 3600)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    label TEXT,
+    UNIQUE (kind, name, label)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    channel INTEGER NOT NULL,
+    time REAL NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_channel_time ON samples (channel, time);
+CREATE INDEX IF NOT EXISTS samples_time ON samples (time);
+CREATE TABLE IF NOT EXISTS minutes (
+    channel INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    min REAL NOT NULL,
+    mean REAL NOT NULL,
+    max REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel, time)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS minutes_time ON minutes (time);
+CREATE TABLE IF NOT EXISTS hours (
+    channel INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    min REAL NOT NULL,
+    mean REAL NOT NULL,
+    max REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel, time)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS hours_time ON hours (time);
+"""
+
+ROLL_UP_MINUTES = """
+INSERT OR REPLACE INTO minutes (channel, time, min, mean, max, count)
+SELECT channel, CAST(time / 60 AS INTEGER) * 60 AS minute, min(value), avg(value), max(value), count(*)
+FROM samples WHERE time >= ? AND time < ? GROUP BY channel, minute
+"""
+
+ROLL_UP_HOURS = """
+INSERT OR REPLACE INTO hours (channel, time, min, mean, max, count)
+SELECT channel, time / 3600 * 3600 AS hour, min(min), sum(mean * count) / sum(count), max(max), sum(count)
+FROM minutes WHERE time >= ? AND time < ? GROUP BY channel, hour
+"""
+
+# how often rollups and retention are applied (seconds)
+MAINTENANCE_INTERVAL = 60
+
+
+class Rollups(NamedTuple):
+    times: list[float]
+    minimums: list[float]
+    means: list[float]
+    maximums: list[float]
+
+
+def connect(path: str, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    # in WAL mode, a crash can only lose the last transactions, never corrupt the database
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class SampleStore:
+    """Writes samples to a SQLite database, same interface as TraceWriter.
+
+       Retention is in days per resolution (RAW, MINUTE and HOUR)."""
+
+    def __init__(self, path: str, retention: Optional[dict[str, float]] = None, commit_interval: float = 5.0,
+                 max_pending_chunks: int = 256, clock_offset: Optional[float] = None) -> None:
+        self.path = path
+        self.retention = {**DEFAULT_RETENTION, **(retention or {})}
+        self.commit_interval = commit_interval
+        self.clock_offset = clock_offset if clock_offset is not None else time.time() - time.monotonic()
+        self.dropped_chunks = 0
+        self._dropping = False
+
+        connection = connect(path)
+        try:
+            # keep the ids of known channels
+            self._channel_ids: dict[tuple[str, str, Optional[str]], int] = {
+                (kind, name, label): channel_id
+                for channel_id, kind, name, label in connection.execute('SELECT id, kind, name, label FROM channels')
+            }
+        finally:
+            connection.close()
+        self._next_channel_id = max(self._channel_ids.values(), default=-1) + 1
+        self._new_channels: list[Channel] = []
+        self._buffer: list[tuple[int, float, float]] = []
+        self._queue: queue.Queue[Optional[tuple[list[Channel], list[tuple[int, float, float]]]]] = \
+            queue.Queue(maxsize=max_pending_chunks)
+
+        self._thread = threading.Thread(target=self._run, name=f"Sample store {path}", daemon=True)
+        self._thread.start()
+
+    def channel(self, kind: str, name: str, label: Optional[str] = None) -> int:
+        """Returns the id of the given channel, registering it if necessary"""
+        key = (kind, name, label)
+        channel_id = self._channel_ids.get(key)
+        if channel_id is None:
+            channel_id = self._channel_ids[key] = self._next_channel_id
+            self._next_channel_id += 1
+            self._new_channels.append(Channel(channel_id, kind, name, label))
+        return channel_id
+
+    def write(self, timestamp: float, channel_id: int, value: float) -> None:
+        self._buffer.append((channel_id, timestamp + self.clock_offset, value))
+
+    def flush(self) -> None:
+        """Hands all samples written so far to the background thread"""
+        if not self._buffer and not self._new_channels:
+            return
+        chunk = (self._new_channels, self._buffer)
+        self._new_channels, self._buffer = [], []
+        try:
+            self._queue.put_nowait(chunk)
+            self._dropping = False
+        except queue.Full:
+            self.dropped_chunks += 1
+            # the channels must not get lost, they are written with the next chunk
+            self._new_channels = chunk[0]
+            if not self._dropping:
+                self._dropping = True
+                logger.warning("Sample store %s is falling behind, dropping samples", self.path)
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Commits all pending samples and stops the background thread, waiting at most timeout seconds"""
+        self.flush()
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Sample store %s did not catch up, discarding pending samples", self.path)
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        connection = connect(self.path)
+        channels: list[Channel] = []
+        samples: list[tuple[int, float, float]] = []
+        next_commit = time.monotonic() + self.commit_interval
+        next_maintenance = time.monotonic()
+        # earliest sample committed since the last maintenance, it might belong to a minute that was rolled up
+        committed_since: Optional[float] = None
+        try:
+            while True:
+                try:
+                    chunk = self._queue.get(timeout=max(next_commit - time.monotonic(), 0))
+                except queue.Empty:
+                    chunk = ()
+                if chunk is None:
+                    break
+                if chunk:
+                    channels += chunk[0]
+                    samples += chunk[1]
+                if time.monotonic() < next_commit:
+                    continue
+                next_commit = time.monotonic() + self.commit_interval
+                try:
+                    first = self._commit(connection, channels, samples)
+                    if first is not None and (committed_since is None or first < committed_since):
+                        committed_since = first
+                    if time.monotonic() >= next_maintenance:
+                        next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+                        self._maintain(connection, committed_since)
+                        committed_since = None
+                except sqlite3.Error as e:
+                    logger.error("Unable to write samples to %s: %s", self.path, e)
+                channels, samples = [], []
+            self._commit(connection, channels, samples)
+        except sqlite3.Error as e:
+            logger.error("Unable to write samples to %s: %s", self.path, e)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _commit(connection: sqlite3.Connection, channels: list[Channel],
+                samples: list[tuple[int, float, float]]) -> Optional[float]:
+        """Returns the time of the earliest committed sample"""
+        if not channels and not samples:
+            return None
+        with connection:
+            connection.executemany('INSERT OR IGNORE INTO channels (id, kind, name, label) VALUES (?, ?, ?, ?)',
+                                   channels)
+            connection.executemany('INSERT INTO samples (channel, time, value) VALUES (?, ?, ?)', samples)
+        return min((sample_time for _, sample_time, _ in samples), default=None)
+
+    def _maintain(self, connection: sqlite3.Connection, committed_since: Optional[float] = None) -> None:
+        """Rolls up complete minutes and hours and removes data that is beyond its retention.
+
+           Minutes (and their hours) from committed_since on are rolled up again, so that samples
+           that were committed late still end up in their rollups."""
+        started = time.perf_counter()
+        # samples of the last seconds might still be on their way
+        now = time.time() - 2 * self.commit_interval
+        minute_end = int(now // 60 * 60)
+        hour_end = int(now // 3600 * 3600)
+        # the raw samples of older minutes might already be partially removed
+        first_complete_minute = int(-((self.retention[RAW] * 86400 - now) // 60) * 60)
+        with connection:
+            minute_start = self._roll_up_start(connection, 'minutes', 60, 'SELECT min(time) FROM samples')
+            if committed_since is not None:
+                late_minute = max(int(committed_since // 60 * 60), first_complete_minute)
+                if minute_start is None or late_minute < minute_start:
+                    minute_start = late_minute
+            if minute_start is not None and minute_start < minute_end:
+                connection.execute(ROLL_UP_MINUTES, (minute_start, minute_end))
+            hour_start = self._roll_up_start(connection, 'hours', 3600, 'SELECT min(time) FROM minutes')
+            if hour_start is not None and minute_start is not None:
+                hour_start = min(hour_start, minute_start // 3600 * 3600)
+            if hour_start is not None and hour_start < hour_end:
+                connection.execute(ROLL_UP_HOURS, (hour_start, hour_end))
+            for resolution, (table, _) in TABLES.items():
+                connection.execute(f'DELETE FROM {table} WHERE time < ?',
+                                   (now - self.retention[resolution] * 86400,))
+        logger.debug("Maintained sample store %s in %.1fms", self.path, (time.perf_counter() - started) * 1000)
+
+    @staticmethod
+    def _roll_up_start(connection: sqlite3.Connection, table: str, length: int, first_source_query: str):
+        """Start of the first bucket that was not rolled up yet"""
+        last, = connection.execute(f'SELECT max(time) FROM {table}').fetchone()
+        if last is not None:
+            return last + length
+        first, = connection.execute(first_source_query).fetchone()
+        return int(first // length * length) if first is not None else None
+
+
+class SampleStoreReader:
+    """Queries a database written by SampleStore, times are seconds since the epoch"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.connection = connect(path, read_only=True)
+        self.channels = [Channel(*row) for row in self.connection.execute('SELECT id, kind, name, label FROM channels')]
+        self._channel_ids = {(c.kind, c.name, c.label): c.id for c in self.channels}
+
+    def __enter__(self) -> SampleStoreReader:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def channel_id(self, kind: str, name: str, label: Optional[str] = None) -> Optional[int]:
+        return self._channel_ids.get((kind, name, label))
+
+    @staticmethod
+    def resolution_for(start: float, end: float) -> str:
+        """Coarsest resolution that still has a few hundred points in the given time range"""
+        span = end - start
+        if span <= 6 * 3600:
+            return RAW
+        if span <= 14 * 86400:
+            return MINUTE
+        return HOUR
+
+    def series(self, kind: str, name: str, label: Optional[str] = None, start: float = 0,
+               end: float = float('inf'), resolution: str = RAW) -> Series:
+        """Samples of a channel, the means for rollups"""
+        if resolution == RAW:
+            rows = self._query('time, value', kind, name, label, start, end, resolution)
+            return Series([t for t, _ in rows], [v for _, v in rows])
+        rollups = self.rollups(kind, name, label, start, end, resolution)
+        return Series(rollups.times, rollups.means)
+
+    def rollups(self, kind: str, name: str, label: Optional[str] = None, start: float = 0,
+                end: float = float('inf'), resolution: str = MINUTE) -> Rollups:
+        if resolution == RAW:
+            series = self.series(kind, name, label, start, end)
+            return Rollups(series.times, series.values, series.values, series.values)
+        rows = self._query('time, min, mean, max', kind, name, label, start, end, resolution)
+        return Rollups([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows])
+
+    def _query(self, columns: str, kind: str, name: str, label: Optional[str], start: float, end: float,
+               resolution: str) -> list[tuple]:
+        channel_id = self.channel_id(kind, name, label)
+        if channel_id is None:
+            return []
+        table, _ = TABLES[resolution]
+        return self.connection.execute(
+            f'SELECT {columns} FROM {table} WHERE channel = ? AND time >= ? AND time < ? ORDER BY time',
+            (channel_id, start, end)).fetchall()
+
+    def load_series(self, kinds: Optional[Collection[str]] = None, start: float = 0, end: float = float('inf'),
+                    resolution: str = RAW) -> dict[SeriesKey, Series]:
+        """Same as trace.reader.load_series, for the replay and tuning tools"""
+        return {
+            (c.kind, c.name, c.label): self.series(c.kind, c.name, c.label, start, end, resolution)
+            for c in self.channels if kinds is None or c.kind in kinds
+        }
+
+
+def load_store_series(path: str, kinds: Optional[Iterable[str]] = None, last: Optional[float] = None,
+                      resolution: str = RAW) -> dict[SeriesKey, Series]:
+    """Loads the samples of the last seconds (or all samples) of a store"""
+    start = time.time() - last if last is not None else 0
+    with SampleStoreReader(path) as reader:
+        return reader.load_series(set(kinds) if kinds is not None else None, start=start, resolution=resolution)
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional, BinaryIO
+
+from . import Channel, RECORD, encode_header
+from .. import VERSION
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['TraceWriter']
+
+# leave room for channels that show up later (e.g. fans that are discovered on the first update)
+MIN_HEADER_SIZE = 64 * 1024
+
+
+class TraceWriter:
+    """Appends trace records to a file.
+
+       Records are collected in memory and handed to a background thread on flush(), so
+       writing never blocks the caller. If the thread falls behind, whole chunks are dropped
+       instead of buffering without bounds.
+
+       The file is rotated once it grows beyond max_bytes (or the channels don't fit into its
+       header anymore), keeping up to backup_count (at least 1) older files as <path>.1,
+       <path>.2, ... A trace is never overwritten, only the oldest backup is dropped.
+
+       Timestamps are expected to come from the monotonic clock, pass clock_offset if they
+       are based on a different clock (e.g. the virtual clock of a replay)."""
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, backup_count: int = 5,
+                 max_pending_chunks: int = 256, clock_offset: Optional[float] = None) -> None:
+        if backup_count < 1:
+            raise ValueError(f"backup_count must be at least 1, got {backup_count}")
+        self.path = path
+        self.clock_offset = clock_offset
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped_chunks = 0
+        self._dropping = False
+
+        self._channels: list[Channel] = []
+        self._channel_ids: dict[tuple[str, str, Optional[str]], int] = {}
+        self._buffer = bytearray()
+        self._queue: queue.Queue[Optional[bytes]] = queue.Queue(maxsize=max_pending_chunks)
+
+        self._file: Optional[BinaryIO] = None
+        self._meta: dict = {}
+        self._header_size = 0
+        self._header_channels = 0
+        self._size = 0
+
+        self._thread = threading.Thread(target=self._run, name=f"Trace writer {path}", daemon=True)
+        self._thread.start()
+
+    def channel(self, kind: str, name: str, label: Optional[str] = None) -> int:
+        """Returns the id of the given channel, registering it if necessary"""
+        key = (kind, name, label)
+        channel_id = self._channel_ids.get(key)
+        if channel_id is None:
+            channel_id = len(self._channels)
+            # append before publishing the id, the writer thread only ever looks at the list
+            self._channels.append(Channel(channel_id, kind, name, label))
+            self._channel_ids[key] = channel_id
+        return channel_id
+
+    def write(self, timestamp: float, channel_id: int, value: float) -> None:
+        self._buffer += RECORD.pack(timestamp, channel_id, value)
+
+    def flush(self) -> None:
+        """Hands all records written so far to the writer thread"""
+        if not self._buffer:
+            return
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        try:
+            self._queue.put_nowait(chunk)
+            self._dropping = False
+        except queue.Full:
+            self.dropped_chunks += 1
+            if not self._dropping:
+                self._dropping = True
+                logger.warning("Trace writer for %s is falling behind, dropping records", self.path)
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Writes all pending records and stops the writer thread, waiting at most timeout seconds"""
+        self.flush()
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Trace writer for %s did not catch up, discarding pending records", self.path)
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    break
+                try:
+                    self._write_chunk(chunk)
+                except OSError as e:
+                    logger.error("Unable to write trace to %s: %s", self.path, e)
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def _write_chunk(self, chunk: bytes) -> None:
+        if self._file is None:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                # never overwrite the trace of an earlier run
+                self._shift_backups()
+            self._open()
+        elif self._size >= self.max_bytes:
+            self._rotate()
+        if self._header_channels != len(self._channels):
+            self._write_header()
+        self._file.seek(self._size)
+        self._file.write(chunk)
+        self._file.flush()
+        self._size += len(chunk)
+
+    def _open(self) -> None:
+        channels = self._channels[:]
+        meta = {
+            'spinpid_version': VERSION,
+            'created': time.time(),
+            'clock_offset': self.clock_offset if self.clock_offset is not None else time.time() - time.monotonic(),
+        }
+        self._meta = meta
+        # leave at least as much room for new channels as the existing ones take up
+        needed_size, _ = encode_header(channels, meta)
+        header_size, header = encode_header(channels, meta, min_size=max(MIN_HEADER_SIZE, 2 * needed_size))
+        self._file = open(self.path, 'w+b')
+        self._file.write(header)
+        self._file.truncate(header_size)
+        self._file.flush()
+        self._header_size = self._size = header_size
+        self._header_channels = len(channels)
+
+    def _write_header(self) -> None:
+        channels = self._channels[:]
+        header_size, header = encode_header(channels, self._meta, min_size=self._header_size)
+        if header_size != self._header_size:
+            # channels don't fit into this file anymore, start a new one with a bigger header
+            self._rotate()
+            return
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.flush()
+        self._header_channels = len(channels)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        self._shift_backups()
+        self._open()
+
+    def _shift_backups(self) -> None:
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
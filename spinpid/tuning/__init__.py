@@ -0,0 +1,165 @@
+"""Offline tuning of fan algorithms against a thermal plant fitted to a recorded trace.
+
+The plant is a first order model of a single sensor,
+
+    dT/dt = d(t) + a * T + b * duty
+
+where a and b are fitted by least squares and d(t) is the disturbance (the heat load)
+that explains the rest of the recorded temperature changes. Simulating a candidate
+algorithm replays the recorded disturbance, but lets the temperature react to the duty
+the candidate chooses.
+
+Requires NumPy."""
+from __future__ import annotations
+
+import asyncio
+from typing import NamedTuple, Optional, Sequence, Mapping
+
+from ..controller.algorithm import AlgorithmContext
+from ..controller.algorithm.parser import AlgorithmParser
+from ..controller.values import LastKnownValues
+from ..trace import SENSOR, DUTY
+from ..trace.reader import Series, SeriesKey, resample
+from ..util import clamp
+from ..util.asyncio import VirtualTimeEventLoop
+
+__all__ = ['Plant', 'Simulation', 'Score', 'fit_plant', 'pareto_front']
+
+
+class Plant(NamedTuple):
+    """Fitted thermal model of a sensor, see module documentation"""
+    a: float
+    b: float
+    times: list[float]
+    disturbance: list[float]
+
+    def __str__(self):
+        return f"dT/dt = d(t) {self.a:+.5f} * T {self.b:+.5f} * duty"
+
+
+class Score(NamedTuple):
+    # highest temperature above the target (°C)
+    overshoot: float
+    # longest time the temperature stayed above target + tolerance (s)
+    settling_time: float
+    # mean duty over the simulated time (%)
+    mean_duty: float
+    # number of times the duty changed
+    duty_changes: int
+
+    def dominates(self, other: Score) -> bool:
+        return all(a <= b for a, b in zip(self, other)) and any(a < b for a, b in zip(self, other))
+
+
+def fit_plant(series: Mapping[SeriesKey, Series], sensor: str, fan: str) -> Plant:
+    import numpy
+    temperatures = series.get((SENSOR, sensor, None))
+    duties = series.get((DUTY, fan, None))
+    if temperatures is None or len(temperatures.times) < 3:
+        raise ValueError(f"Not enough recorded values for sensor {sensor}")
+    if duties is None or not duties.times:
+        raise ValueError(f"No recorded duties for fan {fan}")
+
+    times = numpy.asarray(temperatures.times)
+    temps = numpy.asarray(temperatures.values, dtype=float)
+    duty = resample(duties, times)
+
+    dt = numpy.diff(times)
+    valid = dt > 0
+    slope = numpy.diff(temps)[valid] / dt[valid]
+    inputs = numpy.column_stack((numpy.ones(valid.sum()), temps[:-1][valid], duty[:-1][valid]))
+    (_, a, b), *_ = numpy.linalg.lstsq(inputs, slope, rcond=None)
+
+    # whatever the model can't explain is attributed to the heat load
+    disturbance = numpy.zeros(len(times))
+    disturbance[:-1] = numpy.where(valid, numpy.diff(temps) / numpy.where(valid, dt, 1), 0) \
+        - a * temps[:-1] - b * duty[:-1]
+    return Plant(float(a), float(b), times.tolist(), disturbance.tolist())
+
+
+class Simulation:
+    """Everything needed to evaluate candidates, picklable to be sent to worker processes"""
+
+    def __init__(self, plant: Plant, series: Mapping[SeriesKey, Series], sensor: str, fan: str,
+                 target: float, tolerance: float = 1.0, min_duty: int = 15, max_duty: int = 100) -> None:
+        self.plant = plant
+        self.sensor = sensor
+        self.fan = fan
+        self.target = target
+        self.tolerance = tolerance
+        self.min_duty = min_duty
+        self.max_duty = max_duty
+        self.initial_temperature = series[(SENSOR, sensor, None)].values[0]
+        # other sensors and fans are played back as recorded
+        self.recorded: dict[SeriesKey, list[float]] = {
+            key: resample(values, plant.times).tolist()
+            for key, values in series.items()
+            if key[0] in (SENSOR, DUTY) and key[2] is None and key != (SENSOR, sensor, None) and values.times
+        }
+
+    def evaluate(self, algorithm: str, parser: AlgorithmParser) -> Score:
+        loop = VirtualTimeEventLoop(start_time=self.plant.times[0])
+        try:
+            return loop.run_until_complete(self._simulate(algorithm, parser))
+        finally:
+            loop.close()
+
+    async def _simulate(self, algorithm: str, parser: AlgorithmParser) -> Score:
+        sensor_names = {self.sensor} | {name for kind, name, _ in self.recorded if kind == SENSOR}
+        fan_names = {self.fan} | {name for kind, name, _ in self.recorded if kind == DUTY}
+        last_known_values = LastKnownValues(sensor_names, fan_names)
+        context = AlgorithmContext(min_duty=self.min_duty, max_duty=self.max_duty)
+        expression = parser.parse(algorithm, context, last_known_values, filename='<candidate>')
+
+        plant = self.plant
+        times, disturbance = plant.times, plant.disturbance
+        threshold = self.target + self.tolerance
+        temperature = self.initial_temperature
+        overshoot, longest_excursion, excursion_start = 0.0, 0.0, None
+        duty_sum, duty_changes, last_duty = 0.0, 0, None
+
+        for i, now in enumerate(times):
+            await asyncio.sleep(now - asyncio.get_running_loop().time())
+            for (kind, name, _), values in self.recorded.items():
+                if kind == SENSOR:
+                    last_known_values.set_sensor_temperature(name, values[i])
+                elif name != self.fan:
+                    last_known_values.set_fan_duty(name, values[i])
+            last_known_values.set_sensor_temperature(self.sensor, temperature)
+
+            duty = clamp(expression.value(), self.min_duty, self.max_duty)
+            context.last_duty = duty
+            last_known_values.set_fan_duty(self.fan, duty)
+            if last_duty is not None and duty != last_duty:
+                duty_changes += 1
+            last_duty = duty
+
+            overshoot = max(overshoot, temperature - self.target)
+            if temperature > threshold:
+                if excursion_start is None:
+                    excursion_start = now
+                longest_excursion = max(longest_excursion, now - excursion_start)
+            else:
+                excursion_start = None
+
+            if i + 1 < len(times):
+                dt = times[i + 1] - now
+                duty_sum += duty * dt
+                temperature += dt * (disturbance[i] + plant.a * temperature + plant.b * duty)
+
+        span = times[-1] - times[0]
+        return Score(
+            overshoot=round(overshoot, 2),
+            settling_time=round(longest_excursion, 1),
+            mean_duty=round(duty_sum / span if span > 0 else last_duty, 2),
+            duty_changes=duty_changes,
+        )
+
+
+def pareto_front(results: Sequence[tuple[str, Optional[Score]]]) -> list[tuple[str, Score]]:
+    """Returns all candidates whose score is not dominated by any other candidate"""
+    scored = [(candidate, score) for candidate, score in results if score is not None]
+    return [
+        (candidate, score) for candidate, score in scored
+        if not any(other.dominates(score) for _, other in scored)
+    ]
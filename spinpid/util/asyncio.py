@@ -1,4 +1,7 @@
 import asyncio
+import math
+import selectors
+import time
 from typing import Iterable
 
 
@@ -12,3 +15,69 @@ def raise_exceptions(tasks: Iterable[asyncio.Task], logger) -> None:
                 exception_raised = True
     if exception_raised:
         raise Exception("Error while running tasks")
+
+
+def loop_time() -> float:
+    """Returns the time of the running event loop (or the monotonic clock if there is none).
+
+       Everything that measures time should use this, so that it follows the virtual clock
+       of a VirtualTimeEventLoop."""
+    try:
+        return asyncio.get_running_loop().time()
+    except RuntimeError:
+        return time.monotonic()
+
+
+class _VirtualTimeSelector(selectors.BaseSelector):
+    """Selector that advances the virtual clock of its loop instead of waiting for timeouts"""
+
+    def __init__(self, loop: 'VirtualTimeEventLoop') -> None:
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self) -> None:
+        self._selector.close()
+
+    def select(self, timeout=None):
+        if timeout == 0:
+            # there are callbacks ready to run, don't bother polling for I/O on every iteration
+            return []
+        events = self._selector.select(0)
+        if events:
+            return events
+        if timeout is None:
+            # nothing scheduled at all, only real I/O can wake us up
+            return self._selector.select(None)
+        self._loop.advance(timeout)
+        return events
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop that runs on a virtual clock.
+
+       Whenever the loop would wait for the next timer, the clock jumps forward instead,
+       so sleeps return immediately while still being observed in the right order."""
+
+    def __init__(self, start_time: float = 0.0) -> None:
+        self._virtual_time = start_time
+        super().__init__(selector=_VirtualTimeSelector(self))
+
+    def time(self) -> float:
+        return self._virtual_time
+
+    def advance(self, seconds: float) -> None:
+        # Step just past the target: timers are only run if they are due before time() plus
+        # the clock resolution, which is below the float precision of large timestamps.
+        self._virtual_time = math.nextafter(self._virtual_time + seconds, math.inf)
@@ -1,4 +1,5 @@
 import asyncio
+import os
 import signal
 import subprocess
 
@@ -33,12 +34,23 @@ async def run(*args, **kwargs):
     return cp
 
 class Command:
+    # set by SpanRecorder.attach() to record how long every command takes
+    span_recorder = None
+
     def __init__(self, command):
         self.command = command
+        self.name = os.path.basename(command)
 
     async def run(self, *args: str) -> None:
-        await run(self.command, *args)
+        if self.span_recorder is None:
+            await run(self.command, *args)
+        else:
+            await self.span_recorder.command_stats(self.name).measure(run(self.command, *args))
 
     async def run_and_read(self, *args: str) -> str:
-        result = await run(self.command, *args, encoding='utf-8')
+        if self.span_recorder is None:
+            result = await run(self.command, *args, encoding='utf-8')
+        else:
+            result = await self.span_recorder.command_stats(self.name).measure(
+                run(self.command, *args, encoding='utf-8'))
         return result.stdout
@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+__all__ = ['write_atomic']
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Writes data to a temporary file and renames it over path, readers never see a partial file.
+
+       Every call has its own temporary file, so concurrent writers never mix their data."""
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix='.tmp', dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
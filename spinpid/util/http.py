@@ -0,0 +1,141 @@
+"""Minimal HTTP/1.1 server on asyncio, just enough to serve a few read-only endpoints and event streams"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable, Awaitable, NamedTuple, Optional, AsyncGenerator
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['HttpServer', 'Handler', 'Request', 'Response', 'parse_address']
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+# seconds a connection may stay idle before its next request
+IDLE_TIMEOUT = 60.0
+# seconds a client has to send the headers once the request line arrived
+HEADER_TIMEOUT = 10.0
+MAX_HEADERS = 100
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: dict[str, list[str]]
+    headers: dict[str, str]
+
+
+class Response(NamedTuple):
+    status: int = 200
+    body: bytes = b''
+    content_type: str = 'text/plain; charset=utf-8'
+    # written chunk by chunk instead of the body, the connection is closed afterwards
+    stream: Optional[AsyncGenerator[bytes, None]] = None
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+def parse_address(address: str, default_host: str = '127.0.0.1') -> tuple[str, int]:
+    """Parses [HOST:]PORT, only local clients can connect unless HOST is given"""
+    host, sep, port = address.rpartition(':')
+    return (host.strip('[]') if sep and host else default_host), int(port)
+
+
+class HttpServer:
+    def __init__(self, routes: dict[str, Handler]) -> None:
+        self.routes = routes
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str, port: int) -> None:
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info("Listening on http://%s:%d", host, port)
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        """Reads the next request, raises TimeoutError if the client keeps the connection without sending one"""
+        request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = await asyncio.wait_for(self._read_headers(reader), HEADER_TIMEOUT)
+        url = urlsplit(target)
+        return Request(method, url.path, parse_qs(url.query), headers)
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+        headers = {}
+        for _ in range(MAX_HEADERS + 1):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        raise ValueError(f"More than {MAX_HEADERS} headers")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError:
+                    await self._write_response(writer, Response(400, b'Bad Request\n'), keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                response = await self._dispatch(request)
+                if response.stream is not None:
+                    await self._write_stream(writer, response)
+                    break
+                await self._write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        except asyncio.CancelledError:
+            # nothing awaits the connection's task, re-raising would only make asyncio log it as an error
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get(request.path)
+        if handler is None:
+            return Response(404, b'Not Found\n')
+        if request.method != 'GET':
+            return Response(405, b'Method Not Allowed\n')
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.warning("Exception while handling %s %s: %s", request.method, request.path, e, exc_info=True)
+            return Response(500, b'Internal Server Error\n')
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        head = (f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+                f"Content-Type: {response.content_type}\r\n"
+                f"Content-Length: {len(response.body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + response.body)
+        await writer.drain()
+
+    @staticmethod
+    async def _write_stream(writer: asyncio.StreamWriter, response: Response) -> None:
+        head = (f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+                f"Content-Type: {response.content_type}\r\n"
+                f"Cache-Control: no-cache\r\n"
+                f"Connection: close\r\n\r\n")
+        writer.write(head.encode('latin-1'))
+        try:
+            async for chunk in response.stream:
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            await response.stream.aclose()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from typing import Callable, Generic, TypeVar, Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['BackgroundSink']
+
+T = TypeVar('T')
+
+_STOP = object()
+
+
+class BackgroundSink(Generic[T]):
+    """Hands items to a consumer that runs in a background thread.
+
+       Submitting never blocks the caller: if the consumer falls behind (e.g. writing to a
+       slow pipe or a full disk), new items are dropped once max_pending items are queued."""
+
+    def __init__(self, consume: Callable[[T], None], name: str, max_pending: int = 4) -> None:
+        self.consume = consume
+        self.name = name
+        self.dropped = 0
+        self._dropping = False
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> bool:
+        try:
+            self._queue.put_nowait(item)
+            self._dropping = False
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if not self._dropping:
+                self._dropping = True
+                logger.warning("%s is falling behind, dropping output", self.name)
+            return False
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Lets the consumer finish the pending items, waiting at most timeout seconds"""
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("%s did not catch up, discarding pending output", self.name)
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            try:
+                self.consume(item)
+            except Exception as e:
+                logger.error("%s failed: %s", self.name, e, exc_info=True)
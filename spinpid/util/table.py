@@ -1,5 +1,4 @@
-from typing import List, Optional, Union, TypeVar, Generic, Tuple, Iterator, Iterable, ClassVar, Any
-from math import ceil
+from typing import List, Optional, Union, TypeVar, Generic, Tuple, Iterator, Iterable, ClassVar
 import sys
 
 try:
@@ -80,6 +79,12 @@ class BaseTableParent(BaseTableElement, Generic[T]):
     def __iter__(self) -> Iterator[T]:
         return iter(self._columns)
 
+    def truncate(self, length: int) -> None:
+        """Removes all children after the first length"""
+        if len(self._columns) > length:
+            del self._columns[length:]
+            self._trigger_recalculate_width()
+
     def _create_child(self) -> T:
         raise NotImplementedError
 
@@ -95,6 +100,8 @@ class LabelledTableElement(BaseTableElement):
 
     @label.setter
     def label(self, value: str) -> None:
+        if value == self._label:
+            return
         if len(self._label) != len(value):
             self._trigger_recalculate_width()
         elif self._label != value:
@@ -113,7 +120,7 @@ class Value:
         self.value = value
         self.stale = stale
 
-    def format(self, width: int) -> str:
+    def format(self, width: int = 0) -> str:
         value = self.value if self.value is not None else 'N/A'
         if isinstance(value, float):
             return f"{value:#{width}.2f}"
@@ -131,6 +138,7 @@ class Column(BaseChildElement, LabelledTableElement):
         self.expected_width = 0
         self._label = ""
         self._value = Value.NONE
+        self._text = ""
         self._max_encountered_width = 0
 
     @property
@@ -139,16 +147,18 @@ class Column(BaseChildElement, LabelledTableElement):
 
     @value.setter
     def value(self, value: Value) -> None:
+        # formatted once without padding, the padding is added when printing
+        text = value.format()
         self._value = value
-        value_len = len(value.format(self.width))
-        if value_len > self._max_encountered_width:
-            self._max_encountered_width = value_len
+        self._text = text
+        if len(text) > self._max_encountered_width:
+            self._max_encountered_width = len(text)
             self._trigger_recalculate_width()
 
-    def pop_value(self) -> str:
-        value = self._value
-        self._value = Value.NONE
-        formatted_value = value.format(self.width)
+    def pop_value(self, width: int) -> str:
+        value, text = self._value, self._text
+        self._value, self._text = Value.NONE, ""
+        formatted_value = text.rjust(width)
         if have_ansi:
             formatted_value = ansi_wrap(formatted_value, color='white', bright=True) if not value.stale else formatted_value
             return f" {formatted_value} "
@@ -156,46 +166,52 @@ class Column(BaseChildElement, LabelledTableElement):
             return f" {formatted_value} " if not value.stale else f"({formatted_value})"
 
     def _calculate_width(self) -> int:
-        lenlabel = len(self.label)
-        width = max(self.expected_width, self._max_encountered_width, lenlabel)
-        # if lenlabel % 2 == 1 and width % 2 == 0:
-        #    width += 1
-        return width
+        return max(self.expected_width, self._max_encountered_width, len(self.label))
 
 
 class ColumnGroup(BaseChildElement, LabelledTableElement, BaseTableParent[Column]):
+    _column_widths: List[int]
+
     def __init__(self, parent: BaseTableParent) -> None:
         super().__init__(parent)
+        self._column_widths = []
 
     def _create_child(self) -> Column:
         return Column(self)
 
+    @property
+    def column_widths(self) -> List[int]:
+        """Widths of the columns, including the padding needed to fit the group's label"""
+        self.width  # make sure the layout is calculated
+        return self._column_widths
+
     def _calculate_width(self) -> int:
         separator_width = 1
         column_padding = 2  # left and right
-        num_cols = len(self._columns)
-        cols_width = (
-                sum(c.width for c in self._columns)
-                + (num_cols - 1) * (column_padding + separator_width)  # outer padding does not count
-        )
+        widths = [c.width for c in self._columns]
+        num_cols = len(widths)
+        cols_width = sum(widths) + (num_cols - 1) * (column_padding + separator_width)  # outer padding does not count
         header_width = len(self.label)
-        width = cols_width
-        if header_width > cols_width:
-            extra_padding = int(ceil((header_width - cols_width) / num_cols))
-            width = header_width + (extra_padding % num_cols)
-            for column in self._columns:
-                column._width = column.width + extra_padding
-        return width
+        if num_cols and header_width > cols_width:
+            # distribute the missing width over the columns, without changing the columns themselves
+            extra, remainder = divmod(header_width - cols_width, num_cols)
+            widths = [width + extra + (1 if i < remainder else 0) for i, width in enumerate(widths)]
+            cols_width = header_width
+        self._column_widths = widths
+        return cols_width
+
 
 LabelledValue = Tuple[str, Value]
 LabelledValueGroup = Tuple[str, Iterable[LabelledValue]]
 
+
 class TablePrinter(BaseTableParent[ColumnGroup]):
     def __init__(self, out=sys.stdout, redraw_header_after=None):
         super().__init__()
         self._out = out
         self._needs_redraw_header_in = 0
-        self._header = None
+        self._header: Optional[List[str]] = None
+        self._pending_lines: List[str] = []
         self.redraw_header_after = redraw_header_after
 
     def _create_child(self) -> ColumnGroup:
@@ -207,39 +223,64 @@ class TablePrinter(BaseTableParent[ColumnGroup]):
 
     def _trigger_redraw_header(self) -> None:
         self._needs_redraw_header_in = 0
+        self._header = None
 
     def _calculate_width(self):
         return sum(group.width for group in self) + 1
 
+    def _render_header(self) -> List[str]:
+        groups = [(group, group.column_widths) for group in self]
+        return [
+            '┏━' + '━┳━'.join('━' * group.width for group, _ in groups) + '━┓',
+            '┃ ' + ' ┃ '.join(group.label.center(group.width) for group, _ in groups) + ' ┃',
+            '┣━' + '━╋━'.join('━┯━'.join('━' * width for width in widths) for _, widths in groups) + '━┫',
+            '┃ ' + ' ┃ '.join(' │ '.join(column.label.center(width) for column, width in zip(group, widths))
+                             for group, widths in groups) + ' ┃',
+            '┡━' + '━╇━'.join('━┿━'.join('━' * width for width in widths) for _, widths in groups) + '━┩',
+        ]
+
     def _print_header(self) -> None:
-        width = self.width  # make sure width is calculated
-        self._print('┏━' + '━┳━'.join('━' * group.width for group in self) + '━┓')
-        self._print('┃ ' + ' ┃ '.join(group.centered_label for group in self) + ' ┃')
-        self._print('┣━' + '━╋━'.join('━┯━'.join('━' * column.width for column in group) for group in self) + '━┫')
-        self._print('┃ ' + ' ┃ '.join(' │ '.join(column.centered_label for column in group) for group in self) + ' ┃')
-        self._print('┡━' + '━╇━'.join('━┿━'.join('━' * column.width for column in group) for group in self) + '━┩')
+        if self._header is None:
+            self._header = self._render_header()
+        self._pending_lines.extend(self._header)
 
     def _print_values(self) -> None:
-        self._print('│' + '│'.join('┊'.join(column.pop_value() for column in group) for group in self) + '│')
+        self._print('│' + '│'.join('┊'.join(column.pop_value(width) for column, width in zip(group, group.column_widths))
+                                   for group in self) + '│')
+
+    def _print(self, s: str) -> None:
+        self._pending_lines.append(s)
 
-    def _print(self, s: str, **kwargs: Any) -> None:
-        print(s, file=self._out, **kwargs)
+    def _flush(self) -> None:
+        """Writes all lines of a row (including its header) at once"""
+        self._out.write(''.join(line + '\n' for line in self._pending_lines))
+        self._pending_lines.clear()
         self._out.flush()
 
     def print_values(self, values: Iterable[LabelledValueGroup]) -> None:
+        """Prints a row, the layout and the header are only recalculated when a label or a maximum width changes"""
+        group_count = 0
         for i, (group_label, group_values) in enumerate(values):
             group = self[i]
             group.label = group_label
+            columns = group._columns
+            column_count = 0
             for j, (col_label, col_value) in enumerate(group_values):
-                col = group[j]
+                col = columns[j] if j < len(columns) else group[j]
                 col.label = col_label
                 col.value = col_value
+                column_count = j + 1
+            # groups and columns that are gone, e.g. after a configuration reload
+            group.truncate(column_count)
+            group_count = i + 1
+        self.truncate(group_count)
         if self._needs_redraw_header_in == 0:
             self._needs_redraw_header_in = self.redraw_header_after
             self._print_header()
         elif self._needs_redraw_header_in is not None:
             self._needs_redraw_header_in -= 1
         self._print_values()
+        self._flush()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+import asyncio
+import json
+from datetime import timedelta
+
+from spinpid.application.spinpid import algorithm_parser
+from spinpid.config import Config, SensorConfig, FanConfig
+from spinpid.controller.config import build_controller
+from spinpid.controller.telemetry import JsonLinesEncoder
+from spinpid.interfaces import SensorInterface, FanInterface, TemperatureSensor
+from spinpid.interfaces.fan import Fan, FanZone
+from spinpid.interfaces.sensor import Temperature
+
+
+class FakeSensor(TemperatureSensor):
+    async def get_temperature(self) -> Temperature:
+        return Temperature(40.0, 'CPU')
+
+
+class DiscoveringFanZone(FanZone):
+    """Only knows its fans after the first reading, like the IPMI fan zones"""
+
+    def __init__(self) -> None:
+        super().__init__(zone_name='zone')
+        self.fans = []
+
+    async def get_duty(self) -> int:
+        return 50
+
+    async def _do_set_duty(self, duty: int) -> None:
+        pass
+
+    async def update(self) -> None:
+        if not self.fans:
+            self.fans.append(Fan('FAN1'))
+        self.fans[0].rpm = 900
+
+
+class FakeInterface(SensorInterface, FanInterface):
+    def __init__(self) -> None:
+        super().__init__()
+        self.fan_zone = DiscoveringFanZone()
+
+    def get_sensor(self, channel: str, **kwargs) -> TemperatureSensor:
+        return FakeSensor()
+
+    def get_fan_zone(self, channel: str, **kwargs) -> FanZone:
+        return self.fan_zone
+
+
+def test_fans_discovered_after_construction():
+    config = Config(
+        interfaces={'fake': {'driver': 'tests.test_telemetry.FakeInterface'}},
+        sensors={'CPU': SensorConfig(interface={'id': 'fake', 'channel': 'cpu'}, interval=timedelta(seconds=1))},
+        fans={'CPU': FanConfig(interface={'id': 'fake', 'channel': 'zone'},
+                               algorithms={'linear': 'Linear(sensors.CPU, 30, 50)'})},
+    )
+
+    async def run() -> dict:
+        controller = build_controller(config, algorithm_parser, interfaces={'fake': FakeInterface()})
+        # constructed before the setup, like the application does
+        encoder = JsonLinesEncoder(controller)
+        await controller.setup()
+        await controller.update_fans()
+        return json.loads(encoder.encode(encoder.snapshot()))
+
+    line = asyncio.run(run())
+    assert line['fans']['CPU']['rpm'] == {'FAN1': 900}